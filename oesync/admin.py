@@ -1,11 +1,18 @@
 from django.contrib import admin
 from django.contrib import messages
-from oesync.models import ObjMapper, DeletedObjMapper
+from oesync.models import ObjMapper, DeletedObjMapper, PullWatermark, \
+    BackfillCheckpoint, SyncRun, SyncBatch
 from oesync.modelmapper import ModelMapper
 from oesync.signals import post_save_all
 from oesync.listeners import syncnow
+from oesync import profiling, history, retry
 from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count, Sum
+from django.utils import timezone
+from django.core.urlresolvers import reverse
 from django.utils.translation import ugettext_lazy as _
+from django.utils.html import escape
+from datetime import timedelta
 import re
 
 
@@ -30,41 +37,157 @@ for model_name in ModelMapper.access_inline:
 
 def _sync_selected(modeladmin, request, queryset):
     ''' Admin action to sync selected objects '''
-    if syncnow(queryset=queryset):
+    with history.recording('admin'):
+        res = syncnow(queryset=queryset)
+    if res:
         messages.info(request, _('%s objects were successfully synced.' % len(queryset)))
     else:
         messages.error(request, _('An error occured. Not all objects could be synced.'))
 _sync_selected.short_description = _('Synchronize selected objects')
 
 
+def _sync_selected_profiled(modeladmin, request, queryset):
+    ''' Admin action to sync selected objects and save a profile of the run '''
+    res, run = profiling.profile(syncnow, kwargs={'queryset': queryset},
+                                 trigger='admin')
+    if res:
+        messages.info(request, _('%s objects were successfully synced.' % len(queryset)))
+    else:
+        messages.error(request, _('An error occured. Not all objects could be synced.'))
+    messages.info(request, _('The profile was saved as sync run %s (%s).' % (
+        run.id, reverse('admin:oesync_syncrun_change', args=(run.id, )))))
+_sync_selected_profiled.short_description = _('Synchronize selected objects with profiling')
+
+
+def _reset_attempts(modeladmin, request, queryset):
+    ''' Admin action to let syncnow() retry objects that failed before right away '''
+    count = queryset.update(attempts=0, last_error='', next_attempt=None)
+    messages.info(request, _('The failed attempts of %s objects were reset.' % count))
+_reset_attempts.short_description = _('Reset failed attempts of selected objects')
+
+
 class ObjMapperAdmin(admin.ModelAdmin):
-    list_display = ('object','content_type', 'object_id', 'parent', 'oerp_model', 'oerp_id', 'is_dirty')
+    list_display = ('object','content_type', 'object_id', 'parent', 'oerp_model', 'oerp_id', 'is_dirty',
+                    'attempts', 'next_attempt')
     list_display_links = ('object', 'content_type')
-    list_filter = ('content_type', )
-    actions = ['sync_selected']
+    list_filter = ('content_type', 'is_dirty')
+    actions = ['sync_selected', 'sync_selected_profiled', 'reset_attempts']
     search_fields = ['content_type', 'oerp_model']
     ordering = ['-is_dirty']
     #if config_value('LANGUAGE','SHOW_TRANSLATIONS'):
     #filter_vertical = ('content_type',)
     sync_selected = _sync_selected
+    sync_selected_profiled = _sync_selected_profiled
+    reset_attempts = _reset_attempts
 
 admin.site.register(ObjMapper, ObjMapperAdmin)
 
 
 
 class DeletedObjMapperAdmin(admin.ModelAdmin):
-    list_display = ('content_type', 'parent', 'oerp_model', 'oerp_id', 'is_dirty')
+    list_display = ('content_type', 'parent', 'oerp_model', 'oerp_id', 'is_dirty',
+                    'attempts', 'next_attempt')
     list_display_links = ('oerp_model', 'oerp_id')
-    list_filter = ('content_type', )
-    actions = ['sync_selected']
+    list_filter = ('content_type', 'is_dirty')
+    actions = ['sync_selected', 'reset_attempts']
     ordering = ['-is_dirty']
     search_fields = ['content_type', 'oerp_model']
     sync_selected = _sync_selected
+    reset_attempts = _reset_attempts
 
 admin.site.register(DeletedObjMapper, DeletedObjMapperAdmin)
 
 
 
+class PullWatermarkAdmin(admin.ModelAdmin):
+    list_display = ('oerp_model', 'write_date', 'last_id', 'date_modified')
+
+admin.site.register(PullWatermark, PullWatermarkAdmin)
+
+
+
+class BackfillCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('content_type', 'last_id', 'done', 'failed', 'finished',
+                    'date_modified')
+
+admin.site.register(BackfillCheckpoint, BackfillCheckpointAdmin)
+
+
+
+class SyncBatchInline(admin.TabularInline):
+    model = SyncBatch
+    fields = ('content_type', 'action', 'batches', 'object_count', 'failed', 'seconds')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+
+
+class SyncRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'started', 'seconds', 'trigger', 'result', 'object_count',
+                    'failed', 'objects_per_second', 'rpc_calls', 'rpc_errors',
+                    'profile_file')
+    list_filter = ('result', 'trigger')
+    date_hierarchy = 'started'
+    fields = ('started', 'finished', 'seconds', 'result', 'trigger', 'object_count',
+              'failed', 'rpc_calls', 'rpc_errors', 'rpc_seconds', 'profile_file',
+              'breakdown')
+    readonly_fields = fields
+    inlines = [SyncBatchInline]
+    #number of days of the throughput table
+    dashboard_days = 14
+
+    def breakdown(self, run):
+        return '<pre>%s</pre>' % escape(profiling.report(run))
+    breakdown.allow_tags = True
+    breakdown.short_description = _('Profile')
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        extra_context.update({
+            'throughput': self.get_throughput(),
+            'backlog': self.get_backlog(),
+        })
+        return super(SyncRunAdmin, self).changelist_view(request, extra_context)
+
+    def get_throughput(self):
+        ''' Return the totals of the sync runs per day, the latest day first '''
+        since = timezone.now() - timedelta(days=self.dashboard_days)
+        days = SyncRun.objects.filter(started__gte=since).extra(
+            select={'day': 'date(started)'}).values('day').annotate(
+            runs=Count('id'), objects=Sum('object_count'), failed=Sum('failed'),
+            seconds=Sum('seconds'), rpc_calls=Sum('rpc_calls'),
+            rpc_errors=Sum('rpc_errors')).order_by('-day')
+        days = list(days)
+        for day in days:
+            day['objects_per_second'] = day['objects'] / max(day['seconds'] or 0, 0.001)
+        return days
+
+    def get_backlog(self):
+        '''
+        Return the dirty root mappers of each model by content type, and how
+        many of them wait for a retry or were given up (see oesync.retry)
+        '''
+        backlog = []
+        limit = retry.max_attempts()
+        for model in (ObjMapper, DeletedObjMapper):
+            dirty = model.objects.filter(parent=None, is_dirty=True)
+            counts = dirty.values('content_type').annotate(
+                count=Count('id')).order_by('-count')
+            backlog.append({
+                'model': model._meta.verbose_name_plural,
+                'total': sum([row['count'] for row in counts]),
+                'content_types': [(ContentType.objects.get_for_id(row['content_type']),
+                                   row['count']) for row in counts],
+                'waiting': dirty.filter(next_attempt__gt=timezone.now()).count(),
+                'dead': limit and dirty.filter(attempts__gte=limit).count() or 0,
+            })
+        return backlog
+
+admin.site.register(SyncRun, SyncRunAdmin)
+
+
+
 
 
 # Patch admin classes to dispatch custom signal once all child
@@ -0,0 +1,163 @@
+from django.contrib.contenttypes.models import ContentType
+from django.conf import settings
+from oesync.models import ObjMapper, BackfillCheckpoint
+from oesync.modelmapper import ModelMapper
+from oesync.stats import Stats
+from oesync import listeners, history
+import time
+import logging
+
+log = logging.getLogger('OESync')
+
+
+
+class Backfill(object):
+    '''
+    Brings existing Satchmo objects to OpenErp. The mapped models are
+    processed in the order of their dependencies (see SyncScheduler), the
+    objects of a model in chunks ordered by id: the missing ObjMappers of a
+    chunk are created in bulk, then the chunk is pushed with batched calls.
+    Objects that are already in sync are skipped. The progress of each
+    model is stored in a BackfillCheckpoint after every chunk, so an
+    interrupted backfill resumes with the next chunk.
+
+    progress is called after each chunk with the Backfill, the model and
+    its checkpoint.
+    '''
+    #only backfilled if named: the order history would end up in OpenErp
+    #as draft sale orders
+    named_only = ('order', 'orderitem')
+
+    def __init__(self, model_names=None, chunk_size=None, progress=None):
+        self.chunk_size = chunk_size or \
+            settings.OPENERP_SETTINGS.get('CHUNK_SIZE', 50)
+        self.models = self.get_models(model_names)
+        self.progress = progress
+        self.stats = Stats('objects', 'mappers', 'synced', 'skipped', 'failed')
+        self.total = 0
+        self.started = None
+
+    def get_models(self, model_names=None):
+        '''
+        Return the mapped models to backfill, in dependency order: the given
+        ones, or all but those of named_only
+        '''
+        model_stages = listeners.scheduler.get_model_stages()
+        if model_stages is None:
+            names = sorted(name.lower() for name in ModelMapper.mapping)
+        else:
+            names = [name for kind, models in model_stages \
+                if kind == 'save' for name in models]
+        if model_names:
+            wanted = set(name.lower() for name in model_names)
+            unknown = wanted.difference(names)
+            if unknown:
+                raise ValueError('Not a mapped model: %s' % ', '.join(sorted(unknown)))
+            names = [name for name in names if name in wanted]
+        else:
+            names = [name for name in names if name not in self.named_only]
+        return [ContentType.objects.get(model=name).model_class() for name in names]
+
+    def get_checkpoint(self, model):
+        content_type = ContentType.objects.get_for_model(model)
+        return BackfillCheckpoint.objects.get_or_create(content_type=content_type)[0]
+
+    def remaining(self, model, checkpoint):
+        ''' Return the number of objects of a model left to process '''
+        if checkpoint.finished:
+            return 0
+        return model.objects.filter(pk__gt=checkpoint.last_id).count()
+
+    def reset(self):
+        ''' Drop the checkpoints, so the next run starts from scratch '''
+        BackfillCheckpoint.objects.filter(content_type__in=[
+            ContentType.objects.get_for_model(model) for model in self.models
+            ]).delete()
+
+    @property
+    def rate(self):
+        ''' Objects processed per second in this run '''
+        elapsed = time.time() - self.started
+        return self.stats.get('objects') / max(elapsed, 0.001)
+
+    @property
+    def eta(self):
+        ''' Seconds left until all models are processed, or None '''
+        rate = self.rate
+        if not rate:
+            return None
+        return (self.total - self.stats.get('objects')) / rate
+
+    def run(self):
+        ''' Backfill all models, returns False if some objects failed '''
+        checkpoints = [(model, self.get_checkpoint(model)) for model in self.models]
+        self.total = sum([self.remaining(model, checkpoint) \
+            for model, checkpoint in checkpoints])
+        self.started = time.time()
+        with history.recording('backfill') as recorder:
+            for model, checkpoint in checkpoints:
+                if not checkpoint.finished:
+                    self._backfill_model(model, checkpoint)
+            recorder.result = self.stats.get('failed') == 0
+        return recorder.result
+
+    def _backfill_model(self, model, checkpoint):
+        content_type = ContentType.objects.get_for_model(model)
+        oerp_models = ModelMapper.get_root_models(model)
+        log.info('Backfilling %s objects...' % model.__name__)
+        while True:
+            ids = list(model.objects.filter(pk__gt=checkpoint.last_id).order_by(
+                'pk').values_list('pk', flat=True)[:self.chunk_size])
+            if not ids:
+                break
+            self._create_mappers(content_type, ids, oerp_models)
+            failed = self._push(content_type, ids)
+
+            checkpoint.last_id = ids[-1]
+            checkpoint.done += len(ids)
+            checkpoint.failed += failed
+            checkpoint.save()
+            self.stats.incr('objects', len(ids))
+            if self.progress is not None:
+                self.progress(self, model, checkpoint)
+
+        checkpoint.finished = True
+        checkpoint.save()
+
+    def _create_mappers(self, content_type, ids, oerp_models):
+        ''' Create the missing root mappers of the given objects in bulk '''
+        found = set(ObjMapper.objects.filter(
+            content_type=content_type, object_id__in=ids, parent=None
+            ).values_list('object_id', 'oerp_model'))
+        mappers = [ObjMapper(
+                content_type=content_type,
+                object_id=object_id,
+                oerp_model=oerp_model,
+                is_root=True,
+                is_dirty=True) \
+            for object_id in ids for oerp_model in oerp_models \
+            if (object_id, oerp_model) not in found]
+        ObjMapper.objects.bulk_create(mappers)
+        self.stats.incr('mappers', len(mappers))
+
+    def _push(self, content_type, ids):
+        ''' Push the dirty objects of a chunk, return the number of failures '''
+        mappers = list(ObjMapper.objects.filter(
+            content_type=content_type, object_id__in=ids, parent=None,
+            is_dirty=True).order_by('object_id', 'id'))
+        self.stats.incr('skipped', len(ids) - len(set(
+            mapper.object_id for mapper in mappers)))
+        if not mappers:
+            return 0
+        for mapper in mappers:
+            mapper.sync_action = mapper.oerp_id is None and 'create' or 'update'
+        existing = listeners._resolve_existence(mappers)
+        for stage in listeners.scheduler.get_stages(mappers):
+            listeners._sync_stage(stage, self.chunk_size, existing,
+                                  recorder=history.current())
+
+        failed = ObjMapper.objects.filter(
+            id__in=[mapper.id for mapper in mappers], is_dirty=True).count()
+        self.stats.incr('synced', len(mappers) - failed)
+        self.stats.incr('failed', failed)
+        return failed
@@ -0,0 +1,5 @@
+'''
+Benchmark harness: a fake OpenErp server (server.FakeOpenErp), synthetic
+Satchmo objects (fixtures.Fixtures) and the measured scenarios
+(runner.Benchmark). Run it with ./manage.py oesync_bench.
+'''
@@ -0,0 +1,142 @@
+from django.contrib.sites.models import Site
+from django.conf import settings
+from product.models import Category, Product, Price
+from satchmo_store.contact.models import Contact, ContactRole, AddressBook
+from satchmo_store.shop.models import Order, OrderItem
+from l10n.models import Country
+from oesync.modelmapper import ModelMapper
+from oesync.signals import post_save_all
+from decimal import Decimal
+import random
+
+
+
+class Fixtures(object):
+    '''
+    Synthetic Satchmo objects for benchmarks: a tree of categories,
+    products with prices, contacts with addresses, and orders with items
+    and a payment each. Objects are named 'prefix-...'. They are saved
+    like in the admin, so that their object mappers are created, but
+    nothing is synced (MODE is set to 'manual' meanwhile).
+    '''
+    def __init__(self, categories=50, products=1000, addresses=1000,
+                 orders=100, items=3, prefix='bench', seed=0):
+        self.counts = {
+            'categories': categories,
+            'products': products,
+            'addresses': addresses,
+            'orders': orders,
+        }
+        self.items = items
+        self.prefix = prefix
+        self.random = random.Random(seed)
+        self.categories = []
+        self.products = []
+        self.contacts = []
+        self.orders = []
+
+    def create(self):
+        mode = settings.OPENERP_SETTINGS['MODE']
+        settings.OPENERP_SETTINGS['MODE'] = 'manual'
+        try:
+            self.site = Site.objects.get_current()
+            self.role = ContactRole.objects.get_or_create(
+                key='Customer', defaults={'name': 'Customer'})[0]
+            self._create_categories()
+            self._create_products()
+            self._create_contacts()
+            self._create_orders()
+        finally:
+            settings.OPENERP_SETTINGS['MODE'] = mode
+        return self
+
+    def _saved(self, instance):
+        ''' Let oesync know about an object as if it was saved in the admin '''
+        if instance.__class__.__name__ in ModelMapper.access_inline:
+            post_save_all.send(sender=instance.__class__,
+                               instance=instance, created=True)
+        return instance
+
+    def _name(self, kind, index):
+        return '%s-%s-%s' % (self.prefix, kind, index)
+
+    def _create_categories(self):
+        for index in range(self.counts['categories']):
+            #build a tree: every fifth category is a root
+            parent = None
+            if self.categories and index % 5:
+                parent = self.random.choice(self.categories)
+            self.categories.append(self._saved(Category.objects.create(
+                site=self.site,
+                name=self._name('category', index),
+                slug=self._name('category', index),
+                parent=parent)))
+
+    def _create_products(self):
+        for index in range(self.counts['products']):
+            product = Product.objects.create(
+                site=self.site,
+                name=self._name('product', index),
+                slug=self._name('product', index),
+                sku=self._name('product', index),
+                description='Benchmark product %s' % index,
+                items_in_stock=self.random.randint(0, 100),
+                weight=Decimal(self.random.randint(1, 5000)) / 100,
+                active=True)
+            Price.objects.create(product=product,
+                price=Decimal(self.random.randint(100, 100000)) / 100)
+            if self.categories:
+                product.category.add(*self.random.sample(
+                    self.categories, min(2, len(self.categories))))
+            self.products.append(self._saved(product))
+
+    def _create_contacts(self):
+        if not self.counts['addresses']:
+            return
+        self.country = Country.objects.order_by('id')[0]
+        for index in range(self.counts['addresses']):
+            contact = self._saved(Contact.objects.create(
+                first_name='Bench',
+                last_name=str(index),
+                email='%s@example.com' % self._name('contact', index),
+                role=self.role))
+            self._saved(AddressBook.objects.create(
+                contact=contact,
+                description='Home',
+                addressee='Bench %s' % index,
+                street1='%s Benchmark Street' % index,
+                city='Zurich',
+                postal_code='8000',
+                country=self.country,
+                is_default_shipping=True,
+                is_default_billing=True))
+            self.contacts.append(contact)
+
+    def _create_orders(self):
+        if not self.contacts or not self.products:
+            return
+        for index in range(self.counts['orders']):
+            contact = self.random.choice(self.contacts)
+            order = self._saved(Order.objects.create(
+                site=self.site,
+                contact=contact,
+                status='New',
+                sub_total=Decimal('0'),
+                total=Decimal('0')))
+            total = Decimal('0')
+            for product in self.random.sample(self.products,
+                    min(self.items, len(self.products))):
+                quantity = Decimal(self.random.randint(1, 3))
+                price = product.unit_price
+                self._saved(OrderItem.objects.create(
+                    order=order,
+                    product=product,
+                    quantity=quantity,
+                    unit_price=price,
+                    unit_tax=Decimal('0'),
+                    line_item_price=price * quantity))
+                total += price * quantity
+            order.sub_total = order.total = total
+            order.save()
+            order.payments.create(payment='DUMMY', amount=total)
+            self.orders.append(order)
@@ -0,0 +1,187 @@
+from django.db import connection, transaction
+from django.conf import settings
+from oesync.models import ObjMapper
+from oesync.listeners import syncnow, on_save_obj_mapper, on_order_success_mapper
+from oesync.oerprpc import pool
+from oesync.cache import id_cache
+from oesync.bench.server import start_server
+from contextlib import contextmanager
+import resource
+import time
+import logging
+
+log = logging.getLogger('OESync')
+
+#result keys where higher is better; for all others lower is better
+_higher_is_better = ('records_per_second', )
+_compared = ('records_per_second', 'rpcs_per_record', 'queries_per_record')
+
+
+
+class Benchmark(object):
+    '''
+    Measures oesync against a FakeOpenErp served in this process. The
+    scenarios run one after another on the given (not yet created)
+    Fixtures:
+
+    - syncnow: push all fixtures with syncnow()
+    - save: change products and sync each of them with on_save_obj_mapper
+      in live mode
+    - finalize: confirm, invoice and pay the orders with
+      on_order_success_mapper in live mode
+
+    Everything is done in one transaction that is rolled back at the end:
+    the mappers hold the ids of the fake server.
+    '''
+    def __init__(self, fixtures, fake, saves=100):
+        self.fixtures = fixtures
+        self.fake = fake
+        self.saves = saves
+        #list of result dicts, see measure()
+        self.results = []
+
+    def run(self):
+        server = start_server(self.fake)
+        try:
+            with _pointed_to(server), id_cache.isolated(), _rolled_back():
+                self.fixtures.create()
+                self.scenario_syncnow()
+                self.scenario_save()
+                self.scenario_finalize()
+        finally:
+            server.shutdown()
+            server.server_close()
+        return self.results
+
+    def scenario_syncnow(self):
+        records = ObjMapper.objects.filter(parent=None, is_dirty=True).count()
+        self.measure('syncnow', records, syncnow)
+
+    def scenario_save(self):
+        products = self.fixtures.products[:self.saves]
+        with _mode('manual'):
+            for product in products:
+                product.name = '%s changed' % product.name
+                product.save()
+        def save_all():
+            for product in products:
+                on_save_obj_mapper(product.__class__, product)
+        with _mode('live'):
+            self.measure('save', len(products), save_all)
+
+    def scenario_finalize(self):
+        orders = self.fixtures.orders
+        def finalize_all():
+            for order in orders:
+                on_order_success_mapper(order.__class__, order)
+        with _mode('live'):
+            self.measure('finalize', len(orders), finalize_all)
+
+    def measure(self, name, records, func):
+        '''
+        Run func and store its result: records, seconds, records per
+        second, RPCs, RPCs and database queries per record, and the peak
+        memory (maximum resident set size) of the process in MB.
+        '''
+        rpcs = sum(self.fake.calls.values())
+        use_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        del connection.queries[:]
+        started = time.time()
+        try:
+            func()
+            seconds = time.time() - started
+            queries = len(connection.queries)
+        finally:
+            connection.use_debug_cursor = use_debug_cursor
+            del connection.queries[:]
+        rpcs = sum(self.fake.calls.values()) - rpcs
+        per_record = float(max(records, 1))
+        result = {
+            'scenario': name,
+            'records': records,
+            'seconds': seconds,
+            'records_per_second': records / max(seconds, 0.000001),
+            'rpcs': rpcs,
+            'rpcs_per_record': rpcs / per_record,
+            'queries_per_record': queries / per_record,
+            'peak_memory_mb': resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss / 1024.,
+        }
+        self.results.append(result)
+        log.info('Benchmark %s: %.1f records/s' % (name, result['records_per_second']))
+        return result
+
+
+
+def report(results):
+    ''' Return the results as a text table '''
+    lines = ['%-10s %8s %9s %10s %9s %11s %12s %9s' % ('scenario', 'records',
+        'seconds', 'records/s', 'rpcs', 'rpcs/record', 'queries/rec', 'peak MB')]
+    for result in results:
+        lines.append('%(scenario)-10s %(records)8d %(seconds)9.2f '
+            '%(records_per_second)10.1f %(rpcs)9d %(rpcs_per_record)11.2f '
+            '%(queries_per_record)12.2f %(peak_memory_mb)9.1f' % result)
+    return '\n'.join(lines) + '\n'
+
+
+def compare(results, baseline, tolerance=0.2):
+    '''
+    Return descriptions of the values of results that are worse than
+    those of a baseline (an earlier list of results) by more than the
+    given fraction.
+    '''
+    previous = dict((result['scenario'], result) for result in baseline)
+    regressions = []
+    for result in results:
+        old = previous.get(result['scenario'])
+        if old is None:
+            continue
+        for key in _compared:
+            if key in _higher_is_better:
+                worse = result[key] < old[key] * (1 - tolerance)
+            else:
+                worse = result[key] > old[key] * (1 + tolerance)
+            if worse:
+                regressions.append('%s %s: %.2f (baseline %.2f)' % (
+                    result['scenario'], key, result[key], old[key]))
+    return regressions
+
+
+@contextmanager
+def _pointed_to(server):
+    ''' Let the connection pool use the given server meanwhile '''
+    config = settings.OPENERP_SETTINGS
+    original = dict(config)
+    host, port = server.server_address
+    config.update({'HOST': host, 'PORT': port, 'PROTOCOL': 'xmlrpc'})
+    pool.reset()
+    try:
+        yield
+    finally:
+        config.clear()
+        config.update(original)
+        pool.reset()
+
+
+@contextmanager
+def _mode(mode):
+    ''' Set the sync MODE meanwhile '''
+    original = settings.OPENERP_SETTINGS['MODE']
+    settings.OPENERP_SETTINGS['MODE'] = mode
+    try:
+        yield
+    finally:
+        settings.OPENERP_SETTINGS['MODE'] = original
+
+
+@contextmanager
+def _rolled_back():
+    ''' Roll back everything done meanwhile '''
+    transaction.enter_transaction_management()
+    transaction.managed(True)
+    try:
+        yield
+    finally:
+        transaction.rollback()
+        transaction.leave_transaction_management()
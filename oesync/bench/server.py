@@ -0,0 +1,286 @@
+from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+from SocketServer import ThreadingMixIn
+from collections import Counter
+import xmlrpclib
+import threading
+import random
+import time
+import logging
+
+log = logging.getLogger('OESync')
+
+
+
+class FakeOpenErp(object):
+    '''
+    In-memory stand-in for the part of OpenErp's XML-RPC interface used by
+    oesync: login, the ORM methods of the object service (create, write,
+    unlink, exists, search, read, load, ...), the order workflow and the
+    methods of the oesync_server addon. Every call is delayed by latency
+    seconds; a fraction failure_rate of the calls, and all calls of the
+    (model, method) pairs in fail_methods, raise a fault.
+    '''
+    def __init__(self, latency=0., failure_rate=0., fail_methods=(), seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.fail_methods = set(fail_methods)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        ''' Drop all records and call counts '''
+        with self.lock:
+            #{model: {id: values}}
+            self.data = {}
+            #{external id: (model, id)}
+            self.xmlids = {}
+            self.seq = 0
+            self.calls = Counter()
+
+    def _dispatch(self, method, params):
+        if method == 'login':
+            return 1
+        if method == 'version':
+            return {'server_version': '7.0'}
+        if method == 'execute':
+            model, name, args, kw = params[3], params[4], list(params[5:]), {}
+        elif method == 'execute_kw':
+            model, name, args = params[3], params[4], list(params[5])
+            kw = len(params) > 6 and params[6] or {}
+        elif method == 'exec_workflow':
+            model, name, args, kw = params[3], params[4], [params[5]], {}
+        else:
+            raise xmlrpclib.Fault(1, 'Unknown method %s' % method)
+
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls[(model, name)] += 1
+            if (model, name) in self.fail_methods or \
+                    self.random.random() < self.failure_rate:
+                raise xmlrpclib.Fault(1, 'Injected failure of %s.%s' % (model, name))
+            handler = getattr(self, 'rpc_%s' % name, None)
+            if handler is None:
+                #workflow buttons etc.
+                return True
+            kw.pop('context', None)
+            return handler(model, *args, **kw)
+
+    def _records(self, model):
+        return self.data.setdefault(model, {})
+
+    def _create(self, model, values):
+        self.seq += 1
+        self._records(model)[self.seq] = dict(values)
+        return self.seq
+
+    def rpc_create(self, model, values, context=None):
+        return self._create(model, values)
+
+    def rpc_write(self, model, ids, values, context=None):
+        records = self._records(model)
+        for id in _ids(ids):
+            if id not in records:
+                raise xmlrpclib.Fault(1, 'Record %s of %s does not exist' % (id, model))
+            records[id].update(values)
+        return True
+
+    def rpc_unlink(self, model, ids, context=None):
+        records = self._records(model)
+        for id in _ids(ids):
+            records.pop(id, None)
+        return True
+
+    def rpc_exists(self, model, ids, context=None):
+        records = self._records(model)
+        return all([id in records for id in _ids(ids)])
+
+    def rpc_search(self, model, domain, offset=0, limit=None, order=None,
+                   context=None, count=False):
+        records = self._records(model)
+        ids = [id for id in sorted(records) \
+            if _match(list(domain), dict(records[id], id=id))]
+        if order and 'write_date' in order:
+            ids.sort(key=lambda id: (records[id].get('write_date') or '', id))
+        ids = ids[offset or 0:]
+        if limit:
+            ids = ids[:limit]
+        return count and len(ids) or ids
+
+    def rpc_read(self, model, ids, fields=None, context=None):
+        records = self._records(model)
+        res = []
+        for id in _ids(ids):
+            if id in records:
+                values = dict(records[id], id=id)
+                if fields:
+                    values = dict((field, values.get(field, False)) \
+                        for field in list(fields) + ['id'])
+                res.append(values)
+        if isinstance(ids, (list, tuple)):
+            return res
+        return res and res[0] or False
+
+    def rpc_fields_get(self, model, fields=None, context=None):
+        return {}
+
+    def rpc_load(self, model, fields, rows, context=None):
+        ids = []
+        for row in rows:
+            values = dict(zip(fields, row))
+            xmlid = values.pop('id', None)
+            id = values.pop('.id', None)
+            values = dict((field.split('/')[0], value) for field, value in values.items())
+            if id:
+                self.rpc_write(model, [int(id)], values)
+                ids.append(int(id))
+            elif xmlid in self.xmlids:
+                ids.append(self.xmlids[xmlid][1])
+                self.rpc_write(model, [ids[-1]], values)
+            else:
+                ids.append(self._create(model, values))
+                if xmlid:
+                    self.xmlids[xmlid] = (model, ids[-1])
+        return {'ids': ids, 'messages': []}
+
+    def rpc_action_button_confirm(self, model, ids, context=None):
+        for id in _ids(ids):
+            invoice_id = self._create('account.invoice', {'state': 'draft'})
+            order = self._records(model)[id]
+            order['state'] = 'manual'
+            order['invoice_ids'] = order.get('invoice_ids', []) + [invoice_id]
+        return True
+
+    def rpc_invoice_confirm(self, model, ids, context=None):
+        for id in (context or {}).get('active_ids', []):
+            self._records('account.invoice')[id]['state'] = 'open'
+        return {}
+
+    def rpc_onchange_partner_id(self, model, ids, partner_id, journal_id,
+                                amount, currency_id, ttype=None, date=None,
+                                context=None):
+        return {'value': {'line_cr_ids': []}}
+
+    def rpc_oesync_finalize(self, model, ids, payments, context=None):
+        self.rpc_action_button_confirm(model, ids)
+        invoice_id = self._records(model)[ids[0]]['invoice_ids'][-1]
+        self._records('account.invoice')[invoice_id]['state'] = 'open'
+        voucher_ids = [self._create('account.voucher', payment) \
+            for payment in payments]
+        return {'invoice_id': invoice_id, 'voucher_ids': voucher_ids}
+
+    def rpc_create_many(self, model, target, records, context=None):
+        return [self._create(target, values) for values in records]
+
+    def rpc_upsert(self, model, target, records, known_ids=None, context=None):
+        #see oesync_server/sync.py
+        known_ids = known_ids or {}
+        def resolve(xmlid):
+            if xmlid in self.xmlids:
+                return self.xmlids[xmlid][1]
+            if xmlid in known_ids:
+                ref_model, ref_id = known_ids[xmlid]
+                if ref_id in self._records(ref_model):
+                    self.xmlids[xmlid] = (ref_model, ref_id)
+                    return ref_id
+            return False
+        ids = []
+        for record in records:
+            if len(record) == 2:
+                xmlid, id, values = record[0], False, record[1]
+            else:
+                xmlid, id, values = record
+            data = {}
+            for field, value in values.items():
+                if field.endswith('/id'):
+                    if isinstance(value, list):
+                        value = [resolve(x) for x in value if resolve(x)]
+                    else:
+                        value = value and resolve(value) or False
+                    field = field[:-3]
+                data[field] = value
+            records_of_target = self._records(target)
+            current = self.xmlids.get(xmlid)
+            if current and current[1] in records_of_target:
+                id = current[1]
+                records_of_target[id].update(data)
+            elif id and id in records_of_target:
+                records_of_target[id].update(data)
+                self.xmlids[xmlid] = (target, id)
+            elif id:
+                id = False
+            else:
+                id = self._create(target, data)
+                self.xmlids[xmlid] = (target, id)
+            ids.append(id)
+        return ids
+
+
+
+class _Server(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+class _RequestHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ('/xmlrpc/common', '/xmlrpc/object')
+    #keep connections alive like OpenErp does
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(fake, host='127.0.0.1', port=0):
+    '''
+    Serve a FakeOpenErp over XML-RPC in a background thread. Returns the
+    server; its port is server.server_address[1]. Stop it with
+    server.shutdown().
+    '''
+    server = _Server((host, port), _RequestHandler,
+                     logRequests=False, allow_none=True)
+    server.register_instance(fake)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    log.debug('Fake OpenErp listening on %s:%s' % server.server_address)
+    return server
+
+
+def _ids(ids):
+    if isinstance(ids, (list, tuple)):
+        return ids
+    return [ids]
+
+
+def _match(domain, values):
+    ''' Evaluate an OE domain (in prefix notation) for a record '''
+    def term():
+        item = domain.pop(0)
+        if item == '|':
+            left, right = term(), term()
+            return left or right
+        if item == '&':
+            left, right = term(), term()
+            return left and right
+        if item == '!':
+            return not term()
+        field, operator, value = item
+        #missing values are read as False, like empty ones in OE
+        current = values.get(field, False)
+        if operator in ('=', '=='):
+            return current == value
+        if operator == '!=':
+            return current != value
+        if operator == 'in':
+            return current in value
+        if operator == 'not in':
+            return current not in value
+        if current is None or current is False:
+            return False
+        return {'>': current > value, '>=': current >= value,
+                '<': current < value, '<=': current <= value}[operator]
+    res = True
+    while domain:
+        res = term() and res
+    return res
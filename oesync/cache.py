@@ -0,0 +1,218 @@
+from django.conf import settings
+from oesync.stats import Stats
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+import time
+import logging
+
+log = logging.getLogger('OESync')
+
+
+
+class LocalBackend(object):
+    '''
+    Least recently used entries of this process, dropped after timeout
+    seconds (None for never)
+    '''
+    def __init__(self, size, stats, timeout=None):
+        self.size = size
+        self.stats = stats
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                try:
+                    value, expires = self._entries.pop(key)
+                except KeyError:
+                    continue
+                if expires is not None and expires < now:
+                    continue
+                #move entry to the end
+                self._entries[key] = (value, expires)
+                found[key] = value
+        return found
+
+    def set_many(self, values):
+        expires = self.timeout and time.time() + self.timeout or None
+        with self._lock:
+            for key, value in values.items():
+                self._entries.pop(key, None)
+                self._entries[key] = (value, expires)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.stats.incr('evictions')
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoBackend(object):
+    ''' Entries shared by all processes through Django's cache framework '''
+    def __init__(self, alias, timeout):
+        from django.core.cache import get_cache
+        self.cache = get_cache(alias)
+        self.timeout = timeout
+
+    def _key(self, key):
+        return 'oesync:oerp_id:%s:%s:%s' % key
+
+    def get_many(self, keys):
+        cache_keys = dict((self._key(key), key) for key in keys)
+        return dict((cache_keys[cache_key], value) for cache_key, value \
+            in self.cache.get_many(cache_keys.keys()).items())
+
+    def set_many(self, values):
+        self.cache.set_many(dict((self._key(key), value) \
+            for key, value in values.items()), self.timeout)
+
+    def delete_many(self, keys):
+        self.cache.delete_many([self._key(key) for key in keys])
+
+    def clear(self):
+        #entries expire with the timeout
+        pass
+
+
+
+class OerpIdCache(object):
+    '''
+    Cache of the oerp_ids of synced ObjMappers, keyed by (content_type_id,
+    object_id, oerp_model). Entries are kept in Django's cache if
+    'ID_CACHE_BACKEND' names a cache of the CACHES setting. Otherwise they
+    are kept in a bounded LRU of this process for 'ID_CACHE_LOCAL_TIMEOUT'
+    seconds, and only in live mode: workers and shards of other processes
+    change mappers this process does not hear of. Entries are dropped when
+    the oerp_id of an ObjMapper changes or the mapper is deleted, also by
+    bulk updates (see models.ObjMapperQuerySet).
+    '''
+    def __init__(self):
+        self.stats = Stats('hits', 'misses', 'evictions', 'invalidations')
+        self._backend = None
+        self._isolated = False
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            config = settings.OPENERP_SETTINGS
+            alias = config.get('ID_CACHE_BACKEND')
+            if alias:
+                self._backend = DjangoBackend(
+                    alias, config.get('ID_CACHE_TIMEOUT', 3600))
+            else:
+                self._backend = LocalBackend(
+                    config.get('ID_CACHE_SIZE', 10000), self.stats,
+                    config.get('ID_CACHE_LOCAL_TIMEOUT', 60))
+        return self._backend
+
+    def enabled(self):
+        if self._isolated:
+            return True
+        config = settings.OPENERP_SETTINGS
+        if config.get('ID_CACHE_SIZE', 10000) <= 0:
+            return False
+        return bool(config.get('ID_CACHE_BACKEND')) or config['MODE'] == 'live'
+
+    def get_many(self, keys):
+        '''
+        Return {key: oerp_id} of the given keys found in the cache. Objects
+        that are not synced yet are never cached.
+        '''
+        if not self.enabled():
+            return {}
+        try:
+            found = self.backend.get_many(keys)
+        except Exception as e:
+            log.warning('Id cache failed -- %s' % e)
+            found = {}
+        self.stats.incr('hits', len(found))
+        self.stats.incr('misses', len(keys) - len(found))
+        #entries of unsynced objects written by earlier versions are misses
+        return dict((key, value) for key, value in found.items() if value)
+
+    def set_many(self, values):
+        '''
+        Cache the oerp_ids of synced objects given as {key: oerp_id}. Ids
+        that are None are skipped, as another process may sync the object
+        any time.
+        '''
+        values = dict((key, value) for key, value in values.items() if value)
+        if not self.enabled() or not values:
+            return
+        try:
+            self.backend.set_many(values)
+        except Exception as e:
+            log.warning('Id cache failed -- %s' % e)
+
+    def get(self, key):
+        ''' Return the cached oerp_id of a key, raise KeyError if unknown '''
+        return self.get_many([key])[key]
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def delete(self, key):
+        self.delete_many([key])
+
+    def delete_many(self, keys):
+        if not self.enabled() or not keys:
+            return
+        self.stats.incr('invalidations', len(keys))
+        try:
+            self.backend.delete_many(keys)
+        except Exception as e:
+            log.warning('Id cache failed -- %s' % e)
+
+    def clear(self):
+        self.backend.clear()
+
+    @contextmanager
+    def isolated(self):
+        '''
+        Use an empty LRU of this process meanwhile, e.g. while syncing with
+        a test server whose ids must not end up in a shared cache
+        '''
+        backend, isolated = self._backend, self._isolated
+        self._backend = LocalBackend(
+            settings.OPENERP_SETTINGS.get('ID_CACHE_SIZE', 10000), self.stats)
+        self._isolated = True
+        try:
+            yield
+        finally:
+            self._backend, self._isolated = backend, isolated
+
+    def on_mapper_saved(self, sender, instance, **kwargs):
+        ''' Drop the entry of a saved ObjMapper if its oerp_id has changed '''
+        key = _mapper_key(instance)
+        if not self.enabled():
+            return
+        try:
+            cached = self.backend.get_many([key])
+        except Exception as e:
+            log.warning('Id cache failed -- %s' % e)
+            cached = {}
+        if key in cached and cached[key] != instance.oerp_id:
+            self.delete(key)
+
+    def on_mapper_deleted(self, sender, instance, **kwargs):
+        ''' Drop the entry of a deleted ObjMapper '''
+        self.delete(_mapper_key(instance))
+
+
+
+def _mapper_key(mapper):
+    return (mapper.content_type_id, mapper.object_id, mapper.oerp_model)
+
+
+id_cache = OerpIdCache()
@@ -0,0 +1,97 @@
+from django.conf import settings
+from oesync.stats import Stats
+from contextlib import contextmanager
+from collections import OrderedDict
+import threading
+import logging
+
+log = logging.getLogger('OESync')
+
+
+
+class SaveCoalescer(object):
+    '''
+    Collects the live syncs triggered during a request (if the
+    SaveCoalescerMiddleware is installed) or inside a collect() block and
+    runs each of them only once, with the final state of the object, at
+    the end. Syncs are keyed
+    by (content_type, object_id, oerp_model) and run in the order in which
+    they were first triggered.
+    '''
+    def __init__(self, callback):
+        self.callback = callback
+        self._local = threading.local()
+        self.stats = Stats('scheduled', 'suppressed', 'flushed')
+
+    def _state(self):
+        state = self._local
+        if not hasattr(state, 'pending'):
+            state.depth = 0
+            state.pending = OrderedDict()
+        return state
+
+    def active(self):
+        '''
+        Check whether syncs are currently collected in this thread
+        '''
+        if not settings.OPENERP_SETTINGS.get('COALESCE', True):
+            return False
+        return self._state().depth > 0
+
+    def add(self, key, mapper_id):
+        '''
+        Schedule the sync of a mapper. Returns False if a sync of the same
+        object had already been scheduled.
+        '''
+        pending = self._state().pending
+        if key in pending:
+            self.stats.incr('suppressed')
+            return False
+        pending[key] = mapper_id
+        self.stats.incr('scheduled')
+        return True
+
+    def flush(self):
+        '''
+        Run all syncs scheduled in this thread
+        '''
+        state = self._state()
+        pending, state.pending = state.pending, OrderedDict()
+        if not pending:
+            return
+        self.stats.incr('flushed', len(pending))
+        try:
+            self.callback(pending.values())
+        except Exception as e:
+            #the mappers are still dirty and can be synced later
+            log.exception('Sync of scheduled objects failed -- %s' % e)
+
+    def begin(self):
+        self._state().depth += 1
+
+    def end(self):
+        state = self._state()
+        state.depth = max(state.depth - 1, 0)
+        if state.depth == 0:
+            self.flush()
+
+    @contextmanager
+    def collect(self):
+        '''
+        Coalesce the syncs triggered inside a with-block, e.g. a bulk import
+        '''
+        self.begin()
+        try:
+            yield self
+        finally:
+            self.end()
+
+    def start_request(self):
+        state = self._state()
+        #run leftovers of a previous request first
+        self.flush()
+        state.depth = 1
+
+    def finish_request(self):
+        self._state().depth = 0
+        self.flush()
@@ -1,10 +1,155 @@
 from oesync.models import ObjMapper
+from oesync.cache import id_cache
 from django.contrib.contenttypes.models import ContentType
+from operator import attrgetter, methodcaller
+from decimal import Decimal
 import logging
+import re
 
 log = logging.getLogger('OESync')
 
 
+
+_path_segment = re.compile(r'^([A-Za-z_][A-Za-z0-9_]*)(\(\))?$')
+
+def compile_path(path):
+    '''
+    Compile an attribute path like 'contact.primary_phone.phone' or
+    'unit_price.to_eng_string()' into a tuple of getter functions.
+    Consecutive attributes are looked up by a single attrgetter, method
+    calls (without arguments) by a methodcaller.
+    '''
+    steps = []
+    attrs = []
+    for segment in path.split('.'):
+        match = _path_segment.match(segment)
+        if match is None:
+            raise ValueError('Invalid attribute path \'%s\'' % path)
+        attrs.append(match.group(1))
+        if match.group(2):
+            #method call
+            name = attrs.pop()
+            if attrs:
+                steps.append(attrgetter('.'.join(attrs)))
+            steps.append(methodcaller(name))
+            attrs = []
+    if attrs:
+        steps.append(attrgetter('.'.join(attrs)))
+    return tuple(steps)
+
+def resolve_path(instance, steps):
+    ''' Apply compiled getter functions to an instance '''
+    value = instance
+    for step in steps:
+        value = step(value)
+    return value
+
+
+class IdResolver(object):
+    '''
+    Resolves the oerp_ids needed by the id fields of a mapping plan for a
+    whole batch of instances, with one query per (content_type, oerp_model).
+    The id fields then look up their values here instead of querying the
+    ObjMapper table one by one.
+    '''
+    def __init__(self):
+        self._references = {}
+        self._oerp_ids = {}
+        self._loaded = set()
+
+    def get_references(self, field, instance, oe_model):
+        ''' return (and remember) the objects a field refers to '''
+        key = (id(field), id(instance))
+        try:
+            return self._references[key]
+        except KeyError:
+            references = field.get_references(instance, oe_model)
+            self._references[key] = references
+            return references
+
+    def prefetch(self, plan, instances):
+        ''' load the oerp_ids referred to by the given instances '''
+        wanted = {}
+        for oerp_field, field in plan.fields:
+            for instance in instances:
+                try:
+                    references = self.get_references(field, instance, plan.oerp_model)
+                except Exception:
+                    #mapping errors are raised once the data is generated
+                    continue
+                if references is not None:
+                    content_type, oe_model, ids = references
+                    wanted.setdefault((content_type, oe_model), set()).update(ids)
+
+        for (content_type, oe_model), ids in wanted.items():
+            self.load(content_type, oe_model, ids)
+
+    def load(self, content_type, oe_model, ids):
+        ''' load the oerp_ids of the given objects unless already done '''
+        ids = [id for id in ids \
+            if (content_type.id, oe_model, id) not in self._loaded]
+        self._loaded.update([(content_type.id, oe_model, id) for id in ids])
+        ids = [id for id in ids if id is not None]
+        if not ids:
+            return
+        cached = id_cache.get_many([(content_type.id, id, oe_model) for id in ids])
+        for (content_type_id, id, oe_model), oerp_id in cached.items():
+            self._oerp_ids[(content_type_id, oe_model, id)] = oerp_id
+        ids = [id for id in ids if (content_type.id, id, oe_model) not in cached]
+        for start in range(0, len(ids), 500):
+            mappers = ObjMapper.objects.filter(
+                content_type=content_type,
+                oerp_model=oe_model,
+                object_id__in=ids[start:start + 500])
+            found = {}
+            for object_id, oerp_id in mappers.values_list('object_id', 'oerp_id'):
+                self._oerp_ids[(content_type.id, oe_model, object_id)] = oerp_id
+                found[(content_type.id, object_id, oe_model)] = oerp_id
+            id_cache.set_many(found)
+
+    def known_ids(self):
+        '''
+        return {external id: (oe_model, oerp_id)} of the loaded objects that
+        have been synced (see external_id)
+        '''
+        return dict((external_id(ContentType.objects.get_for_id(content_type_id),
+                                 id, oe_model), (oe_model, oerp_id)) \
+            for (content_type_id, oe_model, id), oerp_id in self._oerp_ids.items() \
+            if oerp_id)
+
+    def get_oerp_id(self, content_type, id, oe_model):
+        '''
+        return the prefetched oerp_id (None if there is no mapper), raise
+        KeyError if the id has not been prefetched
+        '''
+        key = (content_type.id, oe_model, id)
+        if key not in self._loaded:
+            raise KeyError(key)
+        try:
+            return self._oerp_ids[key]
+        except KeyError:
+            _warn_missing(content_type, id)
+            return None
+
+
+
+def external_id(content_type, id, oe_model):
+    '''
+    return the external id of the OE object of a Satchmo object, e.g.
+    'satchmo.product_42_product_template'
+    '''
+    return 'satchmo.%s_%s_%s' % (content_type.model, id, oe_model.replace('.', '_'))
+
+
+def _warn_missing(content_type, id):
+    #XXX: Should we not allow syncing if oerp_id is unknown?
+    log.warning('No mapper could be found for %s (%s)...' % \
+        (content_type.name,id))
+
+_model_ctypes = {}
+
+
+
 class GetField(object):
     '''
     Base class
@@ -15,6 +160,7 @@ class GetField(object):
         self.param_name = param_name
         self.actions = actions
         self.default = default
+        self._steps = self._compile(attr_name)
 
     def __repr__(self):
         return u'<%s: %s>' % (self.__class__.__name__, self.attr_name)
@@ -26,6 +172,10 @@ class GetField(object):
         ''' convert empty strings/None to False (NoneType is not supported in XMLRPC)'''
         if value in (None, '', u'', []):
             return False
+        elif isinstance(value, Decimal):
+            #XMLRPC has no decimal type, OpenErp accepts strings for floats;
+            #fixed-point notation, never exponents like '1E+1'
+            return format(value, 'f')
         elif isinstance(value, list):
             return [(6,0,value)] #format value to comply with OpenErp m2m format
             # OE many2many fields have to be modified as follows:
@@ -38,10 +188,14 @@ class GetField(object):
             # (6, ?, ids) set a list of links
         return value
 
+    def _compile(self, attr_name):
+        ''' compile attribute path once the mapping is loaded '''
+        return compile_path(attr_name)
+
     def _get_value(self, instance):
         ''' return value of specified field '''
         try:
-            return eval("instance.%s" % self.attr_name)
+            return resolve_path(instance, self._steps)
         except Exception as e:
             #check whether default value is set
             if self.default is not None:
@@ -50,7 +204,7 @@ class GetField(object):
 
     def _get_m2m_ids(self, instance):
         ''' Return multiple ids of instances of related model '''
-        all_inst = eval("instance.%s.all()" % self.attr_name)
+        all_inst = resolve_path(instance, self._steps).all()
         ids = [inst.id for inst in all_inst]
         return ids
 
@@ -60,24 +214,58 @@ class GetField(object):
 
     def _get_model_ctype(self, model_name):
         ''' return content-type for given model name '''
-        return ContentType.objects.get(model=model_name.lower())
+        try:
+            return _model_ctypes[model_name]
+        except KeyError:
+            content_type = ContentType.objects.get(model=model_name.lower())
+            _model_ctypes[model_name] = content_type
+            return content_type
 
-    def _get_oerp_id(self, content_type, id, oe_model):
+    def _get_oerp_id(self, content_type, id, oe_model, resolver=None):
         ''' return oerp_id for given content-type and id '''
+        if resolver is not None:
+            try:
+                return resolver.get_oerp_id(content_type, id, oe_model)
+            except KeyError:
+                #not prefetched
+                pass
+        key = (content_type.id, id, oe_model)
+        try:
+            return id_cache.get(key)
+        except KeyError:
+            pass
         try:
             mapper = ObjMapper.objects.get(
                 content_type=content_type,
                 object_id=id,
                 oerp_model=oe_model)
         except ObjMapper.DoesNotExist:
-            #XXX: Should we not allow syncing if oerp_id is unknown?
-            log.warning('No mapper could be found for %s (%s)...' % \
-                (content_type.name,id))
+            _warn_missing(content_type, id)
         else:
+            id_cache.set(key, mapper.oerp_id)
             return mapper.oerp_id
         return None
 
-    def get_content(self, instance, oe_model, create):
+    def _get_references(self, instance, oe_model, resolver=None):
+        if resolver is None:
+            return self.get_references(instance, oe_model)
+        return resolver.get_references(self, instance, oe_model)
+
+    def get_references(self, instance, oe_model):
+        '''
+        return (content_type, oe_model, ids) of the objects whose oerp_ids
+        are needed by this field, or None
+        '''
+        return None
+
+    def get_content(self, instance, oe_model, resolver=None):
+        return NotImplemented
+
+    def get_external_content(self, instance, oe_model):
+        '''
+        return the external ids of the objects a field refers to (see
+        external_id), NotImplemented if the field does not refer to objects
+        '''
         return NotImplemented
 
 
@@ -85,19 +273,29 @@ class GetField(object):
 
 class StdField(GetField):
     ''' Returns the instance attribute corresponding to attr_name. '''
-    def get_content(self, instance, oe_model):
+    def get_content(self, instance, oe_model, resolver=None):
         return self._check(self._get_value(instance))
 
 
 class IdField(GetField):
     ''' Returns the oerp_id corresponding to a given model field. '''
-    def get_content(self, instance, oe_model):
+    def get_references(self, instance, oe_model):
         inst_id = self._get_value(instance)
         content_type = self._get_inst_ctype(instance)
         if self.param_name:
             #get id for a different oe model if specified
             oe_model = self.param_name
-        return self._check(self._get_oerp_id(content_type, inst_id, oe_model))
+        return (content_type, oe_model, [inst_id])
+
+    def get_content(self, instance, oe_model, resolver=None):
+        content_type, oe_model, ids = self._get_references(instance, oe_model, resolver)
+        return self._check(self._get_oerp_id(content_type, ids[0], oe_model, resolver))
+
+    def get_external_content(self, instance, oe_model):
+        content_type, oe_model, ids = self.get_references(instance, oe_model)
+        if ids[0] is None:
+            return False
+        return external_id(content_type, ids[0], oe_model)
 
 
 class ForeignIdField(GetField):
@@ -107,13 +305,23 @@ class ForeignIdField(GetField):
         self.foreign_oe_model = foreign_oe_model
         super(ForeignIdField, self).__init__(attr_name, param_name, default, actions)
 
-    def get_content(self, instance, oe_model):
+    def get_references(self, instance, oe_model):
         foreign_id = self._get_value(instance)
         content_type = self._get_model_ctype(self.param_name)
         if self.foreign_oe_model:
             #get id for a different oe model if specified
             oe_model = self.foreign_oe_model
-        return self._check(self._get_oerp_id(content_type, foreign_id, oe_model))
+        return (content_type, oe_model, [foreign_id])
+
+    def get_content(self, instance, oe_model, resolver=None):
+        content_type, oe_model, ids = self._get_references(instance, oe_model, resolver)
+        return self._check(self._get_oerp_id(content_type, ids[0], oe_model, resolver))
+
+    def get_external_content(self, instance, oe_model):
+        content_type, oe_model, ids = self.get_references(instance, oe_model)
+        if ids[0] is None:
+            return False
+        return external_id(content_type, ids[0], oe_model)
 
 
 class ManyForeignIdField(GetField):
@@ -123,22 +331,34 @@ class ManyForeignIdField(GetField):
         self.foreign_oe_model = foreign_oe_model
         super(ManyForeignIdField, self).__init__(attr_name, param_name, default, actions)
 
-    def get_content(self, instance, oe_model):
+    def get_references(self, instance, oe_model):
         foreign_ids = self._get_m2m_ids(instance)
         content_type = self._get_model_ctype(self.param_name)
         if self.foreign_oe_model:
             #get id for a different oe model if specified
             oe_model = self.foreign_oe_model
+        return (content_type, oe_model, foreign_ids)
+
+    def get_content(self, instance, oe_model, resolver=None):
+        content_type, oe_model, foreign_ids = self._get_references(
+            instance, oe_model, resolver)
+        if resolver is not None:
+            #resolve all ids at once
+            resolver.load(content_type, oe_model, foreign_ids)
         oe_ids = []
         for id in foreign_ids:
-            oe_id = self._get_oerp_id(content_type, id, oe_model)
+            oe_id = self._get_oerp_id(content_type, id, oe_model, resolver)
             if oe_id: oe_ids.append(oe_id)
         return self._check(oe_ids)
 
+    def get_external_content(self, instance, oe_model):
+        content_type, oe_model, foreign_ids = self.get_references(instance, oe_model)
+        return [external_id(content_type, id, oe_model) for id in foreign_ids]
+
 
 class BoolField(GetField):
     ''' Check whether field content has specific value '''
-    def get_content(self, instance, oe_model):
+    def get_content(self, instance, oe_model, resolver=None):
         if self.param_name is None:
             #FIXME: This will not allow to check whether a field is None...
             self.param_name = True
@@ -149,12 +369,14 @@ class StaticField(GetField):
     def __init__(self, value, actions=['create']):
         self.value = value
         super(StaticField, self).__init__(value, actions=actions)
-    def get_content(self, instance, oe_model):
+    def _compile(self, attr_name):
+        return ()
+    def get_content(self, instance, oe_model, resolver=None):
         return self._check(self.value)
 
 
 class SelectionField(GetField):
-    def get_content(self, instance, oe_model):
+    def get_content(self, instance, oe_model, resolver=None):
         value = self._get_value(instance)
         try:
             return self._check(self.param_name[value])
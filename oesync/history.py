@@ -0,0 +1,140 @@
+from django.utils import timezone
+from oesync.models import SyncRun, SyncBatch
+from oesync.metrics import metrics
+from contextlib import contextmanager
+import threading
+import time
+import logging
+
+log = logging.getLogger('OESync')
+
+_local = threading.local()
+
+
+
+class SyncRecorder(object):
+    '''
+    Counts the objects a sync run pushes, by content type and action, and
+    the OpenErp calls made by the process meanwhile. finish() saves them
+    as a SyncRun with one SyncBatch per content type and action. Runs that
+    did not sync anything are only saved if keep is set.
+    '''
+    def __init__(self, trigger, keep=False):
+        self.run = SyncRun(trigger=trigger)
+        self.keep = keep
+        #True or False once the outcome of the run is known
+        self.result = None
+        self._lock = threading.Lock()
+        #{(content type id, action): SyncBatch}
+        self._batches = {}
+        #calls, errors and seconds of other processes (see merge())
+        self._rpc_merged = (0, 0, 0.)
+
+    def start(self):
+        self.run.started = timezone.now()
+        self._started = time.time()
+        self._rpc_before = _rpc_totals()
+
+    def add(self, content_type_id, action, objects, failed=0, seconds=0.):
+        ''' Count a batch of objects '''
+        with self._lock:
+            try:
+                batch = self._batches[(content_type_id, action)]
+            except KeyError:
+                batch = self._batches[(content_type_id, action)] = SyncBatch(
+                    content_type_id=content_type_id, action=action)
+            batch.batches += 1
+            batch.object_count += objects
+            batch.failed += failed
+            batch.seconds += seconds
+
+    def counts(self):
+        '''
+        Return what was counted so far as a picklable dict, for merging into
+        the recorder of another process (e.g. by the shard workers)
+        '''
+        with self._lock:
+            batches = [(batch.content_type_id, batch.action, batch.batches,
+                        batch.object_count, batch.failed, batch.seconds) \
+                for batch in self._batches.values()]
+        calls, errors, seconds = _rpc_totals()
+        return {
+            'batches': batches,
+            'rpc': (calls - self._rpc_before[0], errors - self._rpc_before[1],
+                    seconds - self._rpc_before[2]),
+        }
+
+    def merge(self, counts):
+        ''' Add the counts() of another recorder '''
+        for content_type_id, action, batches, objects, failed, seconds in \
+                counts['batches']:
+            self.add(content_type_id, action, objects, failed, seconds)
+            with self._lock:
+                self._batches[(content_type_id, action)].batches += batches - 1
+        with self._lock:
+            self._rpc_merged = tuple([mine + theirs for mine, theirs in \
+                zip(self._rpc_merged, counts['rpc'])])
+
+    def finish(self):
+        run = self.run
+        run.finished = timezone.now()
+        run.seconds = time.time() - self._started
+        run.result = self.result
+        with self._lock:
+            batches = list(self._batches.values())
+        run.object_count = sum([batch.object_count for batch in batches])
+        run.failed = sum([batch.failed for batch in batches])
+        calls, errors, seconds = _rpc_totals()
+        run.rpc_calls = calls - self._rpc_before[0] + self._rpc_merged[0]
+        run.rpc_errors = errors - self._rpc_before[1] + self._rpc_merged[1]
+        run.rpc_seconds = seconds - self._rpc_before[2] + self._rpc_merged[2]
+        if not batches and not self.keep:
+            return None
+        run.save()
+        for batch in batches:
+            batch.run = run
+        SyncBatch.objects.bulk_create(batches)
+        log.info('Sync run %s: %s objects (%s failed) in %.1fs' % (
+            run.id, run.object_count, run.failed, run.seconds))
+        return run
+
+
+
+def current():
+    ''' Return the SyncRecorder of the run of this thread, None if there is none '''
+    return getattr(_local, 'recorder', None)
+
+
+@contextmanager
+def recording(trigger, keep=False, separate=False):
+    '''
+    Record the sync run done meanwhile by this thread as a SyncRun. Within
+    a recording, further recordings (e.g. the one of syncnow() within the
+    one of the admin action calling it) add to the outer run, unless
+    separate is set: then they are saved as a run of their own, which the
+    outer run does not include.
+    '''
+    outer = current()
+    if outer is not None and not separate:
+        outer.keep = outer.keep or keep
+        yield outer
+        return
+    recorder = SyncRecorder(trigger, keep)
+    recorder.start()
+    _local.recorder = recorder
+    try:
+        yield recorder
+    finally:
+        _local.recorder = outer
+        recorder.finish()
+
+
+def _rpc_totals():
+    ''' Return the calls, errors and seconds of all OpenErp calls so far '''
+    calls = errors = 0
+    seconds = 0.
+    for metric in metrics.as_dict().values():
+        calls += metric['count']
+        errors += metric['errors']
+        seconds += metric['seconds']
+    return calls, errors, seconds
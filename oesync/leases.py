@@ -0,0 +1,41 @@
+from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
+
+
+
+def free(now=None):
+    ''' Return a Q selecting the mappers that are not leased (see oesync.shards) '''
+    now = now or timezone.now()
+    return Q(lease_expires__isnull=True) | Q(lease_expires__lt=now)
+
+
+def unleased(queryset, now=None):
+    '''
+    Filter a queryset of mappers for those not leased by a shard worker:
+    the worker holding the lease syncs them
+    '''
+    return queryset.filter(free(now))
+
+
+def is_leased(mapper, now=None):
+    ''' Return whether a (loaded) mapper is leased by a shard worker '''
+    return mapper.lease_expires is not None and \
+        mapper.lease_expires >= (now or timezone.now())
+
+
+def claim(queryset, owner, limit, lease_time):
+    '''
+    Set a lease on up to limit mappers of a queryset that are not leased by
+    another worker, and return the mappers that were claimed.
+    '''
+    now = timezone.now()
+    ids = list(queryset.filter(free(now)).order_by(
+        'date_created', 'id').values_list('id', flat=True)[:limit])
+    if not ids:
+        return []
+    #only one worker gets a mapper, even if several selected it
+    queryset.model.objects.filter(free(now), id__in=ids).update(
+        lease_owner=owner, lease_expires=now + timedelta(seconds=lease_time))
+    return list(queryset.model.objects.filter(
+        id__in=ids, lease_owner=owner).order_by('date_created', 'id'))
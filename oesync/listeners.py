@@ -1,21 +1,36 @@
 from django.contrib.contenttypes.models import ContentType
 from django.db.models.query import QuerySet
+from django.db.models import Q
+from django.db import connection
 from django.conf import settings
+from django.utils import timezone
 from oesync.models import ObjMapper, DeletedObjMapper
-from oesync.oerprpc import Oerp, OerpSyncFailed
+from oesync.oerprpc import Oerp, OerpSyncFailed, OerpBatchFailed, pool, \
+    resolve_existence
 from oesync.modelmapper import ModelMapper, MappingError
+from oesync.fields import IdResolver, external_id
+from oesync.coalesce import SaveCoalescer
+from oesync.scheduler import SyncScheduler
+from oesync import payload, loader, profiling, history, leases, retry
+from multiprocessing.pool import ThreadPool
 from datetime import date
+import heapq
+import time
 import logging
 
 log = logging.getLogger('OESync')
 
+#order of the sync actions for mappers with equal timestamps
+_sync_actions = ('delete', 'create', 'update')
+
 
 
 
 __all__ = [
     'on_delete_obj_mapper',
     'on_save_obj_mapper',
-    'on_order_success_mapper'
+    'on_order_success_mapper',
+    'coalescer',
 ]
 
 
@@ -31,76 +46,168 @@ def on_delete_obj_mapper(sender, instance, **kwargs):
         object_id = instance.id,
         parent = None)
 
-    #check whether live sync is activated and set sync_now accordingly
+    del_mappers = list(del_mappers)
+
+    #check whether live sync is activated and set sync_now accordingly;
+    #objects of mappers leased by a shard worker are deleted later
     if settings.OPENERP_SETTINGS['MODE'] == 'live':
-        _set_attribute(del_mappers, 'sync_now', True)
+        _set_attribute([mapper for mapper in del_mappers \
+            if not leases.is_leased(mapper)], 'sync_now', True)
 
     #sync...
-    res = all(map(_delete_for_mapper, del_mappers))
+    res = _delete_batch(del_mappers)
     log.debug('Sync of \'%s\' finished with result: %s' % (instance, res))
 
 
 
-def _delete_for_mapper(mapper, mapping_table=None, parent=None):
-    ''' Delete the OE object(s) corresponding to the given mapper '''
-
-    #get model corresponding to specified mapper
-    obj_model = mapper.content_type.model_class()
-
-    if mapping_table is None:
-        #get root mapping if no mapping is specified
-        mapping_table = ModelMapper.get_for_model(obj_model)[mapper.oerp_model]
-
-    res = True
-
-    #copy mapper for future reference
-    mapper_del = DeletedObjMapper.objects.get_or_create(
-        content_type = mapper.content_type,
-        oerp_model = mapper.oerp_model,
-        oerp_id = mapper.oerp_id,
-        parent = parent)[0]
-
-    #find child mappers
-    child_mappers = mapper.__class__.objects.filter(parent = mapper)
+def _delete_batch(mappers, existing=None):
+    '''
+    Delete the OE objects corresponding to the given root mappers (either
+    all ObjMappers or all DeletedObjMappers) and their child mappers.
+    Objects are unlinked with one call per OE model, children before
+    their parents. ObjMappers are replaced by DeletedObjMappers.
+    '''
+    if not mappers:
+        return True
+
+    levels = _plan_deletion(mappers)
+    #{mapper id: error}
+    failed = {}
+
+    #delete child objects first
+    for level in reversed(levels):
+        to_unlink = {}
+        for mapper, plan in level:
+            #check whether objects corresponding to this oe model can be deleted
+            mapper.auto_del = plan.auto_delete
+            #only try to delete if the object is not deleted
+            #automatically with its parent object
+            if mapper.sync_now and mapper.oerp_id and not mapper.auto_del:
+                to_unlink.setdefault(mapper.oerp_model, []).append(mapper)
+        for oerp_model, model_mappers in to_unlink.items():
+            failed.update(_unlink_batch(oerp_model, model_mappers, existing))
+
+    if isinstance(mappers[0], DeletedObjMapper):
+        _update_deleted_mappers(levels, failed)
+    else:
+        _replace_mappers(levels, failed)
 
-    for child in child_mappers:
-        #recursively delete child objects
-        child.sync_now = mapper.sync_now
-        res = res and _delete_for_mapper(
-            mapper = child,
-            mapping_table = mapping_table[child.oerp_model],
-            parent = mapper_del)
+    return not failed
 
-    #check whether objects corresponding to this oe model can be deleted
-    mapper.auto_del = ModelMapper.check_auto_del(mapping_table)
 
+def _plan_deletion(mappers):
+    '''
+    Collect the given root mappers and all their child mappers with one
+    query per level. Returns a list of levels, each holding
+    (mapper, plan) tuples.
+    '''
+    level = [(mapper, _get_plan(mapper, 'delete')) for mapper in mappers]
+
+    levels = []
+    mapper_class = mappers[0].__class__
+    while level:
+        levels.append(level)
+        parents = dict((mapper.id, mapper) for mapper, plan in level)
+        level = []
+        for child in mapper_class.objects.filter(parent__in=parents.keys()):
+            parent = parents[child.parent_id]
+            child.sync_now = parent.sync_now
+            child.mapping_path = _mapping_path(parent) + (child.oerp_model,)
+            level.append((child, _get_plan(child, 'delete')))
+    return levels
+
+
+def _unlink_batch(oerp_model, mappers, existing=None):
+    '''
+    Unlink the existing OE objects of the given mappers with a single call,
+    falling back to one call per object if it fails. Returns the errors
+    of the mappers whose objects could not be deleted by mapper id.
+    '''
+    unknown = [(oerp_model, mapper.oerp_id) for mapper in mappers \
+        if _known_existence(mapper, existing) is None]
+    if unknown:
+        existing = dict(existing or {})
+        existing.update(resolve_existence(unknown))
+
+    failed = {}
+    ids = []
+    for mapper in mappers:
+        try:
+            exists = _known_existence(mapper, existing)
+            if exists is None:
+                exists = Oerp(oerp_model, mapper.oerp_id).exists
+        except Exception as errmsg:
+            log.error('Sync failed -- %s' % errmsg)
+            failed[mapper.id] = errmsg
+        else:
+            #deleting non-existent objects is OK and is not logged
+            if exists:
+                ids.append(mapper.oerp_id)
+    if not ids:
+        return failed
 
     try:
-        if mapper.sync_now:
-            #Automatic synchronization is turned on
-            oerp_object = Oerp(mapper.oerp_model, mapper.oerp_id)
-
-            #only try to delete if the object exists and is not
-            #deleted automatically with its parent object
-            if oerp_object.exists and not mapper.auto_del:
-                oerp_object.delete()
-            #deleting non-existent objects is OK and is not logged
-            mapper_del.is_dirty = False
+        Oerp(oerp_model).delete_many(ids)
+    except OerpSyncFailed as errmsg:
+        log.warning('Batch failed, deleting objects one by one -- %s' % errmsg)
+        for mapper in mappers:
+            if mapper.oerp_id not in ids:
+                continue
+            try:
+                Oerp(oerp_model, mapper.oerp_id, True).delete()
+            except Exception as errmsg:
+                log.error('Sync failed -- %s' % errmsg)
+                failed[mapper.id] = errmsg
+    return failed
+
+
+def _replace_mappers(levels, failed):
+    '''
+    Store the planned ObjMappers as DeletedObjMappers (bulk-inserted per
+    level) and delete the originals.
+    '''
+    parents = {}
+    for depth, level in enumerate(levels):
+        deleted = []
+        for mapper, plan in level:
+            mapper_del = DeletedObjMapper(
+                content_type = mapper.content_type,
+                oerp_model = mapper.oerp_model,
+                oerp_id = mapper.oerp_id,
+                parent = parents.get(mapper.parent_id),
+                #objects that are not synced now will be deleted later
+                is_dirty = not mapper.sync_now or mapper.id in failed)
+            if mapper.id in failed:
+                retry.failed(mapper_del, failed[mapper.id])
+            deleted.append(mapper_del)
+
+        if depth == 0:
+            #root mappers are saved one by one to get their ids
+            for mapper_del in deleted:
+                mapper_del.save()
+            parents = dict((mapper.id, mapper_del) for \
+                (mapper, plan), mapper_del in zip(level, deleted))
         else:
-            #this object will be deleted later
-            mapper_del.is_dirty = True
-    except Exception as errmsg:
-        #the sync failed
-        log.error('Sync failed -- %s' % errmsg)
-        mapper_del.is_dirty = True
-        res = False
-    finally:
-        #store mapper in deleted mappers and delete original mapper
-        if mapper != mapper_del:
-            mapper.delete()
-        mapper_del.save()
+            DeletedObjMapper.objects.bulk_create(deleted)
+            if depth + 1 < len(levels):
+                #reload the inserted mappers to link them to their children
+                new_ids = dict(((mapper_del.parent_id, mapper_del.oerp_model), mapper_del) \
+                    for mapper_del in DeletedObjMapper.objects.filter(
+                        parent__in=[p.id for p in parents.values()]))
+                parents = dict((mapper.id, new_ids[(parents[mapper.parent_id].id, mapper.oerp_model)]) \
+                    for mapper, plan in level)
 
-    return res
+    #deleting the root mappers deletes their children as well
+    ObjMapper.objects.filter(id__in=[mapper.id for mapper, plan in levels[0]]).delete()
+
+
+def _update_deleted_mappers(levels, failed):
+    ''' Update the dirty flags and attempts of the planned DeletedObjMappers '''
+    synced = [mapper.id for level in levels for mapper, plan in level \
+        if mapper.sync_now and mapper.id not in failed]
+    DeletedObjMapper.objects.filter(id__in=synced).update(
+        is_dirty=False, attempts=0, last_error='', next_attempt=None)
+    retry.record_failures(DeletedObjMapper, failed)
 
 
 
@@ -115,10 +222,7 @@ def on_save_obj_mapper(sender, instance, **kwargs):
 
     res = True
 
-    #get root mapping since no mapping is specified
-    mapping = ModelMapper.get_for_model(sender)
-
-    for oerp_model in mapping.keys():
+    for oerp_model in ModelMapper.get_root_models(sender):
         # There is no mapper object yet.
         mapper = ObjMapper.objects.get_or_create(
             content_type = ContentType.objects.get_for_model(sender),
@@ -126,95 +230,420 @@ def on_save_obj_mapper(sender, instance, **kwargs):
             oerp_model = oerp_model,
             parent = None)[0]
 
-        #check whether live sync is active
-        if settings.OPENERP_SETTINGS['MODE'] == 'live':
+        #check whether live sync is active; mappers leased by a shard
+        #worker are left to it
+        if settings.OPENERP_SETTINGS['MODE'] == 'live' and \
+                not leases.is_leased(mapper):
             mapper.sync_now = True
 
+            if coalescer.active():
+                #sync once the request is finished
+                if coalescer.add((mapper.content_type_id, mapper.object_id,
+                                  oerp_model), mapper.id):
+                    mapper.save_state('dirty')
+                continue
+
         #sync object
         res = res and _save_for_mapper(mapper)
 
     log.debug('Sync of \'%s\' finished with result: %s' % (instance, res))
 
 
-def _save_for_mapper(mapper, mapping_table=None):
+def _save_coalesced(mapper_ids):
+    ''' Sync the mappers collected by the coalescer '''
+    mappers = ObjMapper.objects.in_bulk(mapper_ids)
+    for mapper_id in mapper_ids:
+        #mappers of deleted objects are gone
+        if mapper_id in mappers:
+            if leases.is_leased(mappers[mapper_id]):
+                continue
+            mappers[mapper_id].sync_now = True
+            _save_for_mapper(mappers[mapper_id])
 
-    #get model corresponding to specified mapper
-    obj_model = mapper.content_type.model_class()
 
-    if mapping_table is None:
-        #get root mapping if no mapping is specified
-        mapping_table = ModelMapper.get_for_model(obj_model)[mapper.oerp_model]
+coalescer = SaveCoalescer(_save_coalesced)
+scheduler = SyncScheduler(ModelMapper)
+
+
+def _get_plan(mapper, action):
+    ''' Return the compiled mapping plan for a mapper and action '''
+    content_type = ContentType.objects.get_for_id(mapper.content_type_id)
+    return ModelMapper.get_plan(
+        content_type.model_class(), _mapping_path(mapper), action)
 
-    res = True
 
+def _mapping_path(mapper):
+    '''
+    Return the OE models of a mapper and its parents, starting at the root
+    (see MappingPlan). Child mappers loaded along with their parents know
+    theirs already (see _get_child_mappers and _plan_deletion), others load
+    their parents.
+    '''
     try:
-        if mapper.sync_now:
-            #The object is synced now
-
-            oerp_object = Oerp(mapper.oerp_model, mapper.oerp_id)
-
-            if oerp_object.exists:
-                #object has to be updated
-                data_dict = ModelMapper.parse_data(
-                    mapper.object,
-                    mapping_table,
-                    mapper.oerp_model,
-                    'update')[0]
-                oerp_object.update(data_dict)
-            else:
-                #create object if it doesn't exist
-                data_dict = ModelMapper.parse_data(
-                    mapper.object,
-                    mapping_table,
-                    mapper.oerp_model,
-                    'create')[0]
-                oerp_object.create(data_dict)
+        return mapper.mapping_path
+    except AttributeError:
+        if mapper.parent_id is None:
+            mapper.mapping_path = (mapper.oerp_model,)
+        else:
+            parent = mapper.__class__.objects.get(id=mapper.parent_id)
+            mapper.mapping_path = _mapping_path(parent) + (mapper.oerp_model,)
+        return mapper.mapping_path
 
-                #update mapper
-                mapper.oerp_id = oerp_object.id
 
-            #consider sync successful if we get to this point
-            mapper.save_state('clean')
+def _save_for_mapper(mapper, existing=None):
 
-        else:
-            #This object is synced later. Only change mapper status...
-            mapper.save_state('dirty')
+    if mapper.sync_now:
+        #The object is synced now
+        return _save_batch([mapper], existing)
 
-    except MappingError as errmsg:
-        log.error('Sync failed -- %s' % errmsg)
-        mapper.save_state('dirty')
-        res = False
+    #This object is synced later. Only change mapper status...
+    mapper.save_state('dirty')
+    return True
 
-    except OerpSyncFailed as errmsg:
-        log.error('Sync failed -- %s' % errmsg)
-        mapper.save_state('dirty')
-        res = False
 
+def _save_batch(mappers, existing=None):
+    '''
+    Create or update the OE objects of several mappers sharing the same
+    content type and OE model, then sync their child mappers the same way.
+    '''
+    oerp_object = Oerp(mappers[0].oerp_model)
+    if settings.OPENERP_SETTINGS.get('EXTERNAL_IDS', False):
+        synced, res = _upsert_batch(oerp_object, mappers)
     else:
-        #the sync was successful
-        #run this recursively if child mappings are found
-        children = ModelMapper.get_children(mapping_table)
-        for child_model, child_mapping in children.items():
-            #create child mapper
-            log.debug('Mapping child model (%s)' % child_model)
-            child_mapper = ObjMapper.objects.get_or_create(
-                parent = mapper,
-                content_type = mapper.content_type,
-                object_id = mapper.object_id,
-                oerp_model = child_model,)[0]
-            child_mapper.sync_now = mapper.sync_now
+        synced, res = _write_batch(oerp_object, mappers, existing)
+
+    for mapper in synced:
+        #consider sync successful if we get to this point
+        mapper.save_state('clean')
 
-            res = res and _save_for_mapper(child_mapper, child_mapping)
+    #run this recursively if child mappings are found
+    for child_model in _get_plan(mappers[0], 'create').children:
+        log.debug('Mapping child model (%s)' % child_model)
+        child_mappers = _get_child_mappers(synced, child_model)
+        if child_mappers:
+            res = _save_batch(child_mappers, existing) and res
 
     return res
 
 
+def _get_child_mappers(mappers, oerp_model):
+    '''
+    Return the child mappers of the given mappers (sharing their content
+    type) for an OE model, in the order of the mappers. Missing child
+    mappers are created in bulk.
+    '''
+    if not mappers:
+        return []
+    parents = dict((mapper.id, mapper) for mapper in mappers)
+    children = ObjMapper.objects.filter(parent__in=list(parents), oerp_model=oerp_model)
+    found = dict((child.parent_id, child) for child in children)
+    missing = [mapper for mapper in mappers if mapper.id not in found]
+    if missing:
+        ObjMapper.objects.bulk_create([ObjMapper(
+                parent_id = mapper.id,
+                content_type_id = mapper.content_type_id,
+                object_id = mapper.object_id,
+                oerp_model = oerp_model,
+                is_root = None) \
+            for mapper in missing])
+        #bulk_create() does not set the ids
+        found.update((child.parent_id, child) for child in ObjMapper.objects.filter(
+            parent__in=[mapper.id for mapper in missing], oerp_model=oerp_model))
+
+    child_mappers = []
+    for mapper in mappers:
+        child_mapper = found[mapper.id]
+        child_mapper.sync_now = mapper.sync_now
+        child_mapper.mapping_path = _mapping_path(mapper) + (oerp_model,)
+        child_mappers.append(child_mapper)
+    return child_mappers
+
+
+def _write_batch(oerp_object, mappers, existing=None):
+    '''
+    Create the OE objects of mappers that do not exist yet and update the
+    others. Returns the synced mappers and whether all of them were synced.
+    '''
+    crt_plan = _get_plan(mappers[0], 'create')
+    upd_plan = _get_plan(mappers[0], 'update')
+    res = True
+
+    #sort objects by action
+    crt_mappers = []
+    upd_mappers = []
+    for mapper in mappers:
+        exists = _known_existence(mapper, existing)
+        if exists is None:
+            exists = Oerp(oerp_object.model_name, mapper.oerp_id).exists
+        if exists:
+            #object has to be updated
+            upd_mappers.append(mapper)
+        else:
+            #create object if it doesn't exist
+            crt_mappers.append(mapper)
+
+    #load the objects and resolve the ids of all related objects at once
+    model = _model_name(mappers[0])
+    with profiling.phase('load', model):
+        resolver = IdResolver()
+        resolver.prefetch(crt_plan, [mapper.object for mapper in crt_mappers])
+        resolver.prefetch(upd_plan, [mapper.object for mapper in upd_mappers])
+
+    #collect data for all objects
+    crt_items = []
+    upd_items = []
+    with profiling.phase('map', model):
+        for plan, plan_mappers, items in ((crt_plan, crt_mappers, crt_items),
+                                          (upd_plan, upd_mappers, upd_items)):
+            for mapper in plan_mappers:
+                try:
+                    items.append(
+                        (mapper, ModelMapper.run_plan(plan, mapper.object, resolver)))
+                except MappingError as errmsg:
+                    log.error('Sync failed -- %s' % errmsg)
+                    mapper.save_state('dirty', errmsg)
+                    res = False
+
+    if oerp_object.model_name in settings.OPENERP_SETTINGS.get('LOAD_MODELS', ()):
+        synced = _load_batch(oerp_object, crt_items, upd_items)
+    else:
+        synced = _create_batch(oerp_object, crt_items) + \
+                 _update_batch(oerp_object, upd_items)
+    return synced, res and len(synced) == len(crt_items) + len(upd_items)
+
+
+def _upsert_batch(oerp_object, mappers):
+    '''
+    Create or update the OE objects of the given mappers with a single call
+    to the oesync_server addon. Objects are identified by external ids, so
+    neither their existence nor the ids of related objects have to be
+    looked up in OE. Objects synced before are sent with their oerp_id, and
+    related objects with the oerp_ids of their mappers, so that objects
+    synced without external ids are bound to them instead of being created
+    again. If the batch fails, the objects are sent one by one. Returns
+    the synced mappers and whether all of them were synced.
+    '''
+    res = True
+    items = []
+    model = _model_name(mappers[0])
+    plans = [_get_plan(mapper, mapper.oerp_id is None and 'create' or 'update') \
+        for mapper in mappers]
+    resolver = IdResolver()
+    with profiling.phase('load', model):
+        objects = [mapper.object for mapper in mappers]
+        for plan in set(plans):
+            resolver.prefetch(plan, [obj for obj, obj_plan \
+                in zip(objects, plans) if obj_plan is plan])
+    with profiling.phase('map', model):
+        for mapper, obj, plan in zip(mappers, objects, plans):
+            try:
+                items.append((mapper, ModelMapper.run_plan(
+                    plan, obj, external_ids=True)))
+            except MappingError as errmsg:
+                log.error('Sync failed -- %s' % errmsg)
+                mapper.save_state('dirty', errmsg)
+                res = False
+
+    #objects that were synced before only need their changes
+    synced, changed_items = _split_unchanged(oerp_object,
+        [item for item in items if item[0].oerp_id is not None])
+    changed_items.extend([(mapper, data, data) \
+        for mapper, data in items if mapper.oerp_id is None])
+
+    known_ids = resolver.known_ids()
+    ids, errors = _upsert(oerp_object, [(_external_id(mapper), mapper.oerp_id or False,
+        changed) for mapper, data, changed in changed_items], known_ids)
+
+    #objects deleted in OE are created again, with all their data
+    missing = [index for index, id in enumerate(ids) if id is False]
+    if missing:
+        log.warning('%s objects of %s no longer exist, creating them again' % (
+            len(missing), oerp_object))
+        records = []
+        for index in list(missing):
+            mapper, data, changed = changed_items[index]
+            try:
+                data = ModelMapper.run_plan(_get_plan(mapper, 'create'),
+                    mapper.object, external_ids=True)
+            except MappingError as errmsg:
+                log.error('Sync failed -- %s' % errmsg)
+                errors[index] = errmsg
+                missing.remove(index)
+                continue
+            changed_items[index] = (mapper, data, data)
+            records.append((_external_id(mapper), False, data))
+        recreated, recreate_errors = _upsert(oerp_object, records, known_ids)
+        for position, index in enumerate(missing):
+            ids[index] = recreated[position]
+            if position in recreate_errors:
+                errors[index] = recreate_errors[position]
+
+    for index, ((mapper, data, changed), id) in enumerate(zip(changed_items, ids)):
+        if id:
+            mapper.oerp_id = id
+            payload.remember(mapper, data)
+            synced.append(mapper)
+        else:
+            mapper.save_state('dirty', errors.get(index, 'Upsert failed'))
+    return synced, res and len(synced) == len(items)
+
+
+def _upsert(oerp_object, records, known_ids):
+    '''
+    Send (external id, oerp_id, data) records with one upsert call, or one
+    by one if that fails. Returns their ids (None for those that failed)
+    and the errors by index.
+    '''
+    if not records:
+        return [], {}
+    try:
+        return oerp_object.upsert(records, known_ids), {}
+    except OerpSyncFailed as errmsg:
+        log.warning('Batch failed, syncing objects one by one -- %s' % errmsg)
+    ids = []
+    errors = {}
+    for index, record in enumerate(records):
+        try:
+            ids.extend(oerp_object.upsert([record], known_ids))
+        except OerpSyncFailed as errmsg:
+            log.error('Sync failed -- %s' % errmsg)
+            ids.append(None)
+            errors[index] = errmsg
+    return ids, errors
+
+
+def _model_name(mapper):
+    ''' Return the name of the Satchmo model of a mapper '''
+    return ContentType.objects.get_for_id(mapper.content_type_id).model
+
+
+def _external_id(mapper):
+    ''' Return the external id of the OE object of a mapper '''
+    return external_id(ContentType.objects.get_for_id(mapper.content_type_id),
+        mapper.object_id, _get_plan(mapper, 'create').external_model)
+
+
+def _create_batch(oerp_object, items):
+    '''
+    Create OE objects for the given (mapper, data) tuples. If the batch
+    fails, the remaining objects are created one by one so that only the
+    bad records fail. Returns the mappers that were synced.
+    '''
+    if not items:
+        return []
+    try:
+        ids = oerp_object.create_many([data for mapper, data in items])
+    except OerpBatchFailed as errmsg:
+        log.warning('Batch failed, syncing remaining objects one by one -- %s' % errmsg)
+        ids = errmsg.done
+
+    synced = []
+    for (mapper, data), id in zip(items, ids):
+        mapper.oerp_id = id
+        payload.remember(mapper, data)
+        synced.append(mapper)
+
+    for mapper, data in items[len(ids):]:
+        single_object = Oerp(oerp_object.model_name)
+        try:
+            single_object.create(data)
+        except OerpSyncFailed as errmsg:
+            log.error('Sync failed -- %s' % errmsg)
+            mapper.save_state('dirty', errmsg)
+        else:
+            #update mapper
+            mapper.oerp_id = single_object.id
+            payload.remember(mapper, data)
+            synced.append(mapper)
+    return synced
+
+
+def _update_batch(oerp_object, items):
+    '''
+    Update the OE objects of the given (mapper, data) tuples, falling back
+    to one call per object if the batch fails. Only the fields that changed
+    since the last successful sync are written; objects without changes are
+    not written at all. Returns the mappers that were synced.
+    '''
+    if not items:
+        return []
+    synced, changed_items = _split_unchanged(oerp_object, items)
+    try:
+        oerp_object.write_many(
+            [(mapper.oerp_id, changed) for mapper, data, changed in changed_items])
+    except OerpBatchFailed as errmsg:
+        log.warning('Batch failed, syncing remaining objects one by one -- %s' % errmsg)
+        done = set(errmsg.done)
+    else:
+        done = set(mapper.oerp_id for mapper, data, changed in changed_items)
+
+    for mapper, data, changed in changed_items:
+        if mapper.oerp_id not in done:
+            try:
+                Oerp(oerp_object.model_name, mapper.oerp_id, True).update(changed)
+            except OerpSyncFailed as errmsg:
+                log.error('Sync failed -- %s' % errmsg)
+                mapper.save_state('dirty', errmsg)
+                continue
+        payload.remember(mapper, data)
+        synced.append(mapper)
+    return synced
+
+
+def _load_batch(oerp_object, crt_items, upd_items):
+    '''
+    Create and update the OE objects of the given (mapper, data) tuples with
+    one load() call each (see oesync.loader). New objects are imported
+    under their external ids, so an import that was interrupted before the
+    mappers were saved does not create them twice. Objects without changes
+    are skipped. Returns the mappers that were synced.
+    '''
+    synced, changed_items = _split_unchanged(oerp_object, upd_items)
+    groups = (
+        ('id', [(mapper, data, _external_id(mapper)) for mapper, data in crt_items]),
+        ('.id', [(mapper, data, mapper.oerp_id) for mapper, data, changed in changed_items]),
+    )
+    for key_field, items in groups:
+        ids = loader.load(oerp_object, key_field,
+                          [(key, data) for mapper, data, key in items])
+        for (mapper, data, key), id in zip(items, ids):
+            if id is None:
+                mapper.save_state('dirty', 'Rejected by load()')
+                continue
+            mapper.oerp_id = id
+            payload.remember(mapper, data)
+            synced.append(mapper)
+    return synced
+
+
+def _split_unchanged(oerp_object, items):
+    '''
+    Split (mapper, data) tuples into the mappers whose data has not changed
+    since their last sync and (mapper, data, changed data) tuples of the
+    others (see oesync.payload).
+    '''
+    unchanged = []
+    changed_items = []
+    for mapper, data in items:
+        changed = payload.changed_data(mapper, data)
+        if changed:
+            changed_items.append((mapper, data, changed))
+        else:
+            log.debug('Skipping unchanged %s (id %s)' % (oerp_object, mapper.oerp_id))
+            payload.remember(mapper, data)
+            unchanged.append(mapper)
+    return unchanged, changed_items
+
+
 
 def on_order_success_mapper(sender, order, **kwargs):
     '''
     Confirm the order and pay the resulting invoice
     '''
 
+    #the order and its items have to be synced first
+    coalescer.flush()
+
     #get object mapper
     try:
         mapper = ObjMapper.objects.get_for_object(order, 'sale.order')
@@ -226,14 +655,23 @@ def on_order_success_mapper(sender, order, **kwargs):
         return False
         #stop here.
 
-    if settings.OPENERP_SETTINGS['MODE'] == 'live':
+    if settings.OPENERP_SETTINGS['MODE'] == 'live' and \
+            not leases.is_leased(mapper):
         #validate the order
         _validate_order_for_mapper(mapper)
+    elif settings.OPENERP_SETTINGS['MODE'] in ('live', 'queued'):
+        #let the sync worker (or the next run after the shard worker
+        #holding the lease) validate the order
+        mapper.save_state('dirty')
 
 
 
 def _validate_order_for_mapper(order_mapper):
 
+    if settings.OPENERP_SETTINGS.get('FINALIZE_ENDPOINT', False):
+        #let the oesync_server addon do everything in one call
+        return _finalize_order_for_mapper(order_mapper)
+
     #reload mapper
     order_mapper = order_mapper.__class__.objects.get(id=order_mapper.id)
 
@@ -253,13 +691,13 @@ def _validate_order_for_mapper(order_mapper):
 
     except OerpSyncFailed as errmsg:
         #Something went wrong
-        order_mapper.save_state('dirty')
+        order_mapper.save_state('dirty', errmsg)
         log.error('Sync failed -- %s' % errmsg)
         return False
 
     except KeyError:
         #The invoice doesn't seem to exist
-        order_mapper.save_state('dirty')
+        order_mapper.save_state('dirty', 'Invoice doesn\'t exist')
         log.error('Sync failed -- Invoice doesn\'t exist (order id %s)' % order.id)
         return False
 
@@ -299,24 +737,82 @@ def _validate_order_for_mapper(order_mapper):
 
         except Exception as e:
             #The creation failed
-            payment_mapper.save_state('dirty')
+            payment_mapper.save_state('dirty', e)
             log.error('Sync failed -- %s' % e)
             res = False
 
     return res
 
 
+def _finalize_order_for_mapper(order_mapper):
+    '''
+    Confirm the order, validate its invoice and add its payments with a
+    single call to the oesync_server addon. Nothing is changed in OE if
+    one of the steps fails.
+    '''
+    #reload mapper
+    order_mapper = order_mapper.__class__.objects.get(id=order_mapper.id)
+    order = order_mapper.object
+
+    #collect payments
+    payment_mappers = []
+    payments = []
+    try:
+        partner_mapper = ObjMapper.objects.get_for_object(
+                            order.contact.billing_address, 'res.partner')
+        for payment in order.payments_completed():
+            payment_mappers.append(
+                ObjMapper(object=payment, oerp_model='account.voucher'))
+            payments.append({
+                'partner_id': partner_mapper.oerp_id,
+                'account_id': settings.OPENERP_SETTINGS['ACCOUNT_ID'],
+                'journal_id': settings.OPENERP_SETTINGS['JOURNAL_ID'],
+                'period_id': date.today().month, #FIXME: find a better solution here
+                'amount': float(payment.amount),
+                'company_id': settings.OPENERP_SETTINGS['COMPANY_ID'],
+                'currency_id': settings.OPENERP_SETTINGS['CURRENCY_ID'],
+            })
+    except Exception as e:
+        order_mapper.save_state('dirty', e)
+        log.error('Sync failed -- Payments of order %s could not be prepared: %s' % (order.id, e))
+        return False
+
+    try:
+        #the order is known to exist, no need to check
+        res = Oerp('sale.order', order_mapper.oerp_id, True).finalize_order(payments)
+    except OerpSyncFailed as errmsg:
+        order_mapper.save_state('dirty', errmsg)
+        log.error('Sync failed -- %s' % errmsg)
+        return False
+
+    order_mapper.save_state('clean')
+    for payment_mapper, voucher_id in zip(payment_mappers, res['voucher_ids']):
+        payment_mapper.oerp_id = voucher_id
+        payment_mapper.save_state('clean')
+    return True
+
 
 
-def syncnow(mapper=None, queryset=QuerySet()):
+
+def syncnow(mapper=None, queryset=QuerySet(), existing=None, concurrency=1,
+            profile=False, profile_dir=None):
     '''
-    Sync unsynced data now
+    Sync unsynced data now. Objects are synced after the objects they
+    refer to (see SyncScheduler). If concurrency is greater than one,
+    chunks of independent objects are pushed by that many threads at a
+    time. If profile is set, the time spent per phase and model is saved
+    as a SyncRun (see oesync.profiling.profile), along with cProfile
+    statistics if profile_dir is given.
     '''
+    if profile or profile_dir:
+        return profiling.profile(syncnow, (mapper, queryset, existing, concurrency),
+                                 profile_dir=profile_dir)[0]
+
     #sync single object if mapper is specified
     if isinstance(mapper, DeletedObjMapper):
         #the object has to be deleted
         mapper.sync_now = True
-        return _delete_for_mapper(mapper)
+        return _delete_batch([mapper], existing)
 
     elif isinstance(mapper, ObjMapper):
         #the object has to be created/updated
@@ -326,7 +822,7 @@ def syncnow(mapper=None, queryset=QuerySet()):
         except AttributeError:
             #normal sync
             mapper.sync_now = True
-            return _save_for_mapper(mapper)
+            return _save_for_mapper(mapper, existing=existing)
         else:
             #validate the order
             if validate_order and mapper.object.status == 'New':
@@ -346,68 +842,260 @@ def syncnow(mapper=None, queryset=QuerySet()):
             mappers_all_upd = ObjMapper.objects.none()
             mappers_all_del = queryset
         else:
-            #no queryset is specified
-            mappers_all_upd = ObjMapper.objects.all()
-            mappers_all_del = DeletedObjMapper.objects.all()
+            #no queryset is specified; objects that failed before are only
+            #synced once they are due again (see oesync.retry)
+            mappers_all_upd = retry.eligible(ObjMapper.objects.all())
+            mappers_all_del = retry.eligible(DeletedObjMapper.objects.all())
+
+        #mappers leased by a shard worker are synced by that worker
+        mappers_all_upd = leases.unleased(mappers_all_upd)
+        mappers_all_del = leases.unleased(mappers_all_del)
+
+        #only sync what is dirty now; objects changed during the run are
+        #left for the next one
+        cutoff = timezone.now()
+        window_size = settings.OPENERP_SETTINGS.get('WINDOW_SIZE', 1000)
 
         crt_mappers = mappers_all_upd.filter(
             #objects to be created
             parent = None,
             is_dirty = True,
             oerp_id = None,
-            ).order_by('date_created', 'id')
-        #copy timestamp for comparison
-        _copy_attribute(crt_mappers, 'date_created', 'timestamp')
-
+            )
         mod_mappers = mappers_all_upd.filter(
             #objects to be updated
             parent = None,
             is_dirty = True,
             oerp_id__isnull = False,
-            ).order_by('date_modified')
-        _copy_attribute(mod_mappers, 'date_modified', 'timestamp')
-
+            )
         del_mappers = mappers_all_del.filter(
             #objects to be deleted
             parent = None,
             is_dirty = True
-            ).order_by('date_modified')
-        _copy_attribute(del_mappers, 'date_modified', 'timestamp')
-
-        ord_mappers = mappers_all_upd.filter(
-            #orders that might have to be validated
-            parent = None,
-            is_dirty = True,
-            content_type = ContentType.objects.get(model='order'),
-            ).order_by('date_modified')
-        _set_attribute(ord_mappers, 'validate_order', True)
+            )
+        #orders that might have to be validated
+        ord_ids = _pending_orders(mappers_all_upd)
 
-        #merge-sort mappers to synchronize objects in the right order
-        mappers = _mergesort(del_mappers, _mergesort(crt_mappers, mod_mappers))
+        #merge the mappers to synchronize objects in the right order. In the
+        #case of equal timestamps, deletions come first, then creations
+        mappers = heapq.merge(
+            _stream_mappers(del_mappers, 'date_modified', 'delete', cutoff, window_size),
+            _stream_mappers(crt_mappers, 'date_created', 'create', cutoff, window_size),
+            _stream_mappers(mod_mappers, 'date_modified', 'update', cutoff, window_size))
 
         #run sync
-        log.info('Syncing %s objects...' % (len(mappers) + len(ord_mappers)))
-        res = all(map(syncnow, mappers))
-        return res and all(map(syncnow, ord_mappers))
-
-
-def _mergesort(set1, set2):
-    ''' Mergesort two querysets by timestamp. In the case of equality, set1 dominates '''
-    mappers = []
-    while len(set1) or len(set2):
-        if len(set1) == 0 or (len(set2) and set2[0].timestamp < set1[0].timestamp):
-            #del_mapper is older
-            mappers.append(set2[0])
-            set2 = set2[1:]
+        chunk_size = settings.OPENERP_SETTINGS.get('CHUNK_SIZE', 50)
+        workers = concurrency > 1 and ThreadPool(concurrency) or None
+        res = True
+        count = 0
+        with history.recording('syncnow') as recorder:
+            try:
+                for window in _windows((item[-1] for item in mappers), window_size):
+                    #check existence of all OE objects of the window at once
+                    existing = _resolve_existence(window)
+                    count += len(window)
+                    log.info('Syncing %s objects...' % count)
+                    for stage in scheduler.get_stages(window):
+                        res = _sync_stage(stage, chunk_size, existing, workers,
+                                          recorder) and res
+            finally:
+                if workers is not None:
+                    workers.close()
+                    workers.join()
+
+            res = _validate_orders(ord_ids, window_size, recorder) and res
+            recorder.result = res
+        log.debug('Connection pool: %s' % pool.stats)
+        return res
+
+
+def _pending_orders(queryset):
+    ''' Return the ids of the dirty order mappers in a queryset '''
+    return list(queryset.filter(
+        parent = None,
+        is_dirty = True,
+        content_type = ContentType.objects.get(model='order'),
+        ).order_by('date_modified', 'id').values_list('id', flat=True))
+
+
+def _validate_orders(ord_ids, window_size, recorder=None):
+    ''' Validate the orders of the given mappers if they are still new '''
+    res = True
+    for window in _windows(ord_ids, window_size):
+        ord_mappers = ObjMapper.objects.in_bulk(window)
+        _set_attribute(ord_mappers.values(), 'validate_order', True)
+        mappers = [ord_mappers[id] for id in window if id in ord_mappers]
+        started = time.time()
+        results = [syncnow(mapper) for mapper in mappers]
+        if recorder is not None and mappers:
+            recorder.add(mappers[0].content_type_id, 'validate', len(mappers),
+                results.count(False), time.time() - started)
+        res = all(results) and res
+    return res
+
+
+def _stream_mappers(queryset, field, action, cutoff, page_size):
+    '''
+    Yield (timestamp, rank, id, mapper) tuples for the mappers of a queryset
+    whose timestamp field is not later than cutoff, in the order of the
+    timestamp. The mappers are loaded page_size at a time; the pages are
+    selected by the last (timestamp, id) seen, so they stay consistent
+    while the mappers are modified by the sync.
+    '''
+    rank = _sync_actions.index(action)
+    queryset = queryset.filter(**{'%s__lte' % field: cutoff}).order_by(field, 'id')
+    page = queryset[:page_size]
+    while True:
+        mappers = list(page)
+        for mapper in mappers:
+            mapper.timestamp = getattr(mapper, field)
+            mapper.sync_action = action
+            yield (mapper.timestamp, rank, mapper.id, mapper)
+        if len(mappers) < page_size:
+            return
+        last = mappers[-1]
+        page = queryset.filter(
+            Q(**{'%s__gt' % field: last.timestamp}) |
+            Q(**{field: last.timestamp, 'id__gt': last.id}))[:page_size]
+
+
+def _windows(items, size):
+    ''' Split an iterable into lists of at most size items '''
+    window = []
+    for item in items:
+        window.append(item)
+        if len(window) >= size:
+            yield window
+            window = []
+    if window:
+        yield window
+
+
+def _sync_stage(groups, chunk_size, existing=None, workers=None, recorder=None):
+    '''
+    Sync the independent groups of mappers of a stage (see SyncScheduler).
+    Each group is split into chunks; with a thread pool, all chunks of the
+    stage are pushed at the same time, except for the chunks of groups
+    whose objects refer to each other, which are synced one after another.
+    The chunks are counted by the given SyncRecorder.
+    '''
+    tasks = []
+    for group in groups:
+        chunks, parallel = _chunk_group(group, chunk_size)
+        if parallel:
+            tasks.extend([[chunk] for chunk in chunks])
         else:
-            mappers.append(set1[0])
-            set1 = set1[1:]
-    return mappers
+            tasks.append(chunks)
+    if workers is None or len(tasks) == 1:
+        return all([_sync_task(chunks, existing, recorder) for chunks in tasks])
+    return all(workers.map(
+        _sync_task_threaded, [(chunks, existing, recorder) for chunks in tasks]))
 
 
-def _copy_attribute(queryset, attr_old, attr_new):
-    for object in queryset:
-        object.__setattr__(attr_new, object.__getattribute__(attr_old))
+def _chunk_group(mappers, chunk_size):
+    '''
+    Split a group of mappers (see SyncScheduler.get_stages) into chunks of
+    at most chunk_size mappers with the same action. Returns the chunks
+    together with a flag telling whether they are independent of each
+    other.
+    '''
+    mapper = mappers[0]
+    if isinstance(mapper, ObjMapper) and \
+            _get_plan(mapper, 'create').self_reference:
+        #objects referring to each other are synced in order, creations one
+        #by one, so the objects they refer to exist when they are pushed
+        chunks = []
+        for run in _action_runs(mappers):
+            if run[0].sync_action == 'create':
+                chunks.extend([[mapper] for mapper in run])
+            else:
+                chunks.extend(_split(run, chunk_size))
+        return chunks, False
+    return _split(mappers, chunk_size), True
+
+
+def _action_runs(mappers):
+    ''' Split mappers into runs of consecutive mappers with the same action '''
+    runs = []
+    for mapper in mappers:
+        if runs and runs[-1][0].sync_action == mapper.sync_action:
+            runs[-1].append(mapper)
+        else:
+            runs.append([mapper])
+    return runs
+
+
+def _split(mappers, chunk_size):
+    return [mappers[i:i + chunk_size] for i in range(0, len(mappers), chunk_size)]
+
+
+def _sync_task(chunks, existing=None, recorder=None):
+    ''' Sync chunks one after another '''
+    return all([_sync_chunk(chunk, existing, recorder) for chunk in chunks])
+
+
+def _sync_chunk(chunk, existing=None, recorder=None):
+    ''' Sync a chunk of mappers of the same content type, OE model and action '''
+    _set_attribute(chunk, 'sync_now', True)
+    started = time.time()
+    action = chunk[0].sync_action
+    if action == 'delete':
+        res = _delete_batch(chunk, existing)
+    else:
+        res = _save_batch(chunk, existing)
+    if recorder is not None:
+        recorder.add(chunk[0].content_type_id, action, len(chunk),
+            _count_failed(chunk, res), time.time() - started)
+    return res
+
+
+def _count_failed(chunk, res):
+    ''' Return the number of mappers of a synced chunk that are still dirty '''
+    if res:
+        return 0
+    if chunk[0].sync_action == 'delete':
+        #DeletedObjMappers are updated in the database only
+        return chunk[0].__class__.objects.filter(
+            id__in=[mapper.id for mapper in chunk], is_dirty=True).count()
+    return len([mapper for mapper in chunk if mapper.is_dirty])
+
+
+def _sync_task_threaded(args):
+    ''' Sync chunks in a worker thread and release its database connection '''
+    try:
+        return _sync_task(*args)
+    finally:
+        connection.close()
+
+
+def _resolve_existence(mappers):
+    '''
+    Check the existence of the OE objects of the given mappers and of all
+    their child mappers with one search per OE model.
+    '''
+    if settings.OPENERP_SETTINGS.get('EXTERNAL_IDS', False):
+        #upserts do not need to know, deletions check it themselves
+        return None
+    pairs = []
+    level = list(mappers)
+    while level:
+        pairs.extend([(m.oerp_model, m.oerp_id) for m in level if m.oerp_id])
+        #load the next level of child mappers
+        parent_ids = {}
+        for m in level:
+            parent_ids.setdefault(m.__class__, []).append(m.id)
+        level = []
+        for mapper_class, ids in parent_ids.items():
+            level.extend(mapper_class.objects.filter(parent__in=ids))
+    return resolve_existence(pairs)
+
+
+def _known_existence(mapper, existing):
+    ''' Return whether the OE object is known to exist, or None if unknown '''
+    if existing is None:
+        return None
+    return existing.get((mapper.oerp_model, mapper.oerp_id))
+
 
 def _set_attribute(queryset, attr_name, value):
     for object in queryset:
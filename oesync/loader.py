@@ -0,0 +1,136 @@
+from oesync.oerprpc import OerpSyncFailed
+from oesync.stats import Stats
+import threading
+import logging
+
+log = logging.getLogger('OESync')
+
+#counts of load() calls, imported rows, rejected rows and repeated imports
+stats = Stats('calls', 'rows', 'failed', 'retries')
+
+#{oerp model: {field: type}}, filled by field_types()
+_field_types = {}
+_lock = threading.Lock()
+
+_relational = ('many2one', 'many2many', 'one2many')
+
+
+
+def field_types(oerp_object):
+    ''' Return {field: type} of an OE model, read once per process '''
+    with _lock:
+        types = _field_types.get(oerp_object.model_name)
+    if types is None:
+        types = dict((field, definition['type']) for field, definition \
+            in oerp_object.fields_get().items())
+        with _lock:
+            _field_types[oerp_object.model_name] = types
+    return types
+
+
+def _column(field, field_type):
+    ''' Return the load() column of a field; relations are given by id '''
+    if field_type in _relational:
+        return '%s/.id' % field
+    return field
+
+
+def _value(value, field_type):
+    ''' Convert an XMLRPC value into the string expected by load() '''
+    if field_type == 'boolean':
+        return value and '1' or '0'
+    if value is None or value is False:
+        return ''
+    if isinstance(value, (list, tuple)):
+        ids = []
+        for item in value:
+            if isinstance(item, (list, tuple)):
+                #(6, 0, ids) replaces all links
+                if item[0] == 6:
+                    ids.extend(item[2])
+            else:
+                ids.append(item)
+        return ','.join([str(id) for id in ids])
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    return u'%s' % value
+
+
+def to_rows(oerp_object, key_field, records):
+    '''
+    Convert (key, data) records into the columns and rows of a load()
+    call. key_field is 'id' if the keys are external ids, which creates
+    the records (or updates those imported before), or '.id' if the keys
+    are the database ids of existing records.
+    '''
+    types = field_types(oerp_object)
+    fields = sorted(set(field for key, data in records for field in data))
+    columns = [key_field] + [_column(field, types.get(field)) for field in fields]
+    rows = []
+    for key, data in records:
+        rows.append([_value(key, None)] + [_value(data.get(field), types.get(field)) \
+            for field in fields])
+    return columns, rows
+
+
+def load(oerp_object, key_field, records):
+    '''
+    Import (key, data) records with a single load() call (see to_rows).
+    load() imports all rows or none, so rows that are rejected are dropped
+    and the others are imported again. If the rejected rows cannot be
+    told, the rows are imported one by one. Returns the id of each record,
+    None for the records that failed.
+    '''
+    if not records:
+        return []
+    columns, rows = to_rows(oerp_object, key_field, records)
+    ids = [None] * len(rows)
+    pending = list(range(len(rows)))
+    while pending:
+        rejected = _load_rows(oerp_object, columns, rows, pending, ids)
+        if not rejected:
+            break
+        if rejected is True:
+            #the error concerns the whole batch
+            if len(pending) > 1:
+                for index in pending:
+                    if _load_rows(oerp_object, columns, rows, [index], ids):
+                        stats.incr('failed')
+            else:
+                stats.incr('failed')
+            break
+        stats.incr('failed', len(rejected))
+        pending = [index for index in pending if index not in rejected]
+        if pending:
+            stats.incr('retries')
+    return ids
+
+
+def _load_rows(oerp_object, columns, rows, indexes, ids):
+    '''
+    Import the rows with the given indexes and store their ids. Returns the
+    set of indexes of the rejected rows, True if the import failed without
+    naming them, or None on success.
+    '''
+    stats.incr('calls')
+    try:
+        res = oerp_object.load(columns, [rows[index] for index in indexes])
+    except OerpSyncFailed as errmsg:
+        log.error('Sync failed -- %s' % errmsg)
+        return True
+    if res.get('ids'):
+        for index, id in zip(indexes, res['ids']):
+            ids[index] = id
+        stats.incr('rows', len(indexes))
+        return None
+
+    rejected = set()
+    for message in res.get('messages', []):
+        if message.get('type') != 'error':
+            continue
+        log.error('Import into %s failed -- %s' % (oerp_object, message.get('message')))
+        if message.get('record') is not None and message['record'] < len(indexes):
+            rejected.add(indexes[message['record']])
+    return rejected or True
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from optparse import make_option
+from oesync.backfill import Backfill
+from datetime import timedelta
+
+
+
+class Command(BaseCommand):
+    '''
+    Creates the object mappers of all existing Satchmo objects and pushes
+    the objects to OpenErp, printing the progress after each chunk.
+    '''
+    help = 'Pushes all existing objects of the mapped models to OpenErp.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--model', action='append', dest='models', default=[],
+            help='Satchmo model to backfill, can be given several times '
+                 '(default: all mapped models but Order and OrderItem).'),
+        make_option('--chunk-size', type='int', dest='chunk_size',
+            default=settings.OPENERP_SETTINGS.get('CHUNK_SIZE', 50),
+            help='Number of objects pushed at a time.'),
+        make_option('--restart', action='store_true', dest='restart',
+            default=False,
+            help='Ignore the checkpoints of previous runs.'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            backfill = Backfill(options['models'], options['chunk_size'],
+                                progress=self._progress)
+        except ValueError as e:
+            raise CommandError(e)
+        if options['restart']:
+            backfill.reset()
+        res = backfill.run()
+        self.stdout.write('objects %(objects)s, mappers created %(mappers)s, '
+            'synced %(synced)s, skipped %(skipped)s, failed %(failed)s\n' % \
+            backfill.stats.as_dict())
+        if not res:
+            raise CommandError('Not all objects could be synced, '
+                'they are left for syncnow() or the worker.')
+
+    def _progress(self, backfill, model, checkpoint):
+        eta = backfill.eta
+        self.stdout.write('%s: %s objects up to id %s, %.1f objects/s, ETA %s\n' % (
+            model.__name__, checkpoint.done, checkpoint.last_id, backfill.rate,
+            eta is None and '-' or timedelta(seconds=int(eta))))
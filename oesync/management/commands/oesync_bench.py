@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+from oesync.bench.server import FakeOpenErp
+from oesync.bench.fixtures import Fixtures
+from oesync.bench.runner import Benchmark, report, compare
+import json
+
+
+
+class Command(BaseCommand):
+    '''
+    Measures the throughput of oesync against a fake OpenErp server with
+    synthetic Satchmo objects. The objects are removed again afterwards.
+    '''
+    help = 'Benchmarks the synchronization against a fake OpenErp server.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--categories', type='int', dest='categories', default=50),
+        make_option('--products', type='int', dest='products', default=1000),
+        make_option('--addresses', type='int', dest='addresses', default=1000),
+        make_option('--orders', type='int', dest='orders', default=100),
+        make_option('--items', type='int', dest='items', default=3,
+            help='Items per order.'),
+        make_option('--saves', type='int', dest='saves', default=100,
+            help='Number of products saved one by one.'),
+        make_option('--latency', type='float', dest='latency', default=0,
+            help='Delay of every OpenErp call in milliseconds.'),
+        make_option('--failure-rate', type='float', dest='failure_rate',
+            default=0, help='Fraction of OpenErp calls that fail.'),
+        make_option('--seed', type='int', dest='seed', default=0),
+        make_option('--json', dest='json',
+            help='Write the results to this file.'),
+        make_option('--baseline', dest='baseline',
+            help='Fail if the results are worse than those of this file '
+                 '(written with --json).'),
+        make_option('--tolerance', type='float', dest='tolerance', default=0.2,
+            help='Allowed deviation from the baseline (default 0.2).'),
+    )
+
+    def handle(self, *args, **options):
+        fake = FakeOpenErp(
+            latency=options['latency'] / 1000.,
+            failure_rate=options['failure_rate'],
+            seed=options['seed'])
+        fixtures = Fixtures(
+            categories=options['categories'],
+            products=options['products'],
+            addresses=options['addresses'],
+            orders=options['orders'],
+            items=options['items'],
+            seed=options['seed'])
+        results = Benchmark(fixtures, fake, options['saves']).run()
+        self.stdout.write(report(results))
+
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump(results, f, indent=2)
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                regressions = compare(results, json.load(f), options['tolerance'])
+            if regressions:
+                raise CommandError('Slower than the baseline:\n%s' % '\n'.join(regressions))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from optparse import make_option
+from oesync.pull import PullSync
+
+
+
+class Command(BaseCommand):
+    '''
+    Pulls the records changed in OpenErp since the last run into Satchmo.
+    '''
+    help = 'Pulls changes from OpenErp into Satchmo (see pull_mapping).'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--model', action='append', dest='models', default=[],
+            help='OpenErp model to pull, can be given several times '
+                 '(default: all models of the pull mapping).'),
+        make_option('--page-size', type='int', dest='page_size',
+            default=None,
+            help='Number of records read per call.'),
+        make_option('--reset', action='store_true', dest='reset',
+            default=False,
+            help='Forget the watermarks and pull all records.'),
+    )
+
+    def handle(self, *args, **options):
+        sync = PullSync(options['page_size'])
+        if options['reset']:
+            sync.reset(options['models'])
+        stats = sync.run(options['models']).as_dict()
+        self.stdout.write('pages %(pages)s, fetched %(fetched)s, '
+            'applied %(applied)s, unchanged %(unchanged)s, '
+            'unmapped %(unmapped)s\n' % stats)
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from optparse import make_option
+from oesync.shards import ShardedSync
+import time
+
+
+
+class Command(BaseCommand):
+    '''
+    Syncs all dirty object mappers with several worker processes and
+    prints the throughput of each worker.
+    '''
+    help = 'Synchronizes dirty objects with OpenErp using several processes.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', type='int', dest='processes',
+            default=settings.OPENERP_SETTINGS.get('WORKER_PROCESSES', 2),
+            help='Number of worker processes.'),
+        make_option('--lease-time', type='int', dest='lease_time',
+            default=300,
+            help='Seconds a worker may hold claimed objects before others '
+                 'can retry them.'),
+    )
+
+    def handle(self, *args, **options):
+        sync = ShardedSync(options['processes'], options['lease_time'])
+        started = time.time()
+        try:
+            res = sync.run()
+        except ValueError as e:
+            raise CommandError('%s, use oesync_worker instead' % e)
+        elapsed = time.time() - started
+
+        for pid, stats in sorted(sync.worker_stats.items()):
+            self.stdout.write('worker %s: %s\n' % (pid, _format(stats)))
+        self.stdout.write('total: %s in %.1fs (%.1f objects/s)\n' % (
+            _format(sync.stats), elapsed,
+            sync.stats.get('synced') / max(elapsed, 0.001)))
+        if not res:
+            raise CommandError('Not all objects could be synced.')
+
+
+def _format(stats):
+    return 'claimed %(claimed)s, synced %(synced)s, failed %(failed)s, ' \
+        'chunks %(chunks)s, busy %(seconds).1fs' % stats.as_dict()
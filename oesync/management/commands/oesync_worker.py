@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import connection
+from optparse import make_option
+from oesync.listeners import syncnow
+from oesync.metrics import metrics
+from oesync import history
+import logging
+import time
+
+log = logging.getLogger('OESync')
+
+
+
+class Command(BaseCommand):
+    '''
+    Drains the queue of dirty object mappers by calling syncnow() over and
+    over. Meant to run as a separate process when MODE is set to 'queued'.
+    '''
+    help = 'Continuously synchronizes queued objects with OpenErp.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--concurrency', type='int', dest='concurrency',
+            default=settings.OPENERP_SETTINGS.get('WORKER_CONCURRENCY', 1),
+            help='Number of threads pushing independent objects at a time.'),
+        make_option('--interval', type='float', dest='interval',
+            default=settings.OPENERP_SETTINGS.get('WORKER_INTERVAL', 5),
+            help='Seconds to wait between two sync runs.'),
+        make_option('--metrics-file', dest='metrics_file',
+            default=settings.OPENERP_SETTINGS.get('METRICS_FILE'),
+            help='Write the OpenErp call metrics to this file after each run.'),
+        make_option('--once', action='store_true', dest='once', default=False,
+            help='Sync the current queue once and exit.'),
+    )
+
+    def handle(self, *args, **options):
+        log.info('OESync worker started (concurrency: %s)' % options['concurrency'])
+        while True:
+            try:
+                with history.recording('worker'):
+                    if not syncnow(concurrency=options['concurrency']):
+                        log.warning('Not all objects could be synced')
+            except Exception as e:
+                #keep the worker alive, the objects are still dirty
+                log.exception('Sync run failed -- %s' % e)
+            finally:
+                #do not hold an idle connection between runs
+                connection.close()
+                if options['metrics_file']:
+                    metrics.dump(options['metrics_file'])
+
+            if options['once']:
+                break
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                break
+        log.info('OESync worker stopped')
@@ -242,3 +242,53 @@ mapping = {
 }
 
 
+
+
+# PULLING CHANGES FROM OPENERP
+#
+# Changes made in OpenErp can be pulled back into Satchmo (see oesync_pull).
+# The pull mapping lists, per Satchmo model and OpenErp model, which
+# OpenErp field is copied to which Satchmo field:
+#
+# 'SatchmoModel': {
+#    'openerp.model': {
+#        'openerp_field': 'satchmo_field',
+#        ...
+#    },
+# }
+#
+# Only objects that have been pushed to OpenErp before (i.e. that have an
+# ObjMapper) are updated, and only plain values can be copied -- relations
+# (many2one fields etc.) are not supported. Pulled values are written
+# directly to the database, so they are not pushed back to OpenErp.
+
+pull_mapping = {
+
+    'AddressBook': {
+        'res.partner': {
+            'city': 'city',
+            'name': 'addressee',
+            'street': 'street1',
+            'street2': 'street2',
+            'zip': 'postal_code',
+        },
+    },
+
+    'Product': {
+        'product.product': {
+            'qty_available': 'items_in_stock',
+        },
+    },
+}
+
+
+# Fields OpenErp computes without storing them (e.g. qty_available) do not
+# change the write_date of their records. OpenErp models pulled for such
+# fields are polled through a stored model instead, given as
+# (model, field referring to the pulled record, domain): the records
+# referred to by the source records written since the last pull are read.
+
+pull_sources = {
+    #stock levels change with the moves done
+    'product.product': ('stock.move', 'product_id', [('state', '=', 'done')]),
+}
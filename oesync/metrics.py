@@ -0,0 +1,168 @@
+from django.conf import settings
+import threading
+import socket
+import time
+import logging
+
+log = logging.getLogger('OESync')
+
+#upper bounds of the latency histogram buckets in milliseconds
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, None)
+
+
+
+class Metric(object):
+    '''
+    Count, errors, latency histogram and payload sizes of the calls of one
+    OpenErp model and method.
+    '''
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.
+        self.max_seconds = 0.
+        self.buckets = [0] * len(BUCKETS)
+        self.sent = 0
+        self.received = 0
+
+    def observe(self, seconds, error=False, sent=0, received=0):
+        self.count += 1
+        self.errors += error and 1 or 0
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.sent += sent
+        self.received += received
+        ms = seconds * 1000
+        for index, bound in enumerate(BUCKETS):
+            if bound is None or ms <= bound:
+                self.buckets[index] += 1
+                break
+
+    def percentile(self, fraction):
+        '''
+        Return the upper bound (in ms) of the bucket holding the given
+        fraction of the calls, None if it is the open-ended one
+        '''
+        needed = fraction * self.count
+        total = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            total += count
+            if count and total >= needed:
+                return bound
+        return None
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'seconds': self.seconds,
+            'max_seconds': self.max_seconds,
+            'buckets': dict(zip(BUCKETS, self.buckets)),
+            'sent': self.sent,
+            'received': self.received,
+        }
+
+
+
+class StatsdSink(object):
+    '''
+    Sends each call as StatsD timer and counters over UDP, e.g.
+    oesync.product_template.create.time:12.5|ms
+    '''
+    def __init__(self, host, port=8125, prefix='oesync'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, model, method, seconds, error, sent, received):
+        name = '%s.%s.%s' % (self.prefix, model.replace('.', '_'), method)
+        lines = [
+            '%s.time:%.3f|ms' % (name, seconds * 1000),
+            '%s.calls:1|c' % name,
+            '%s.bytes_sent:%d|c' % (name, sent),
+            '%s.bytes_received:%d|c' % (name, received),
+        ]
+        if error:
+            lines.append('%s.errors:1|c' % name)
+        try:
+            self.socket.sendto('\n'.join(lines).encode('ascii'), self.address)
+        except (socket.error, UnicodeError) as e:
+            #metrics must never break a sync
+            log.debug('Could not send metrics -- %s' % e)
+
+
+
+class Metrics(object):
+    '''
+    Registry of the Metrics of the OpenErp calls of this process, keyed by
+    (model, method). Calls are forwarded to a StatsdSink if 'METRICS_STATSD'
+    is set to 'host:port' in OPENERP_SETTINGS.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._sink = None
+        self._sink_address = None
+
+    @property
+    def sink(self):
+        address = settings.OPENERP_SETTINGS.get('METRICS_STATSD')
+        if address != self._sink_address:
+            self._sink_address = address
+            self._sink = None
+            if address:
+                host, port = (address.split(':', 1) + ['8125'])[:2]
+                self._sink = StatsdSink(host, int(port),
+                    settings.OPENERP_SETTINGS.get('METRICS_PREFIX', 'oesync'))
+        return self._sink
+
+    def record(self, model, method, seconds, error=False, sent=0, received=0):
+        with self._lock:
+            try:
+                metric = self._metrics[(model, method)]
+            except KeyError:
+                metric = self._metrics[(model, method)] = Metric()
+            metric.observe(seconds, error, sent, received)
+        sink = self.sink
+        if sink is not None:
+            sink.send(model, method, seconds, error, sent, received)
+
+    def get(self, model, method):
+        ''' Return the Metric of a model and method, None if not called yet '''
+        return self._metrics.get((model, method))
+
+    def as_dict(self):
+        ''' Return {(model, method): metric dict} '''
+        with self._lock:
+            return dict((key, metric.as_dict()) \
+                for key, metric in self._metrics.items())
+
+    def reset(self):
+        with self._lock:
+            self._metrics = {}
+
+    def report(self):
+        ''' Return a text table of all calls, the most expensive ones first '''
+        with self._lock:
+            items = sorted(self._metrics.items(),
+                key=lambda item: item[1].seconds, reverse=True)
+            lines = ['%-28s %-24s %7s %6s %9s %8s %8s %8s %10s %10s' % (
+                'model', 'method', 'calls', 'errors', 'total s', 'avg ms',
+                'p95 ms', 'max ms', 'sent B', 'recvd B')]
+            for (model, method), metric in items:
+                p95 = metric.percentile(0.95)
+                lines.append('%-28s %-24s %7d %6d %9.2f %8.1f %8s %8.1f %10d %10d' % (
+                    model, method, metric.count, metric.errors, metric.seconds,
+                    metric.seconds * 1000 / max(metric.count, 1),
+                    p95 is None and '>%s' % BUCKETS[-2] or '<=%s' % p95,
+                    metric.max_seconds * 1000, metric.sent, metric.received))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        ''' Write the report to a text file '''
+        with open(path, 'w') as f:
+            f.write('# %s\n' % time.strftime('%Y-%m-%d %H:%M:%S'))
+            f.write(self.report())
+
+
+metrics = Metrics()
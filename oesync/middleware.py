@@ -0,0 +1,16 @@
+from oesync.listeners import coalescer
+
+
+
+class SaveCoalescerMiddleware(object):
+    '''
+    Coalesces the live syncs triggered while a request is handled (see
+    oesync.coalesce.SaveCoalescer) and runs them before the response is
+    returned, while the database connection is still open.
+    '''
+    def process_request(self, request):
+        coalescer.start_request()
+
+    def process_response(self, request, response):
+        coalescer.finish_request()
+        return response
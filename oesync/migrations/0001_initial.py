@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'ObjMapper'
+        db.create_table('oesync_objmapper', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('date_created', self.gf('django.db.models.fields.DateTimeField')(auto_now_add=True, blank=True)),
+            ('date_modified', self.gf('django.db.models.fields.DateTimeField')(auto_now=True, blank=True)),
+            ('is_dirty', self.gf('django.db.models.fields.BooleanField')(default=True)),
+            ('oerp_id', self.gf('django.db.models.fields.PositiveIntegerField')(null=True, blank=True)),
+            ('content_type', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['contenttypes.ContentType'])),
+            ('oerp_model', self.gf('django.db.models.fields.CharField')(max_length=128)),
+            ('object_id', self.gf('django.db.models.fields.PositiveIntegerField')(db_index=True)),
+            ('parent', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['oesync.ObjMapper'], null=True, blank=True)),
+        ))
+        db.send_create_signal('oesync', ['ObjMapper'])
+
+        # Adding model 'DeletedObjMapper'
+        db.create_table('oesync_deletedobjmapper', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('date_created', self.gf('django.db.models.fields.DateTimeField')(auto_now_add=True, blank=True)),
+            ('date_modified', self.gf('django.db.models.fields.DateTimeField')(auto_now=True, blank=True)),
+            ('is_dirty', self.gf('django.db.models.fields.BooleanField')(default=True)),
+            ('parent', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['oesync.DeletedObjMapper'], null=True, blank=True)),
+            ('oerp_id', self.gf('django.db.models.fields.PositiveIntegerField')(null=True, blank=True)),
+            ('content_type', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['contenttypes.ContentType'])),
+            ('oerp_model', self.gf('django.db.models.fields.CharField')(max_length=128)),
+        ))
+        db.send_create_signal('oesync', ['DeletedObjMapper'])
+
+
+    def backwards(self, orm):
+        # Deleting model 'ObjMapper'
+        db.delete_table('oesync_objmapper')
+
+        # Deleting model 'DeletedObjMapper'
+        db.delete_table('oesync_deletedobjmapper')
+
+
+    models = {
+        'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        'oesync.deletedobjmapper': {
+            'Meta': {'ordering': "('content_type',)", 'object_name': 'DeletedObjMapper'},
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'date_created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'date_modified': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_dirty': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'oerp_id': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'oerp_model': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'parent': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['oesync.DeletedObjMapper']", 'null': 'True', 'blank': 'True'})
+        },
+        'oesync.objmapper': {
+            'Meta': {'ordering': "('content_type',)", 'object_name': 'ObjMapper'},
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'date_created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'date_modified': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_dirty': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'object_id': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'oerp_id': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'oerp_model': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'parent': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['oesync.ObjMapper']", 'null': 'True', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['oesync']
\ No newline at end of file
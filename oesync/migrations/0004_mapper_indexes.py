@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+#backends supporting partial indexes
+PARTIAL_INDEXES = ('postgres', 'sqlite3')
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Removing duplicate mappers created by concurrent get_or_create calls
+        if not db.dry_run:
+            self.remove_duplicates(orm)
+
+        # Adding unique constraint on 'ObjMapper', fields ['parent', 'oerp_model']
+        db.create_unique('oesync_objmapper', ['parent_id', 'oerp_model'])
+
+        # Adding index on 'ObjMapper', fields ['content_type', 'object_id', 'oerp_model']
+        db.create_index('oesync_objmapper', ['content_type_id', 'object_id', 'oerp_model'])
+
+        # Adding index on 'ObjMapper', fields ['oerp_model', 'oerp_id']
+        db.create_index('oesync_objmapper', ['oerp_model', 'oerp_id'])
+
+        if db.backend_name in PARTIAL_INDEXES:
+            # Adding unique constraint on root mappers
+            db.execute('CREATE UNIQUE INDEX oesync_objmapper_root_uniq '
+                'ON oesync_objmapper (content_type_id, object_id, oerp_model) '
+                'WHERE parent_id IS NULL')
+            # Adding indexes on dirty root mappers, as read by syncnow()
+            db.execute('CREATE INDEX oesync_objmapper_dirty_created '
+                'ON oesync_objmapper (date_created, id) '
+                'WHERE is_dirty AND parent_id IS NULL')
+            db.execute('CREATE INDEX oesync_objmapper_dirty_modified '
+                'ON oesync_objmapper (date_modified, id) '
+                'WHERE is_dirty AND parent_id IS NULL')
+            db.execute('CREATE INDEX oesync_deletedobjmapper_dirty_modified '
+                'ON oesync_deletedobjmapper (date_modified, id) '
+                'WHERE is_dirty AND parent_id IS NULL')
+        else:
+            # Adding index on 'ObjMapper', fields ['is_dirty', 'parent', 'date_modified']
+            db.create_index('oesync_objmapper', ['is_dirty', 'parent_id', 'date_modified'])
+            # Adding index on 'DeletedObjMapper', fields ['is_dirty', 'parent', 'date_modified']
+            db.create_index('oesync_deletedobjmapper', ['is_dirty', 'parent_id', 'date_modified'])
+
+
+    def backwards(self, orm):
+        if db.backend_name in PARTIAL_INDEXES:
+            db.execute('DROP INDEX oesync_deletedobjmapper_dirty_modified')
+            db.execute('DROP INDEX oesync_objmapper_dirty_modified')
+            db.execute('DROP INDEX oesync_objmapper_dirty_created')
+            db.execute('DROP INDEX oesync_objmapper_root_uniq')
+        else:
+            db.delete_index('oesync_deletedobjmapper', ['is_dirty', 'parent_id', 'date_modified'])
+            db.delete_index('oesync_objmapper', ['is_dirty', 'parent_id', 'date_modified'])
+
+        # Removing index on 'ObjMapper', fields ['oerp_model', 'oerp_id']
+        db.delete_index('oesync_objmapper', ['oerp_model', 'oerp_id'])
+
+        # Removing index on 'ObjMapper', fields ['content_type', 'object_id', 'oerp_model']
+        db.delete_index('oesync_objmapper', ['content_type_id', 'object_id', 'oerp_model'])
+
+        # Removing unique constraint on 'ObjMapper', fields ['parent', 'oerp_model']
+        db.delete_unique('oesync_objmapper', ['parent_id', 'oerp_model'])
+
+
+    def remove_duplicates(self, orm):
+        '''
+        Keep one mapper per object and OE model (the one already synced, or
+        the oldest one) and delete the others along with their children.
+        '''
+        ObjMapper = orm['oesync.ObjMapper']
+        for fields, mappers in (
+                (('content_type', 'object_id', 'oerp_model'),
+                    ObjMapper.objects.filter(parent=None)),
+                (('parent', 'oerp_model'),
+                    ObjMapper.objects.exclude(parent=None))):
+            duplicates = mappers.values(*fields).annotate(
+                count=models.Count('id')).filter(count__gt=1)
+            for duplicate in duplicates:
+                del duplicate['count']
+                group = sorted(mappers.filter(**duplicate),
+                    key=lambda mapper: (mapper.oerp_id is None, mapper.id))
+                ObjMapper.objects.filter(
+                    id__in=[mapper.id for mapper in group[1:]]).delete()
+
+
+    models = {
+        'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        'oesync.deletedobjmapper': {
+            'Meta': {'ordering': "('content_type',)", 'object_name': 'DeletedObjMapper'},
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'date_created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'date_modified': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_dirty': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'lease_expires': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'lease_owner': ('django.db.models.fields.CharField', [], {'max_length': '64', 'null': 'True', 'blank': 'True'}),
+            'oerp_id': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'oerp_model': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'parent': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['oesync.DeletedObjMapper']", 'null': 'True', 'blank': 'True'})
+        },
+        'oesync.objmapper': {
+            'Meta': {'ordering': "('content_type',)", 'unique_together': "(('parent', 'oerp_model'),)", 'object_name': 'ObjMapper'},
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'date_created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'date_modified': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_dirty': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'lease_expires': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'lease_owner': ('django.db.models.fields.CharField', [], {'max_length': '64', 'null': 'True', 'blank': 'True'}),
+            'object_id': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'oerp_id': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'oerp_model': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'parent': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['oesync.ObjMapper']", 'null': 'True', 'blank': 'True'}),
+            'payload_digests': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            'payload_hash': ('django.db.models.fields.CharField', [], {'max_length': '40', 'null': 'True', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['oesync']
\ No newline at end of file
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'SyncBatch'
+        db.create_table('oesync_syncbatch', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('run', self.gf('django.db.models.fields.related.ForeignKey')(related_name='batches', to=orm['oesync.SyncRun'])),
+            ('content_type', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['contenttypes.ContentType'])),
+            ('action', self.gf('django.db.models.fields.CharField')(max_length=16)),
+            ('batches', self.gf('django.db.models.fields.PositiveIntegerField')(default=0)),
+            ('object_count', self.gf('django.db.models.fields.PositiveIntegerField')(default=0)),
+            ('failed', self.gf('django.db.models.fields.PositiveIntegerField')(default=0)),
+            ('seconds', self.gf('django.db.models.fields.FloatField')(default=0)),
+        ))
+        db.send_create_signal('oesync', ['SyncBatch'])
+
+        # Adding field 'SyncRun.seconds'
+        db.add_column('oesync_syncrun', 'seconds',
+                      self.gf('django.db.models.fields.FloatField')(default=0),
+                      keep_default=False)
+
+        # Adding field 'SyncRun.object_count'
+        db.add_column('oesync_syncrun', 'object_count',
+                      self.gf('django.db.models.fields.PositiveIntegerField')(default=0),
+                      keep_default=False)
+
+        # Adding field 'SyncRun.failed'
+        db.add_column('oesync_syncrun', 'failed',
+                      self.gf('django.db.models.fields.PositiveIntegerField')(default=0),
+                      keep_default=False)
+
+        # Adding field 'SyncRun.rpc_calls'
+        db.add_column('oesync_syncrun', 'rpc_calls',
+                      self.gf('django.db.models.fields.PositiveIntegerField')(default=0),
+                      keep_default=False)
+
+        # Adding field 'SyncRun.rpc_errors'
+        db.add_column('oesync_syncrun', 'rpc_errors',
+                      self.gf('django.db.models.fields.PositiveIntegerField')(default=0),
+                      keep_default=False)
+
+        # Adding field 'SyncRun.rpc_seconds'
+        db.add_column('oesync_syncrun', 'rpc_seconds',
+                      self.gf('django.db.models.fields.FloatField')(default=0),
+                      keep_default=False)
+
+        # Adding index on 'SyncRun', fields ['started']
+        db.create_index('oesync_syncrun', ['started'])
+
+
+    def backwards(self, orm):
+        # Removing index on 'SyncRun', fields ['started']
+        db.delete_index('oesync_syncrun', ['started'])
+
+        # Deleting model 'SyncBatch'
+        db.delete_table('oesync_syncbatch')
+
+        # Deleting field 'SyncRun.seconds'
+        db.delete_column('oesync_syncrun', 'seconds')
+
+        # Deleting field 'SyncRun.object_count'
+        db.delete_column('oesync_syncrun', 'object_count')
+
+        # Deleting field 'SyncRun.failed'
+        db.delete_column('oesync_syncrun', 'failed')
+
+        # Deleting field 'SyncRun.rpc_calls'
+        db.delete_column('oesync_syncrun', 'rpc_calls')
+
+        # Deleting field 'SyncRun.rpc_errors'
+        db.delete_column('oesync_syncrun', 'rpc_errors')
+
+        # Deleting field 'SyncRun.rpc_seconds'
+        db.delete_column('oesync_syncrun', 'rpc_seconds')
+
+
+    models = {
+        'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        'oesync.backfillcheckpoint': {
+            'Meta': {'ordering': "('date_created',)", 'object_name': 'BackfillCheckpoint'},
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']", 'unique': 'True'}),
+            'date_created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'date_modified': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'done': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'failed': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'finished': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_id': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'})
+        },
+        'oesync.deletedobjmapper': {
+            'Meta': {'ordering': "('content_type',)", 'object_name': 'DeletedObjMapper'},
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'date_created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'date_modified': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_dirty': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'lease_expires': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'lease_owner': ('django.db.models.fields.CharField', [], {'max_length': '64', 'null': 'True', 'blank': 'True'}),
+            'oerp_id': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'oerp_model': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'parent': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['oesync.DeletedObjMapper']", 'null': 'True', 'blank': 'True'})
+        },
+        'oesync.objmapper': {
+            'Meta': {'ordering': "('content_type',)", 'unique_together': "(('parent', 'oerp_model'),)", 'object_name': 'ObjMapper'},
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'date_created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'date_modified': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_dirty': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'lease_expires': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'lease_owner': ('django.db.models.fields.CharField', [], {'max_length': '64', 'null': 'True', 'blank': 'True'}),
+            'object_id': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'oerp_id': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'oerp_model': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'parent': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['oesync.ObjMapper']", 'null': 'True', 'blank': 'True'}),
+            'payload_digests': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            'payload_hash': ('django.db.models.fields.CharField', [], {'max_length': '40', 'null': 'True', 'blank': 'True'})
+        },
+        'oesync.pullwatermark': {
+            'Meta': {'ordering': "('oerp_model',)", 'object_name': 'PullWatermark'},
+            'date_modified': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_id': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'oerp_model': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '128'}),
+            'write_date': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '32', 'blank': 'True'})
+        },
+        'oesync.syncbatch': {
+            'Meta': {'object_name': 'SyncBatch'},
+            'action': ('django.db.models.fields.CharField', [], {'max_length': '16'}),
+            'batches': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'failed': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'object_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'run': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'batches'", 'to': "orm['oesync.SyncRun']"}),
+            'seconds': ('django.db.models.fields.FloatField', [], {'default': '0'})
+        },
+        'oesync.syncrun': {
+            'Meta': {'ordering': "('-started',)", 'object_name': 'SyncRun'},
+            'failed': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'finished': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'object_count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'profile': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'profile_file': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            'result': ('django.db.models.fields.NullBooleanField', [], {'null': 'True', 'blank': 'True'}),
+            'rpc_calls': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'rpc_errors': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'rpc_seconds': ('django.db.models.fields.FloatField', [], {'default': '0'}),
+            'seconds': ('django.db.models.fields.FloatField', [], {'default': '0'}),
+            'started': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True'}),
+            'trigger': ('django.db.models.fields.CharField', [], {'max_length': '32', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['oesync']
\ No newline at end of file
@@ -6,8 +6,42 @@ log = logging.getLogger('OESync')
 
 
 
+class MappingPlan(object):
+    '''
+    Compiled mapping of one Satchmo model to one OpenErp model for a
+    single action. The mapping is identified by its path, the OpenErp
+    models from the top level down to this one.
+    '''
+    __slots__ = ('model_name', 'path', 'oerp_model', 'action', 'fields',
+                 'children', 'auto_delete', 'self_reference', 'external_model')
+
+    def __init__(self, model_name, path, action, fields, children,
+                 auto_delete, self_reference):
+        self.model_name = model_name
+        self.path = path
+        self.oerp_model = path[-1]
+        self.action = action
+        #tuple of (oerp_field, satchmo_field) pairs used by this action
+        self.fields = fields
+        #tuple of OpenErp model names of the child mappings
+        self.children = children
+        self.auto_delete = auto_delete
+        self.self_reference = self_reference
+        #OE model name the external ids of the objects are made of (see
+        #fields.external_id), the path if the OE model is mapped more than
+        #once for the Satchmo model
+        self.external_model = self.oerp_model
+
+    def __repr__(self):
+        return '<MappingPlan: %s -> %s (%s)>' % (
+            self.model_name, ' -> '.join(self.path), self.action)
+
+
+
 class ModelMapper:
 
+    _actions = ('create', 'update', 'delete')
+
     def __init__(self, content_type=None):
 
         self.mapping = mapping.mapping
@@ -23,6 +57,12 @@ class ModelMapper:
         # admin. This is necessary for 'Product', for example.
         self.access_inline = self._get_access_inline_models()
 
+        # Compile the mapping into plans, so that syncing an object does
+        # not have to walk through the mapping dictionaries.
+        self.plans = {}
+        self.roots = {}
+        self._compile_plans()
+
 
     def _get_access_inline_models(self):
         models = []
@@ -35,18 +75,81 @@ class ModelMapper:
         return models
 
 
-    def get_for_model(self, satchmo_model=None):
+    def _compile_plans(self):
+        for model_name, model_mapping in self.mapping.items():
+            roots = self.get_children(model_mapping)
+            self.roots[model_name] = tuple(sorted(roots.keys()))
+            for oerp_model, mapping in roots.items():
+                self._compile_mapping(model_name, (oerp_model,), mapping)
+
+        #an OE model may be mapped at several levels of a model's mapping;
+        #all but the shallowest mapping get external ids of their own
+        paths = {}
+        for plan in self.plans.values():
+            paths.setdefault((plan.model_name, plan.oerp_model), set()).add(plan.path)
+        deeper = set()
+        for (model_name, oerp_model), model_paths in paths.items():
+            if len(model_paths) > 1:
+                log.warning('\'%s\' is mapped to \'%s\' more than once, '
+                    'references to these objects are ambiguous' % \
+                    (model_name, oerp_model))
+                deeper.update([(model_name, path) for path in sorted(model_paths,
+                    key=lambda path: (len(path), path))[1:]])
+        for plan in self.plans.values():
+            if (plan.model_name, plan.path) in deeper:
+                plan.external_model = '.'.join(plan.path)
+
+    def _compile_mapping(self, model_name, path, mapping):
+        oerp_model = path[-1]
+        children = self.get_children(mapping)
+        fields = [(oerp_field, satchmo_field) for oerp_field, satchmo_field \
+            in sorted(mapping.items()) if oerp_field not in children \
+            and oerp_field not in self._protected_tags]
+        actions = set(self._actions)
+        for oerp_field, satchmo_field in fields:
+            actions.update(satchmo_field.actions)
+
+        self_reference = self.has_self_reference(model_name, mapping, oerp_model)
+        for action in actions:
+            self.plans[(model_name, path, action)] = MappingPlan(
+                model_name,
+                path,
+                action,
+                tuple([(oerp_field, satchmo_field) for oerp_field, satchmo_field \
+                    in fields if action in satchmo_field.actions]),
+                tuple(sorted(children.keys())),
+                bool(self.check_auto_del(mapping)),
+                self_reference)
+
+        for child_model, child_mapping in children.items():
+            self._compile_mapping(model_name, path + (child_model,), child_mapping)
+
+    def get_plan(self, satchmo_model, path, action):
         '''
-        Return mapping corresponding to given Satchmo model.
+        Return the compiled plan for the given Satchmo model (class or
+        name), mapping path (see MappingPlan; the name of the OpenErp model
+        for top level mappings) and action.
         '''
+        if not isinstance(satchmo_model, basestring):
+            satchmo_model = satchmo_model.__name__
+        if isinstance(path, basestring):
+            path = (path,)
         try:
-            mapping = self.mapping[satchmo_model.__name__]
-            #return mappings only (no special tags)
-            return self.get_children(mapping)
+            return self.plans[(satchmo_model, tuple(path), action)]
+        except KeyError:
+            raise MappingError('There is no mapping of \'%s\' to \'%s\'' % \
+                (satchmo_model, ' -> '.join(path)))
+
+    def get_root_models(self, satchmo_model):
+        '''
+        Return the OpenErp models the given Satchmo model is mapped to at
+        the top level.
+        '''
+        try:
+            return self.roots[satchmo_model.__name__]
         except KeyError:
             log.warning('No mapping could be found for model \'%s\'' % satchmo_model)
-            return {}
-            #raise MappingError('There is no mapping for this model')
+            return ()
 
     def get_model(self, model_name):
         return ContentType.objects.get(model=model_name.lower()).model_class()
@@ -54,14 +157,10 @@ class ModelMapper:
 
     def get_for_oerp_model(self, oerp_model=None):
         '''
-        Return corresponding Satchmo model name.
+        Return the names of the Satchmo models mapped to given OpenErp model.
         '''
-        return NotImplemented #FIXME
-        #try:
-        #    return (key for key,value in self.mapping.items() \
-        #        if value['oe_model']==oerp_model).next()
-        #except StopIteration:
-        #    raise MappingError('There is no mapping for this model')
+        return sorted(set(plan.model_name for plan in self.plans.values() \
+            if plan.oerp_model == oerp_model))
 
     def get_children(self, mapping):
         '''
@@ -79,31 +178,46 @@ class ModelMapper:
         '''
         return NotImplemented
 
-    def parse_data(self, instance, mapping, oerp_model, action=None):
+    def has_self_reference(self, model_name, mapping, oerp_model):
+        '''
+        Check whether objects of a mapping refer to other objects of the
+        same mapping (e.g. the parent of a category). Such objects cannot
+        be created in the same batch.
         '''
-        Converts Satchmo fields to OpenErp fields and returns data dictionary
+        for satchmo_field in mapping.values():
+            if isinstance(satchmo_field, IdField):
+                if (satchmo_field.param_name or oerp_model) == oerp_model:
+                    return True
+            elif isinstance(satchmo_field, (ForeignIdField, ManyForeignIdField)):
+                if satchmo_field.param_name.lower() == model_name.lower() \
+                        and (satchmo_field.foreign_oe_model or oerp_model) == oerp_model:
+                    return True
+        return False
+
+    def run_plan(self, plan, instance, resolver=None, external_ids=False):
+        '''
+        Converts Satchmo fields to OpenErp fields as specified by the given
+        plan and returns the data dictionary. Ids of related objects are
+        taken from the resolver if one is given (see IdResolver). With
+        external_ids, related objects are referred to by their external ids
+        instead, in fields named '<field>/id'.
         '''
         data = {}
-        children = {}
-        if mapping is None:
-            raise MappingError('No mapping was specified')
-        #loop though fields of mapping
-        for oerp_field, satchmo_field in mapping.items():
-            if isinstance(satchmo_field, dict):
-                #mapping of a child model was found
-                children[oerp_field] = satchmo_field
-            elif oerp_field not in self._protected_tags:
-                #normal field-to-field mapping
-                try:
-                    #only map field if current action is specified in field actions
-                    if action in satchmo_field.actions:
-                        #get field data
-                        data[oerp_field] = satchmo_field.get_content(instance, oerp_model)
-                except Exception as e:
-                    raise MappingError(
-                        'An error occured while mapping content %s: %s -- %s' % \
-                        (oerp_field, satchmo_field, e))
-        return (data, children)
+        for oerp_field, satchmo_field in plan.fields:
+            try:
+                if external_ids:
+                    value = satchmo_field.get_external_content(
+                        instance, plan.oerp_model)
+                    if value is not NotImplemented:
+                        data['%s/id' % oerp_field] = value
+                        continue
+                data[oerp_field] = satchmo_field.get_content(
+                    instance, plan.oerp_model, resolver)
+            except Exception as e:
+                raise MappingError(
+                    'An error occured while mapping content %s: %s -- %s' % \
+                    (oerp_field, satchmo_field, e))
+        return data
 
     def check_auto_del(self, mapping):
         ''' Check whether a (child) object can be deleted '''
@@ -2,8 +2,29 @@ from django.db import models
 import time
 from django.contrib.contenttypes import generic
 from django.contrib.contenttypes.models import ContentType
+from django.db.models.query import QuerySet
 from django.utils.translation import ugettext_lazy as _
+from oesync.cache import id_cache
+from oesync import retry
 
+#fields of ObjMapper the entries of the id cache depend on
+_cached_fields = set(['content_type', 'content_type_id', 'object_id',
+                      'oerp_model', 'oerp_id'])
+
+
+
+class ObjMapperQuerySet(QuerySet):
+    '''
+    Drops the cached oerp_ids (see oesync.cache) of mappers updated in
+    bulk, as no post_save is sent for them
+    '''
+    def update(self, **kwargs):
+        if not _cached_fields.intersection(kwargs) or not id_cache.enabled():
+            return super(ObjMapperQuerySet, self).update(**kwargs)
+        keys = list(self.values_list('content_type_id', 'object_id', 'oerp_model'))
+        rows = super(ObjMapperQuerySet, self).update(**kwargs)
+        id_cache.delete_many(keys)
+        return rows
 
 
 
@@ -12,6 +33,9 @@ class ObjMapperManager(models.Manager):
     Special manager.
     '''
 
+    def get_query_set(self):
+        return ObjMapperQuerySet(self.model, using=self._db)
+
     def get_for_object(self, instance, oerp_model, parent=None):
         '''
         resolves the obj_mapper for a given model-instance
@@ -46,22 +70,56 @@ class ObjMapper(models.Model):
     oerp_model = models.CharField(max_length=128, verbose_name='OpenERP Model')
     object_id = models.PositiveIntegerField(_('Object Id'), db_index=True)
     parent = models.ForeignKey('self', null=True, blank=True)
+    #True for root mappers, NULL for child mappers (see save())
+    is_root = models.NullBooleanField(_('Root mapper'), editable=False)
     object = generic.GenericForeignKey('content_type', 'object_id')
+    payload_hash = models.CharField(
+        _('Payload hash'), max_length=40, null=True, blank=True)
+    payload_digests = models.TextField(
+        _('Payload digests'), null=True, blank=True)
+    lease_owner = models.CharField(
+        _('Lease owner'), max_length=64, null=True, blank=True)
+    lease_expires = models.DateTimeField(
+        _('Lease expires'), null=True, blank=True)
+    attempts = models.PositiveIntegerField(_('Failed attempts'), default=0)
+    last_error = models.TextField(_('Last error'), blank=True)
+    next_attempt = models.DateTimeField(
+        _('Next attempt'), null=True, blank=True, db_index=True)
     objects = ObjMapperManager()
 
     sync_now = False
 
-    def save_state(self, state='dirty'):
-        if state is 'dirty':
+    def save(self, *args, **kwargs):
+        '''
+        Keep is_root in line with the parent: databases without partial
+        indexes keep root mappers unique by (content_type, object_id,
+        oerp_model, is_root), see migration 0010
+        '''
+        self.is_root = self.parent_id is None or None
+        super(ObjMapper, self).save(*args, **kwargs)
+
+    def save_state(self, state='dirty', error=None):
+        '''
+        Mark the mapper 'clean' after a successful sync, or 'dirty' if the
+        object has yet to be synced. Given an error, the state counts as a
+        failed attempt and the next one is postponed (see oesync.retry).
+        '''
+        if state == 'dirty':
             self.is_dirty = True
         else:
             self.is_dirty = False
+        if error is None:
+            retry.reset(self)
+        else:
+            retry.failed(self, error)
         self.save()
 
     class Meta:
         verbose_name = _('Object Mapper')
         verbose_name_plural = _('Object Mappers')
         ordering = ('content_type', )
+        #see migrations 0004 and 0010 for the uniqueness of root mappers
+        unique_together = (('parent', 'oerp_model'), )
 
     def __unicode__(self):
         return u'%s' % self.object
@@ -83,6 +141,14 @@ class DeletedObjMapper(models.Model):
         _('OpenERP Id'), null=True, blank=True)
     content_type = models.ForeignKey(ContentType, verbose_name='Content Type')
     oerp_model = models.CharField(max_length=128, verbose_name='OpenERP Model')
+    lease_owner = models.CharField(
+        _('Lease owner'), max_length=64, null=True, blank=True)
+    lease_expires = models.DateTimeField(
+        _('Lease expires'), null=True, blank=True)
+    attempts = models.PositiveIntegerField(_('Failed attempts'), default=0)
+    last_error = models.TextField(_('Last error'), blank=True)
+    next_attempt = models.DateTimeField(
+        _('Next attempt'), null=True, blank=True, db_index=True)
 
     sync_now = False
 
@@ -93,3 +159,116 @@ class DeletedObjMapper(models.Model):
 
     def __unicode__(self):
         return u'Deleted Mapper (%s)' % self.content_type
+
+
+
+class PullWatermark(models.Model):
+    '''
+    Stores up to which write_date (and id) the records of an OpenERP model
+    have been pulled
+    '''
+
+    oerp_model = models.CharField(
+        max_length=128, unique=True, verbose_name='OpenERP Model')
+    write_date = models.CharField(
+        _('last write date'), max_length=32, blank=True, default='')
+    last_id = models.PositiveIntegerField(_('last id'), default=0)
+    date_modified = models.DateTimeField(
+        _('date modified'), auto_now=True, null=False)
+
+    class Meta:
+        verbose_name = _('Pull Watermark')
+        verbose_name_plural = _('Pull Watermarks')
+        ordering = ('oerp_model', )
+
+    def __unicode__(self):
+        return u'%s (%s)' % (self.oerp_model, self.write_date)
+
+
+
+class BackfillCheckpoint(models.Model):
+    '''
+    Progress of the initial backfill of a Satchmo model: all objects up to
+    last_id have been processed.
+    '''
+
+    content_type = models.ForeignKey(
+        ContentType, unique=True, verbose_name='Content Type')
+    last_id = models.PositiveIntegerField(_('last id'), default=0)
+    done = models.PositiveIntegerField(_('processed objects'), default=0)
+    failed = models.PositiveIntegerField(_('failed objects'), default=0)
+    finished = models.BooleanField(default=False)
+    date_created = models.DateTimeField(
+        _('date created'), auto_now_add=True, null=False)
+    date_modified = models.DateTimeField(
+        _('date modified'), auto_now=True, null=False)
+
+    class Meta:
+        verbose_name = _('Backfill Checkpoint')
+        verbose_name_plural = _('Backfill Checkpoints')
+        ordering = ('date_created', )
+
+    def __unicode__(self):
+        return u'%s (%s)' % (self.content_type, self.last_id)
+
+
+
+class SyncRun(models.Model):
+    '''
+    A run of syncnow() that synced objects, or was profiled (see
+    oesync.history and oesync.profiling)
+    '''
+
+    started = models.DateTimeField(_('started'), db_index=True)
+    finished = models.DateTimeField(_('finished'), null=True, blank=True)
+    seconds = models.FloatField(_('seconds'), default=0)
+    result = models.NullBooleanField(_('result'))
+    trigger = models.CharField(_('trigger'), max_length=32, blank=True)
+    object_count = models.PositiveIntegerField(_('objects'), default=0)
+    failed = models.PositiveIntegerField(_('failed'), default=0)
+    rpc_calls = models.PositiveIntegerField(_('RPC calls'), default=0)
+    rpc_errors = models.PositiveIntegerField(_('RPC errors'), default=0)
+    rpc_seconds = models.FloatField(_('RPC seconds'), default=0)
+    #json, see SyncProfiler.breakdown
+    profile = models.TextField(_('profile'), blank=True)
+    profile_file = models.CharField(_('cProfile file'), max_length=255, blank=True)
+
+    class Meta:
+        verbose_name = _('Sync Run')
+        verbose_name_plural = _('Sync Runs')
+        ordering = ('-started', )
+
+    def __unicode__(self):
+        return u'%s (%s)' % (self.started, self.trigger)
+
+    def objects_per_second(self):
+        return self.object_count / max(self.seconds, 0.001)
+
+
+
+class SyncBatch(models.Model):
+    '''
+    The objects of one content type and action synced by a SyncRun, summed
+    over all its batches
+    '''
+
+    run = models.ForeignKey(SyncRun, related_name='batches')
+    content_type = models.ForeignKey(ContentType)
+    action = models.CharField(_('action'), max_length=16)
+    batches = models.PositiveIntegerField(_('batches'), default=0)
+    object_count = models.PositiveIntegerField(_('objects'), default=0)
+    failed = models.PositiveIntegerField(_('failed'), default=0)
+    seconds = models.FloatField(_('seconds'), default=0)
+
+    class Meta:
+        verbose_name = _('Sync Batch')
+        verbose_name_plural = _('Sync Batches')
+
+    def __unicode__(self):
+        return u'%s %s: %s' % (self.action, self.content_type, self.object_count)
+
+
+
+#connect the listeners to the mapped models; not done in oesync/__init__.py
+#so that oesync.oerprpc and the fake server can be used without satchmo
+from oesync import receivers
@@ -1,27 +1,239 @@
 from django.conf import settings
+from oesync.stats import Stats
+from oesync.metrics import metrics
 import openerplib
+import xmlrpclib
+import threading
 import logging
+import time
+import os
 
 log = logging.getLogger('OESync')
 
 
 
+class MeteredTransport(xmlrpclib.SafeTransport):
+    '''
+    Transport remembering the size of the last request and response body
+    '''
+    sent = 0
+    received = 0
+
+    def __init__(self, secure=False):
+        xmlrpclib.SafeTransport.__init__(self)
+        self.secure = secure
+
+    def make_connection(self, host):
+        if self.secure:
+            return xmlrpclib.SafeTransport.make_connection(self, host)
+        return xmlrpclib.Transport.make_connection(self, host)
+
+    def send_content(self, connection, request_body):
+        self.sent = len(request_body)
+        xmlrpclib.SafeTransport.send_content(self, connection, request_body)
+
+    def parse_response(self, response):
+        self.received = int(response.getheader('content-length', 0) or 0)
+        return xmlrpclib.SafeTransport.parse_response(self, response)
+
+
+class PooledXmlRPCConnector(openerplib.XmlRPCConnector):
+    '''
+    XML-RPC connector that keeps one ServerProxy per service and thread.
+    The proxies (and their keep-alive HTTP connections) are reused for
+    all subsequent calls instead of being rebuilt for every request.
+    The latency and payload size of every call are recorded in
+    oesync.metrics.metrics by OpenErp model and method.
+    '''
+    def __init__(self, hostname, port=8069, secure=False):
+        openerplib.XmlRPCConnector.__init__(self, hostname, port)
+        self.secure = secure
+        if secure:
+            self.url = 'https://%s:%d/xmlrpc' % (hostname, port)
+        self._local = threading.local()
+
+    def _get_proxy(self, service_name):
+        try:
+            proxies = self._local.proxies
+        except AttributeError:
+            proxies = self._local.proxies = {}
+        try:
+            return proxies[service_name]
+        except KeyError:
+            transport = MeteredTransport(self.secure)
+            proxy = xmlrpclib.ServerProxy(
+                '%s/%s' % (self.url, service_name), transport=transport)
+            proxies[service_name] = (proxy, transport)
+            return proxy, transport
+
+    def send(self, service_name, method, *args):
+        service, transport = self._get_proxy(service_name)
+        transport.sent = transport.received = 0
+        started = time.time()
+        error = True
+        try:
+            res = getattr(service, method)(*args)
+            error = False
+            return res
+        except (xmlrpclib.ProtocolError, IOError):
+            #drop the proxy, the next call opens a fresh connection
+            self._local.proxies.pop(service_name, None)
+            raise
+        finally:
+            model, rpc = _rpc_name(service_name, method, args)
+            metrics.record(model, rpc, time.time() - started, error,
+                           transport.sent, transport.received)
+
+
+def _rpc_name(service_name, method, args):
+    ''' Return the (model, method) an XML-RPC call is recorded under '''
+    #execute(db, uid, password, model, method, ...), likewise execute_kw
+    #and exec_workflow(db, uid, password, model, signal, id)
+    if service_name == 'object' and len(args) > 4:
+        return args[3], args[4]
+    return service_name, method
+
+
+class PooledConnection(openerplib.Connection):
+    '''
+    Connection that logs in only once and shares its user id between threads.
+    '''
+    def __init__(self, connector, database=None, login=None, password=None,
+                 user_id=None):
+        openerplib.Connection.__init__(
+            self, connector, database, login, password, user_id)
+        self._login_lock = threading.Lock()
+
+    def check_login(self, force=True):
+        if self.user_id and not force:
+            return
+        with self._login_lock:
+            if self.user_id and not force:
+                return
+            openerplib.Connection.check_login(self, force)
+            pool.stats.incr('logins')
+
+
+class ConnectionPool(object):
+    '''
+    Process-wide pool holding the authenticated connection and the model
+    proxies shared by all Oerp instances.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = Stats(
+            'connection_hits', 'connection_misses',
+            'model_hits', 'model_misses', 'logins')
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._connection = None
+        self._models = {}
+
+    def reset(self):
+        '''
+        Drop the pooled connection, e.g. after changing OPENERP_SETTINGS.
+        '''
+        with self._lock:
+            self._reset()
+
+    def _connect(self):
+        conf = settings.OPENERP_SETTINGS
+        connector = PooledXmlRPCConnector(
+            conf['HOST'], conf['PORT'],
+            secure = conf.get('PROTOCOL', 'xmlrpc') == 'xmlrpcs')
+        return PooledConnection(
+            connector,
+            database = conf['DB'],
+            login = conf['USER'],
+            password = conf['PASSWORD'])
+
+    def get_connection(self):
+        '''
+        Returns the shared connection object
+        '''
+        with self._lock:
+            if self._pid != os.getpid():
+                #sockets must not be shared with a parent process
+                self._reset()
+            if self._connection is None:
+                self.stats.incr('connection_misses')
+                self._connection = self._connect()
+            else:
+                self.stats.incr('connection_hits')
+            return self._connection
+
+    def get_model(self, model_name):
+        '''
+        Returns the shared proxy for the given OpenErp model
+        '''
+        conn = self.get_connection()
+        with self._lock:
+            try:
+                model = self._models[model_name]
+            except KeyError:
+                self.stats.incr('model_misses')
+                model = self._models[model_name] = conn.get_model(model_name)
+            else:
+                self.stats.incr('model_hits')
+            return model
+
+
+pool = ConnectionPool()
+
+
+
+def resolve_existence(pairs):
+    '''
+    Checks which of the given (oerp_model, oerp_id) pairs exist in OpenErp.
+    Runs a single search per OpenErp model and returns a dictionary
+    mapping each pair to True or False. Pairs that could not be checked
+    are left out, so callers fall back to checking them one by one.
+    '''
+    ids_by_model = {}
+    for oerp_model, oerp_id in pairs:
+        if oerp_model and oerp_id:
+            ids_by_model.setdefault(oerp_model, set()).add(oerp_id)
+
+    existing = {}
+    for oerp_model, ids in ids_by_model.items():
+        try:
+            #inactive records exist as well
+            found = set(pool.get_model(oerp_model).search(
+                [('id', 'in', list(ids))], context={'active_test': False}))
+        except Exception as e:
+            log.warning('Could not check existence of %s objects: %s' % (oerp_model, e))
+            continue
+        for oerp_id in ids:
+            existing[(oerp_model, oerp_id)] = oerp_id in found
+    return existing
+
+
+
 class Oerp():
     '''
     Creates an XMLRPC connection object and offers methods
     to manipulate OpenErp contents.
     '''
-    def __init__(self, model_name=None, id=None):
+    def __init__(self, model_name=None, id=None, exists=None):
         self.settings = settings.OPENERP_SETTINGS
 
         self.conn = self._connection()
         self.set_model(model_name)
-        self.set_id(id)
+        self.set_id(id, exists)
 
 
-    def set_id(self, id):
+    def set_id(self, id, exists=None):
+        '''
+        Sets the object id. The existence check is skipped if the caller
+        already knows whether the object exists (see resolve_existence).
+        '''
         self.id = id
-        self.exists = self._object_exists()
+        if exists is None or id is None:
+            self.exists = self._object_exists()
+        else:
+            self.exists = exists
 
 
     def set_model(self, model_name):
@@ -30,7 +242,7 @@ class Oerp():
         '''
         self.model_name = model_name
         if self.model_name is not None:
-            self.model = self.conn.get_model(model_name)
+            self.model = pool.get_model(model_name)
         else:
             self.model = None
 
@@ -39,13 +251,7 @@ class Oerp():
         '''
         Returns connection object
         '''
-        return(openerplib.get_connection(
-            hostname = self.settings['HOST'],
-            port = self.settings['PORT'],
-            database = self.settings['DB'],
-            login = self.settings['USER'],
-            password = self.settings['PASSWORD'],
-        ))
+        return pool.get_connection()
 
 
     def _object_exists(self, id=None):
@@ -91,6 +297,80 @@ class Oerp():
         return True
 
 
+    def upsert(self, records, known_ids=None):
+        '''
+        Create or update entries given as (external id, id, data) tuples
+        with a single call; id is the OE id of entries synced before, False
+        for new ones. Fields whose name ends with '/id' refer to other
+        objects by external id; known_ids gives {external id: (model, id)}
+        for referenced objects that may not have one in OE yet. Requires the
+        oesync_server addon in OE. Returns the ids of the entries, False for
+        those that no longer exist.
+        '''
+        self._validate_model()
+        try:
+            ids = pool.get_model('oesync.sync').upsert(
+                self.model_name, records, known_ids or {})
+        except Exception as e:
+            raise OerpSyncFailed(self, 'Upsert failed. OE server response: %s' % e)
+        log.debug('Upserted %s objects in %s' % (len(ids), self))
+        return ids
+
+
+    def search_read(self, domain, fields, limit=None, order=None):
+        '''
+        Return the given fields of the entries matching a domain, as a list
+        of dicts including the 'id'.
+        '''
+        self._validate_model()
+        try:
+            records = self.model.search_read(domain, fields, 0, limit, order,
+                                             {'active_test': False})
+        except Exception as e:
+            raise OerpSyncFailed(self, 'Search failed. OE server response: %s' % e)
+        log.debug('Read %s objects of %s' % (len(records), self))
+        return records
+
+
+    def load(self, fields, rows):
+        '''
+        Import rows of string values with OpenErp's load(). Returns its
+        result, a dict with the 'ids' of the rows (False if any row failed,
+        nothing is imported then) and the 'messages'.
+        '''
+        self._validate_model()
+        try:
+            res = self.model.load(fields, rows)
+        except Exception as e:
+            raise OerpSyncFailed(self, 'Import failed. OE server response: %s' % e)
+        log.debug('Imported %s rows into %s' % (len(rows), self))
+        return res
+
+
+    def fields_get(self):
+        '''
+        Return the definitions of all fields of the model
+        '''
+        self._validate_model()
+        try:
+            return self.model.fields_get()
+        except Exception as e:
+            raise OerpSyncFailed(self, 'Reading the fields failed. OE server response: %s' % e)
+
+
+    def delete_many(self, ids):
+        '''
+        Deletes several OpenErp objects of the given model with one call.
+        '''
+        self._validate_model()
+        try:
+            log.debug('Deleting %s objects in %s' % (len(ids), self))
+            self.model.unlink(ids)
+        except Exception as errmsg:
+            raise OerpSyncFailed(self, 'The objects %s could not be deleted. OpenERP server response: %s' % (ids, errmsg))
+        return True
+
+
     def create(self, data=None):
         '''
         Create new entry
@@ -101,7 +381,7 @@ class Oerp():
             log.debug('Creating in %s...' % self)
             #log.debug('Data: %s' % str(data))
             id = self.model.create(data)
-            self.set_id(id)
+            self.set_id(id, True)
             log.debug('Created object %s' % self)
         except Exception as errmsg:
             self.set_id(None)
@@ -109,6 +389,68 @@ class Oerp():
         return True
 
 
+    def create_many(self, records):
+        '''
+        Create several entries and return their ids. With 'BULK_CREATE' set
+        in OPENERP_SETTINGS (requires the oesync_server addon), they are
+        created with a single call, in one transaction: if it fails, none
+        of them is created and OerpBatchFailed holds no ids. Otherwise the
+        records are sent one after another over the pooled connection, as
+        OpenErp offers no multi-record create; this saves no round trips.
+        If one of them fails, OerpBatchFailed holds the ids of the records
+        that were created before.
+        '''
+        self._validate_model()
+        for data in records:
+            self._validate_data(data)
+        if self.settings.get('BULK_CREATE', False):
+            try:
+                ids = pool.get_model('oesync.sync').create_many(
+                    self.model_name, records)
+            except Exception as errmsg:
+                raise OerpBatchFailed(self, [], 'Creation of %s records failed. OpenERP server response: %s' % (len(records), errmsg))
+            log.debug('Created %s objects in %s with one call' % (len(ids), self))
+            return ids
+
+        ids = []
+        for data in records:
+            try:
+                ids.append(self.model.create(data))
+            except Exception as errmsg:
+                raise OerpBatchFailed(self, ids, 'Creation failed after %s of %s records. OpenERP server response: %s' % (len(ids), len(records), errmsg))
+        log.debug('Created %s objects in %s' % (len(ids), self))
+        return ids
+
+
+    def write_many(self, records):
+        '''
+        Update several entries given as (id, data) tuples. Entries with
+        identical data are written with a single call. If a call fails,
+        OerpBatchFailed holds the ids that were written before.
+        '''
+        self._validate_model()
+        groups = {}
+        keys = []
+        for id, data in records:
+            self._validate_data(data)
+            key = _freeze(data)
+            if key not in groups:
+                groups[key] = (data, [])
+                keys.append(key)
+            groups[key][1].append(id)
+
+        done = []
+        for key in keys:
+            data, ids = groups[key]
+            try:
+                self.model.write(ids, data)
+            except Exception as errmsg:
+                raise OerpBatchFailed(self, done, 'Update of %s failed. OpenERP server response: %s' % (ids, errmsg))
+            done.extend(ids)
+        log.debug('Updated %s objects in %s with %s calls' % (len(done), self, len(keys)))
+        return True
+
+
     def update(self, data=None):
         '''
         Update OpenErp data.
@@ -210,6 +552,23 @@ class Oerp():
         except Exception as e:
             raise OerpSyncFailed(self, 'Validation failed. OE server response: %s' % e)
 
+    def finalize_order(self, payments):
+        '''
+        Confirm an order (quote), validate its invoice and add the given
+        payments (dicts with the arguments of add_payment) in a single call.
+        Requires the oesync_server addon in OE. Returns a dict with the
+        invoice_id and the voucher_ids of the payments.
+        '''
+        self._validate_model('sale.order')
+        self._validate_existence()
+        try:
+            log.debug('Finalizing %s...' % self)
+            res = self.model.oesync_finalize([self.id], payments)
+            log.debug('Finalized %s' % self)
+        except Exception as e:
+            raise OerpSyncFailed(self, 'Finalization failed. OE server response: %s' % e)
+        return res
+
 
 
 
@@ -226,6 +585,16 @@ class Oerp():
 
 
 
+def _freeze(value):
+    ''' Return a hashable copy of an XMLRPC value '''
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    elif isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+
 class OerpSyncFailed(Exception):
     def __init__(self, oerp_obj, msg=None):
         self.oerp_obj = oerp_obj
@@ -235,3 +604,9 @@ class OerpSyncFailed(Exception):
             return '%s: %s' % (self.oerp_obj, self.msg)
         else:
             return '%s: An error occured. Sync failed.' % self.oerp_obj
+
+
+class OerpBatchFailed(OerpSyncFailed):
+    def __init__(self, oerp_obj, done, msg=None):
+        self.done = done
+        super(OerpBatchFailed, self).__init__(oerp_obj, msg)
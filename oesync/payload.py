@@ -0,0 +1,77 @@
+from oesync.stats import Stats
+import hashlib
+import json
+
+#counts of update payloads that were skipped, sent partially or fully
+stats = Stats('skipped', 'partial', 'full')
+
+
+
+def _digest(value):
+    ''' Return a stable digest of an XMLRPC value '''
+    dump = json.dumps(value, sort_keys=True, default=repr)
+    return hashlib.sha1(dump.encode('utf-8')).hexdigest()
+
+
+def _normalized(field, value):
+    '''
+    Return a field value with its many2many ids sorted: they are a set in
+    OpenErp, but come in queryset order from Satchmo
+    '''
+    if not isinstance(value, list):
+        return value
+    if field.endswith('/id'):
+        #external ids (see ModelMapper.run_plan)
+        return sorted(value)
+    return [_sorted_command(command) for command in value]
+
+
+def _sorted_command(command):
+    ''' Sort the ids of a (6, 0, ids) many2many command '''
+    if isinstance(command, (list, tuple)) and len(command) == 3 and \
+            command[0] == 6 and isinstance(command[2], list):
+        return (6, command[1], sorted(command[2]))
+    return command
+
+
+def fingerprint(data):
+    '''
+    Return (hash, digests) of an OE payload: a digest per field and a hash
+    over all of them. The order of many2many ids does not matter.
+    '''
+    digests = dict((field, _digest(_normalized(field, value))) \
+        for field, value in data.items())
+    return _digest(digests), digests
+
+
+def remember(mapper, data):
+    ''' Store the fingerprint of a successfully synced payload on a mapper '''
+    mapper.payload_hash, digests = fingerprint(data)
+    mapper.payload_digests = json.dumps(digests, sort_keys=True)
+
+
+def changed_data(mapper, data):
+    '''
+    Return the part of a payload that differs from the one last synced for
+    a mapper: an empty dict if nothing changed, only the changed fields if
+    the per-field digests are known and the full payload otherwise.
+    '''
+    payload_hash, digests = fingerprint(data)
+    if payload_hash == mapper.payload_hash:
+        stats.incr('skipped')
+        return {}
+    try:
+        old_digests = json.loads(mapper.payload_digests or '')
+    except ValueError:
+        stats.incr('full')
+        return data
+    changed = dict((field, value) for field, value in data.items() \
+        if old_digests.get(field) != digests[field])
+    if not changed:
+        #only fields that are no longer mapped have changed
+        stats.incr('skipped')
+    elif len(changed) < len(data):
+        stats.incr('partial')
+    else:
+        stats.incr('full')
+    return changed
@@ -0,0 +1,189 @@
+from django.conf import settings
+from oesync.metrics import metrics
+from oesync import history
+import cProfile
+import threading
+import json
+import time
+import os
+import logging
+
+log = logging.getLogger('OESync')
+
+#profiler of the running profiled sync, see profile()
+_profiler = None
+_lock = threading.Lock()
+
+
+
+class _NoPhase(object):
+    ''' Stands in for _Phase while nothing is profiled '''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_no_phase = _NoPhase()
+
+
+
+class _Phase(object):
+    def __init__(self, profiler, name, model):
+        self.profiler = profiler
+        self.name = name
+        self.model = model
+
+    def __enter__(self):
+        self.started = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add(self.name, self.model, time.time() - self.started)
+        return False
+
+
+
+class SyncProfiler(object):
+    '''
+    Collects the time spent per phase and model of a sync:
+
+    - load: fetching the Satchmo objects of the mappers and the OE ids of
+      the objects they refer to, by Satchmo model
+    - map: evaluating the mapping plans of the objects (including related
+      objects the field functions load lazily), by Satchmo model
+    - rpc: waiting for OpenErp, by OE model (taken from oesync.metrics)
+
+    Time of the run not spent in these phases is reported as 'other'. If
+    cprofile is set, the thread starting the run is profiled with cProfile
+    as well.
+    '''
+    phases = ('load', 'map', 'rpc')
+
+    def __init__(self, cprofile=False):
+        self._lock = threading.Lock()
+        #{(phase, model): [seconds, calls]}
+        self._times = {}
+        self.cprofile = cprofile and cProfile.Profile() or None
+        self.seconds = 0.
+
+    def add(self, phase, model, seconds, calls=1):
+        with self._lock:
+            try:
+                times = self._times[(phase, model)]
+            except KeyError:
+                times = self._times[(phase, model)] = [0., 0]
+            times[0] += seconds
+            times[1] += calls
+
+    def start(self):
+        self._rpc_before = metrics.as_dict()
+        self._started = time.time()
+        if self.cprofile is not None:
+            self.cprofile.enable()
+
+    def stop(self):
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        self.seconds = time.time() - self._started
+        #wait for OpenErp = everything recorded by the metrics meanwhile
+        for (model, method), metric in metrics.as_dict().items():
+            before = self._rpc_before.get((model, method), {})
+            calls = metric['count'] - before.get('count', 0)
+            if calls:
+                self.add('rpc', model,
+                         metric['seconds'] - before.get('seconds', 0.), calls)
+
+    def breakdown(self):
+        '''
+        Return {'seconds': total, 'other': seconds outside the phases,
+        'phases': {phase: {model: {'seconds': s, 'calls': n}}}}
+        '''
+        phases = dict((phase, {}) for phase in self.phases)
+        measured = 0.
+        with self._lock:
+            for (phase, model), (seconds, calls) in self._times.items():
+                phases.setdefault(phase, {})[model] = {
+                    'seconds': seconds, 'calls': calls}
+                measured += seconds
+        return {
+            'seconds': self.seconds,
+            'other': max(self.seconds - measured, 0.),
+            'phases': phases,
+        }
+
+    def dump_stats(self, path):
+        ''' Write the cProfile statistics to a file (see pstats) '''
+        self.cprofile.dump_stats(path)
+
+
+
+def phase(name, model):
+    '''
+    Return a context manager timing a phase of the running profiled sync
+    for a model. Does nothing if no sync is profiled.
+    '''
+    profiler = _profiler
+    if profiler is None:
+        return _no_phase
+    return _Phase(profiler, name, model)
+
+
+def profile(func, args=(), kwargs=None, trigger='syncnow', profile_dir=None):
+    '''
+    Run a sync function with a SyncProfiler and save the breakdown with
+    a SyncRun of its own (see oesync.history), even within the recording
+    of e.g. the worker. If profile_dir (or 'PROFILE_DIR' in
+    OPENERP_SETTINGS) is set, the cProfile statistics are dumped there to
+    syncrun-<id>.prof. Everything synced by this process
+    meanwhile is measured, so only one sync can be profiled at a time.
+    Returns the result of func and the SyncRun.
+    '''
+    global _profiler
+    if profile_dir is None:
+        profile_dir = settings.OPENERP_SETTINGS.get('PROFILE_DIR')
+    profiler = SyncProfiler(cprofile=bool(profile_dir))
+    with _lock:
+        if _profiler is not None:
+            raise RuntimeError('Another sync is being profiled')
+        _profiler = profiler
+    try:
+        with history.recording(trigger, keep=True, separate=True) as recorder:
+            profiler.start()
+            try:
+                res = func(*args, **(kwargs or {}))
+                recorder.result = bool(res)
+            finally:
+                profiler.stop()
+                recorder.run.profile = json.dumps(profiler.breakdown())
+    finally:
+        _profiler = None
+    run = recorder.run
+    if profile_dir and run.id is not None:
+        run.profile_file = os.path.join(profile_dir, 'syncrun-%s.prof' % run.id)
+        profiler.dump_stats(run.profile_file)
+        run.save()
+    log.info('Profile of sync run %s:\n%s' % (run.id, report(run)))
+    return res, run
+
+
+def report(run):
+    ''' Return the breakdown of a SyncRun as a text table, slowest first '''
+    if not run.profile:
+        return ''
+    data = json.loads(run.profile)
+    total = max(data['seconds'], 0.000001)
+    rows = []
+    for phase, models in data['phases'].items():
+        for model, times in models.items():
+            rows.append((times['seconds'], phase, model, times['calls']))
+    rows.sort(reverse=True)
+    lines = ['%-6s %-32s %8s %10s %7s' % ('phase', 'model', 'calls', 'seconds', '%')]
+    for seconds, phase, model, calls in rows:
+        lines.append('%-6s %-32s %8d %10.3f %6.1f%%' % (
+            phase, model, calls, seconds, seconds * 100 / total))
+    lines.append('%-6s %-32s %8s %10.3f %6.1f%%' % (
+        'other', '', '', data['other'], data['other'] * 100 / total))
+    lines.append('%-6s %-32s %8s %10.3f' % ('total', '', '', data['seconds']))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,194 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import models, transaction
+from django.conf import settings
+from oesync.models import ObjMapper, PullWatermark
+from oesync.oerprpc import Oerp
+from oesync.stats import Stats
+import oesync.mapping_config as mapping
+import logging
+
+log = logging.getLogger('OESync')
+
+
+
+class PullSync(object):
+    '''
+    Pulls changes made in OpenErp back into Satchmo, as configured by the
+    pull_mapping in mapping_config.py. Each OpenErp model (or its source
+    model of pull_sources) is polled for records written after its
+    watermark, page by page in the order of (write_date, id). Records never
+    written (write_date is NULL) are skipped. The records are mapped back
+    to Satchmo objects through their ObjMappers and applied with bulk
+    updates. The watermark is stored after each page, so an interrupted
+    pull resumes where it stopped.
+    '''
+    def __init__(self, page_size=None):
+        self.page_size = page_size or \
+            settings.OPENERP_SETTINGS.get('PULL_PAGE_SIZE', 200)
+        self.mapping = mapping.pull_mapping
+        self.sources = getattr(mapping, 'pull_sources', {})
+        self.stats = Stats('pages', 'fetched', 'applied', 'unchanged', 'unmapped')
+
+    def get_oerp_models(self):
+        ''' Return the OpenErp models of the pull mapping '''
+        return sorted(set(oerp_model for model_mapping in self.mapping.values() \
+            for oerp_model in model_mapping))
+
+    def get_fields(self, oerp_model):
+        '''
+        Return {content type id: (model class, {oerp_field: satchmo_field})}
+        of the Satchmo models receiving changes of an OpenErp model.
+        '''
+        fields = {}
+        for model_name, model_mapping in self.mapping.items():
+            if oerp_model not in model_mapping:
+                continue
+            content_type = ContentType.objects.get(model=model_name.lower())
+            fields[content_type.id] = (
+                content_type.model_class(), model_mapping[oerp_model])
+        return fields
+
+    def run(self, oerp_models=None):
+        ''' Pull the given (or all) OpenErp models '''
+        for oerp_model in oerp_models or self.get_oerp_models():
+            self.pull_model(oerp_model)
+        return self.stats
+
+    def reset(self, oerp_models=None):
+        ''' Drop the watermarks, so the next pull reads all records '''
+        watermarks = PullWatermark.objects.all()
+        if oerp_models:
+            watermarks = watermarks.filter(oerp_model__in=oerp_models)
+        watermarks.delete()
+
+    def pull_model(self, oerp_model):
+        ''' Pull all records of an OpenErp model changed since the last pull '''
+        fields = self.get_fields(oerp_model)
+        if not fields:
+            log.warning('There is no pull mapping for \'%s\'' % oerp_model)
+            return
+        oerp_fields = sorted(set(oerp_field for model, field_mapping \
+            in fields.values() for oerp_field in field_mapping))
+        watermark, created = PullWatermark.objects.get_or_create(
+            oerp_model=oerp_model)
+        oerp = Oerp(oerp_model)
+        source_model, source_field, source_domain = self.sources.get(
+            oerp_model, (oerp_model, None, []))
+        source = Oerp(source_model)
+        source_fields = source_field and [source_field] or oerp_fields
+
+        while True:
+            page = source.search_read(
+                _domain(watermark) + list(source_domain),
+                source_fields + ['write_date'],
+                limit=self.page_size, order='write_date asc, id asc')
+            if not page:
+                break
+            page.sort(key=lambda record: (record['write_date'], record['id']))
+            self.stats.incr('pages')
+            if source_field is None:
+                records = page
+            else:
+                records = self._read_referred(oerp, page, source_field, oerp_fields)
+            self.stats.incr('fetched', len(records))
+            with transaction.commit_on_success():
+                self._apply(oerp_model, records, fields)
+                watermark.write_date = page[-1]['write_date']
+                watermark.last_id = page[-1]['id']
+                watermark.save()
+            if len(page) < self.page_size:
+                break
+
+    def _read_referred(self, oerp, page, source_field, oerp_fields):
+        ''' Read the records a page of source records refers to '''
+        ids = set()
+        for record in page:
+            value = record[source_field]
+            #many2one fields are read as [id, name], False if empty
+            if isinstance(value, (list, tuple)):
+                value = value[0]
+            if value:
+                ids.add(value)
+        if not ids:
+            return []
+        return oerp.search_read([('id', 'in', sorted(ids))], oerp_fields)
+
+    def _apply(self, oerp_model, records, fields):
+        ''' Apply a page of OpenErp records to the mapped Satchmo objects '''
+        by_oerp_id = dict((record['id'], record) for record in records)
+        #uses the (oerp_model, oerp_id) index
+        mappers = ObjMapper.objects.filter(oerp_model=oerp_model,
+            oerp_id__in=by_oerp_id.keys(), content_type__in=fields.keys()
+            ).values_list('content_type_id', 'object_id', 'oerp_id')
+
+        #an OE record may be mapped by several Satchmo models
+        objects = {}
+        mapped = set()
+        for content_type_id, object_id, oerp_id in mappers:
+            objects.setdefault(content_type_id, {})[object_id] = by_oerp_id[oerp_id]
+            mapped.add(oerp_id)
+        self.stats.incr('unmapped', len(by_oerp_id) - len(mapped))
+
+        for content_type_id, records_by_object in objects.items():
+            model, field_mapping = fields[content_type_id]
+            self._update_objects(model, field_mapping, records_by_object)
+
+    def _update_objects(self, model, field_mapping, records_by_object):
+        '''
+        Write the pulled values to the objects of a Satchmo model, given as
+        {object id: OpenErp record}. Objects whose values have not changed
+        are left alone, the others are updated with one query per set of
+        identical values. Updates bypass save(), so no signals are sent and
+        the changes are not pushed back to OpenErp.
+        '''
+        model_fields = dict((satchmo_field, model._meta.get_field(satchmo_field)) \
+            for satchmo_field in field_mapping.values())
+        current = dict((values['id'], values) for values in \
+            model.objects.filter(id__in=records_by_object.keys()).values(
+                'id', *model_fields.keys()))
+
+        groups = {}
+        for object_id, record in records_by_object.items():
+            if object_id not in current:
+                continue
+            values = {}
+            for oerp_field, satchmo_field in field_mapping.items():
+                value = _to_python(model_fields[satchmo_field], record[oerp_field])
+                if value != current[object_id][satchmo_field]:
+                    values[satchmo_field] = value
+            if not values:
+                self.stats.incr('unchanged')
+                continue
+            key = tuple(sorted(values.items()))
+            groups.setdefault(key, []).append(object_id)
+
+        for key, ids in groups.items():
+            model.objects.filter(id__in=ids).update(**dict(key))
+            self.stats.incr('applied', len(ids))
+        log.debug('Pulled %s changed %s objects' % \
+            (sum(len(ids) for ids in groups.values()), model.__name__))
+
+
+
+def _domain(watermark):
+    '''
+    Return the OE domain of the records after a watermark. Records whose
+    write_date is NULL cannot be placed after a watermark, they are left out.
+    '''
+    if not watermark.write_date:
+        return [('write_date', '!=', False)]
+    #records written in the same second as the last one are told apart by id
+    return ['|', ('write_date', '>', watermark.write_date),
+            '&', ('write_date', '=', watermark.write_date),
+                 ('id', '>', watermark.last_id)]
+
+
+def _to_python(field, value):
+    ''' Convert an XMLRPC value to the type of a Satchmo field '''
+    #OE returns False for empty values
+    if value is False and not isinstance(field, models.BooleanField):
+        return None if field.null else ''
+    if isinstance(value, float) and isinstance(field, models.DecimalField):
+        #avoid the binary expansion of floats, e.g. 2.3
+        value = repr(value)
+    return field.to_python(value)
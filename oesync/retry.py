@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.encoding import force_unicode
+from datetime import timedelta
+import logging
+
+log = logging.getLogger('OESync')
+
+#longest error message kept in last_error
+_max_error_length = 2000
+
+
+
+def delay(attempts):
+    '''
+    Return the seconds to wait after the given number of failed attempts:
+    'RETRY_DELAY' (default 60) doubled after every further failure, up to
+    'RETRY_MAX_DELAY' (default one day)
+    '''
+    config = settings.OPENERP_SETTINGS
+    seconds = config.get('RETRY_DELAY', 60) * 2 ** max(attempts - 1, 0)
+    return min(seconds, config.get('RETRY_MAX_DELAY', 86400))
+
+
+def max_attempts():
+    ''' Return the attempts after which a mapper is given up, None for never '''
+    return settings.OPENERP_SETTINGS.get('RETRY_MAX_ATTEMPTS', 10) or None
+
+
+def is_dead(attempts):
+    limit = max_attempts()
+    return limit is not None and attempts >= limit
+
+
+def next_attempt(attempts, now=None):
+    ''' Return when to retry after the given attempts, None if never '''
+    if is_dead(attempts):
+        return None
+    return (now or timezone.now()) + timedelta(seconds=delay(attempts))
+
+
+def eligible(queryset, now=None):
+    '''
+    Filter a queryset of (dirty) mappers for those that are due: never
+    failed, or failed less than max_attempts() times and waited long
+    enough since
+    '''
+    queryset = queryset.filter(
+        Q(next_attempt__isnull=True) | Q(next_attempt__lte=now or timezone.now()))
+    limit = max_attempts()
+    if limit is not None:
+        queryset = queryset.filter(attempts__lt=limit)
+    return queryset
+
+
+def failed(mapper, error):
+    ''' Count a failed attempt of a mapper and postpone the next one (not saved) '''
+    mapper.attempts += 1
+    mapper.last_error = force_unicode(error, errors='replace')[:_max_error_length]
+    mapper.next_attempt = next_attempt(mapper.attempts)
+    if mapper.next_attempt is None:
+        log.warning('Giving up on %s %s after %s attempts -- %s' % (
+            mapper.__class__.__name__, mapper.id, mapper.attempts, mapper.last_error))
+
+
+def reset(mapper):
+    ''' Forget the failed attempts of a mapper (not saved) '''
+    mapper.attempts = 0
+    mapper.last_error = ''
+    mapper.next_attempt = None
+
+
+def record_failures(model, errors):
+    '''
+    Count a failed attempt for each of the mappers of a model given as
+    {mapper id: error}, with one update per error and number of attempts
+    '''
+    groups = {}
+    for id, attempts in model.objects.filter(id__in=list(errors)).values_list(
+            'id', 'attempts'):
+        error = force_unicode(errors[id], errors='replace')[:_max_error_length]
+        groups.setdefault((attempts + 1, error), []).append(id)
+    now = timezone.now()
+    for (attempts, error), ids in groups.items():
+        model.objects.filter(id__in=ids).update(
+            is_dirty=True,
+            attempts=attempts,
+            last_error=error,
+            next_attempt=next_attempt(attempts, now))
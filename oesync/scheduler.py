@@ -0,0 +1,132 @@
+from django.contrib.contenttypes.models import ContentType
+from oesync.fields import ForeignIdField, ManyForeignIdField
+from oesync.models import DeletedObjMapper
+from collections import OrderedDict
+import logging
+
+log = logging.getLogger('OESync')
+
+
+
+class SyncScheduler(object):
+    '''
+    Orders the synchronization of mappers by the references between the
+    mapped Satchmo models. A model referring to another one through a
+    ForeignIdField or ManyForeignIdField (e.g. AddressBook -> Country)
+    depends on it: its objects are created and updated after those of the
+    other model, and deleted before them. Mappers of models that do not
+    depend on each other can be synced at the same time.
+    '''
+    def __init__(self, model_mapper):
+        self.dependencies = self._get_dependencies(model_mapper)
+        self.levels = self._get_levels(self.dependencies)
+        #models whose objects refer to each other have to be created in order
+        self.self_references = set([plan.model_name.lower() for \
+            plan in model_mapper.plans.values() \
+            if plan.action == 'create' and plan.self_reference])
+
+    def _get_dependencies(self, model_mapper):
+        ''' Return {model: set of models it refers to}, lower case names '''
+        names = set(name.lower() for name in model_mapper.mapping)
+        dependencies = dict((name, set()) for name in names)
+        for plan in model_mapper.plans.values():
+            model = plan.model_name.lower()
+            for oerp_field, satchmo_field in plan.fields:
+                #IdFields refer to the own model, e.g. the parent of a category.
+                #Such references are handled when batching (see listeners._chunk_group)
+                if not isinstance(satchmo_field, (ForeignIdField, ManyForeignIdField)):
+                    continue
+                target = satchmo_field.param_name.lower()
+                if target != model and target in names:
+                    dependencies[model].add(target)
+        return dependencies
+
+    def _get_levels(self, dependencies):
+        '''
+        Return {model: level}, where every model has a higher level than the
+        models it depends on, or None if the references are circular.
+        '''
+        levels = {}
+        remaining = dict((model, set(deps)) for model, deps in dependencies.items())
+        level = 0
+        while remaining:
+            ready = [model for model, deps in remaining.items() if not deps]
+            if not ready:
+                log.warning('The mapping contains circular references (%s), '
+                    'objects are synced one model at a time' % \
+                    ', '.join(sorted(remaining)))
+                return None
+            for model in ready:
+                levels[model] = level
+                del remaining[model]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+            level += 1
+        return levels
+
+    def get_model_stages(self):
+        '''
+        Return the order of get_stages() by model, as a list of (kind,
+        models) tuples, where kind is either 'delete' or 'save'. Returns
+        None if the references are circular.
+        '''
+        if self.levels is None:
+            return None
+        by_level = {}
+        for model, level in self.levels.items():
+            by_level.setdefault(level, []).append(model)
+        levels = sorted(by_level)
+        return [('delete', sorted(by_level[level])) for level in reversed(levels)] + \
+               [('save', sorted(by_level[level])) for level in levels]
+
+    def get_stages(self, mappers):
+        '''
+        Split the sorted mappers into stages that have to be synced one
+        after the other. Each stage is a list of groups of mappers with the
+        same content type, OE model and action; the groups of a stage are
+        independent of each other. Deletions come first, starting with the
+        models depending on others, followed by creations and updates in
+        the opposite order, the creations of a model in a stage before its
+        updates. The objects of a model referring to each other (e.g.
+        categories and their parents) are created and updated in a single
+        group, in the order of the mappers. Within a group, the mappers
+        keep their order.
+        '''
+        if self.levels is None:
+            return [[group] for group in _runs(mappers)]
+
+        top = max([0] + list(self.levels.values())) + 1
+        stages = {}
+        for mapper in mappers:
+            model = _model_name(mapper)
+            level = self.levels.get(model, 0)
+            action = mapper.sync_action
+            if isinstance(mapper, DeletedObjMapper):
+                stage = top - 1 - level
+            elif model in self.self_references:
+                stage = top + 2 * level
+                action = 'save'
+            else:
+                stage = top + 2 * level + (action == 'update' and 1 or 0)
+            key = (mapper.content_type_id, mapper.oerp_model, action)
+            stages.setdefault(stage, OrderedDict()).setdefault(key, []).append(mapper)
+        return [list(stages[stage].values()) for stage in sorted(stages)]
+
+
+def _model_name(mapper):
+    return ContentType.objects.get_for_id(mapper.content_type_id).model
+
+
+def _runs(mappers):
+    ''' Split mappers into runs of consecutive mappers of the same kind '''
+    group = []
+    group_key = None
+    for mapper in mappers:
+        key = (mapper.content_type_id, mapper.oerp_model, mapper.sync_action)
+        if key != group_key and group:
+            yield group
+            group = []
+        group_key = key
+        group.append(mapper)
+    if group:
+        yield group
@@ -0,0 +1,179 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.db.models import Q
+from django.conf import settings
+from django.utils import timezone
+from oesync.models import ObjMapper, DeletedObjMapper
+from oesync.stats import Stats
+from oesync import listeners, history, leases, retry
+from multiprocessing import Pool
+import socket
+import time
+import os
+import logging
+
+log = logging.getLogger('OESync')
+
+_counters = ('claimed', 'synced', 'failed', 'chunks', 'seconds')
+
+
+
+class ShardedSync(object):
+    '''
+    Syncs the dirty mappers with several worker processes. The mapped models
+    are processed stage by stage in the order given by the scheduler (see
+    SyncScheduler.get_model_stages), so references between models are
+    respected; all workers finish a stage before the next one starts.
+    Within a stage, the workers claim disjoint chunks of mappers by setting
+    a lease on them. Models whose objects refer to each other (e.g.
+    categories) are synced by a single worker.
+    '''
+    def __init__(self, processes, lease_time=300, chunk_size=None):
+        self.processes = processes
+        self.lease_time = lease_time
+        self.chunk_size = chunk_size or \
+            settings.OPENERP_SETTINGS.get('CHUNK_SIZE', 50)
+        #{worker pid: Stats}
+        self.worker_stats = {}
+        self.stats = Stats(*_counters)
+
+    def get_stages(self):
+        '''
+        Return a list of (kind, shared, exclusive) tuples, where shared and
+        exclusive are lists of content type ids. Mappers of shared content
+        types are claimed by all workers, each exclusive content type is
+        assigned to a single worker.
+        '''
+        model_stages = listeners.scheduler.get_model_stages()
+        if model_stages is None:
+            raise ValueError('The mapping contains circular references')
+        stages = []
+        for kind, models in model_stages:
+            shared = []
+            exclusive = []
+            for model in models:
+                ids = list(ContentType.objects.filter(
+                    model=model).values_list('id', flat=True))
+                if kind == 'save' and model in listeners.scheduler.self_references:
+                    exclusive.extend(ids)
+                else:
+                    shared.extend(ids)
+            stages.append((kind, shared, exclusive))
+        return stages
+
+    def run(self):
+        ''' Sync all dirty mappers, returns False if some of them failed '''
+        with history.recording('shards') as recorder:
+            res = self._run(recorder)
+            recorder.result = res
+        return res
+
+    def _run(self, recorder):
+        stages = self.get_stages()
+        ord_ids = listeners._pending_orders(retry.eligible(ObjMapper.objects.all()))
+        cutoff = timezone.now()
+
+        #the workers must not share the database connection of this process
+        connection.close()
+        workers = Pool(self.processes)
+        try:
+            for kind, shared, exclusive in stages:
+                if not shared and not exclusive:
+                    continue
+                tasks = []
+                for index in range(self.processes):
+                    tasks.append((kind, shared,
+                        exclusive[index::self.processes], cutoff,
+                        self.lease_time, self.chunk_size))
+                for pid, counts, recorded in workers.map(_run_shard, tasks):
+                    self._add_stats(pid, counts)
+                    recorder.merge(recorded)
+        finally:
+            workers.close()
+            workers.join()
+
+        res = self.stats.get('failed') == 0
+        window_size = settings.OPENERP_SETTINGS.get('WINDOW_SIZE', 1000)
+        return listeners._validate_orders(ord_ids, window_size, recorder) and res
+
+    def _add_stats(self, pid, counts):
+        stats = self.worker_stats.setdefault(pid, Stats(*_counters))
+        for key, value in counts.items():
+            stats.incr(key, value)
+            self.stats.incr(key, value)
+
+
+
+def _run_shard(args):
+    '''
+    Claim and sync chunks of mappers of a stage until there are none left.
+    Runs in a worker process, returns (pid, counts, recorded), where
+    recorded are the counts() of a SyncRecorder.
+    '''
+    kind, shared, exclusive, cutoff, lease_time, chunk_size = args
+    owner = '%s:%s' % (socket.gethostname(), os.getpid())
+    stats = Stats(*_counters)
+    started = time.time()
+    #counts the batches for the SyncRun of the parent process
+    recorder = history.SyncRecorder('shards')
+    recorder.start()
+
+    if kind == 'delete':
+        mapper_class = DeletedObjMapper
+        due = Q(date_modified__lte=cutoff)
+    else:
+        #the same cutoff as in syncnow(): creations by their creation date
+        mapper_class = ObjMapper
+        due = Q(oerp_id__isnull=True, date_created__lte=cutoff) | \
+              Q(oerp_id__isnull=False, date_modified__lte=cutoff)
+    mappers_all = retry.eligible(mapper_class.objects.filter(
+        due,
+        #mappers that became dirty during the run are left for the next one
+        parent = None,
+        is_dirty = True))
+
+    for content_types in (shared, exclusive):
+        if not content_types:
+            continue
+        queryset = mappers_all.filter(content_type__in=content_types)
+        while True:
+            mappers = leases.claim(queryset, owner, chunk_size, lease_time)
+            if not mappers:
+                break
+            stats.incr('claimed', len(mappers))
+            stats.incr('chunks')
+            try:
+                _sync_claimed(mappers, chunk_size, recorder)
+            except Exception as e:
+                log.exception('Sync of claimed objects failed -- %s' % e)
+            #release the leases of the synced mappers; failed ones are
+            #retried once their lease has expired
+            synced = mapper_class.objects.filter(
+                id__in=[mapper.id for mapper in mappers],
+                is_dirty=False).update(lease_owner=None, lease_expires=None)
+            stats.incr('synced', synced)
+            stats.incr('failed', len(mappers) - synced)
+
+    connection.close()
+    stats.incr('seconds', time.time() - started)
+    return os.getpid(), stats.as_dict(), recorder.counts()
+
+
+def _sync_claimed(mappers, chunk_size, recorder=None):
+    ''' Sync claimed mappers in the same way as syncnow() '''
+    for mapper in mappers:
+        if isinstance(mapper, DeletedObjMapper):
+            mapper.sync_action = 'delete'
+            mapper.timestamp = mapper.date_modified
+        elif mapper.oerp_id is None:
+            mapper.sync_action = 'create'
+            mapper.timestamp = mapper.date_created
+        else:
+            mapper.sync_action = 'update'
+            mapper.timestamp = mapper.date_modified
+    #the order of syncnow(), see listeners._stream_mappers
+    mappers.sort(key=lambda mapper: (mapper.timestamp,
+        listeners._sync_actions.index(mapper.sync_action), mapper.id))
+    existing = listeners._resolve_existence(mappers)
+    for stage in listeners.scheduler.get_stages(mappers):
+        listeners._sync_stage(stage, chunk_size, existing, recorder=recorder)
@@ -0,0 +1,31 @@
+import threading
+
+
+
+class Stats(object):
+    '''
+    Thread-safe set of named counters.
+    '''
+    def __init__(self, *keys):
+        self._keys = keys
+        self._lock = threading.Lock()
+        self.reset()
+
+    def incr(self, key, n=1):
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + n
+
+    def get(self, key):
+        return self._counts.get(key, 0)
+
+    def as_dict(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict((key, 0) for key in self._keys)
+
+    def __repr__(self):
+        return '<Stats: %s>' % ', '.join(
+            '%s=%s' % item for item in sorted(self.as_dict().items()))
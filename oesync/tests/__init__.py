@@ -0,0 +1,17 @@
+'''
+Tests of oesync, run by Django's test runner through suite(). The modules
+rpc and payload need neither satchmo nor a database and can be run on their
+own, e.g. python -m unittest oesync.tests.rpc
+'''
+import unittest
+
+#imported by suite() only, so that importing the standalone modules does
+#not import satchmo
+MODULES = ('rpc', 'payload', 'mapping', 'sync', 'pull')
+
+
+
+def suite():
+    loader = unittest.defaultTestLoader
+    return unittest.TestSuite([loader.loadTestsFromName('oesync.tests.%s' % name) \
+        for name in MODULES])
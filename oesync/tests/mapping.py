@@ -0,0 +1,171 @@
+from django.test import TestCase
+from django.contrib.contenttypes.models import ContentType
+from oesync.models import ObjMapper
+from oesync.modelmapper import ModelMapper, MappingError
+from oesync.fields import GetField, StdField, ForeignIdField, \
+    ManyForeignIdField, IdResolver, compile_path, resolve_path
+from oesync.scheduler import SyncScheduler
+from oesync.cache import id_cache
+from oesync import mapping_config
+from product.models import Category
+from decimal import Decimal
+
+
+
+class Record(object):
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+
+
+def compile_mapping(model_mapping):
+    ''' Return a ModelMapper of the given mapping instead of mapping_config's '''
+    original = mapping_config.mapping
+    mapping_config.mapping = model_mapping
+    try:
+        return ModelMapper.__class__()
+    finally:
+        mapping_config.mapping = original
+
+
+
+class ModelMapperTest(TestCase):
+
+    def test_plans_per_action(self):
+        model_mapper = compile_mapping({'Category': {
+            'product.category': {
+                'name': StdField('name'),
+                'sequence': StdField('ordering', actions=['create']),
+                'parent_id': ForeignIdField('parent_id', 'Category'),
+                'product.public.category': {
+                    '_AUTO_DELETE': True,
+                    'name': StdField('name'),
+                },
+            },
+        }})
+        create = model_mapper.get_plan('Category', 'product.category', 'create')
+        update = model_mapper.get_plan('Category', 'product.category', 'update')
+        child = model_mapper.get_plan('Category',
+            ('product.category', 'product.public.category'), 'update')
+
+        self.assertEqual([field for field, getter in create.fields],
+                         ['name', 'parent_id', 'sequence'])
+        self.assertEqual([field for field, getter in update.fields],
+                         ['name', 'parent_id'])
+        self.assertEqual(create.children, ('product.public.category',))
+        self.assertTrue(create.self_reference)
+        self.assertFalse(create.auto_delete)
+        self.assertTrue(child.auto_delete)
+        self.assertEqual(model_mapper.run_plan(child, Record(name='a')), {'name': 'a'})
+        self.assertRaises(MappingError, model_mapper.get_plan,
+            'Category', 'product.product', 'create')
+
+    def test_oe_model_mapped_at_different_levels(self):
+        model_mapper = compile_mapping({'Product': {
+            'product.template': {
+                'name': GetField('name'),
+                'product.product': {
+                    'default_code': GetField('sku'),
+                    'product.template': {'name': GetField('name')},
+                },
+            },
+        }})
+        root = model_mapper.get_plan('Product', 'product.template', 'create')
+        nested = model_mapper.get_plan('Product', ('product.template',
+            'product.product', 'product.template'), 'create')
+
+        self.assertEqual(root.children, ('product.product',))
+        self.assertEqual(nested.children, ())
+        self.assertEqual(root.external_model, 'product.template')
+        self.assertEqual(nested.external_model,
+                         'product.template.product.product.product.template')
+
+
+
+class CompiledPathTest(TestCase):
+
+    def test_attributes_and_method_calls(self):
+        record = Record(contact=Record(name='ann'))
+
+        self.assertEqual(len(compile_path('contact.name')), 1)
+        self.assertEqual(resolve_path(record, compile_path('contact.name')), 'ann')
+        self.assertEqual(resolve_path(record, compile_path('contact.name.upper()')), 'ANN')
+
+    def test_invalid_paths(self):
+        for path in ('contact..name', 'name.upper(1)', '__import__("os")'):
+            self.assertRaises(ValueError, compile_path, path)
+
+    def test_std_field(self):
+        record = Record(price=Decimal('10'), name='')
+
+        self.assertEqual(StdField('price').get_content(record, 'product.product'), '10')
+        self.assertEqual(StdField('name').get_content(record, 'product.product'), False)
+        self.assertEqual(StdField('missing', default=1).get_content(
+            record, 'product.product'), 1)
+        self.assertRaises(Exception, StdField('missing').get_content,
+            record, 'product.product')
+
+
+
+class IdResolverTest(TestCase):
+
+    def test_oerp_ids_are_loaded_with_one_query(self):
+        content_type = ContentType.objects.get_for_model(Category)
+        for id in (1, 2):
+            ObjMapper.objects.create(content_type=content_type, object_id=id,
+                oerp_model='product.category', oerp_id=id + 10)
+        field = ForeignIdField('category_id', 'Category', 'product.category')
+        plan = Record(fields=(('categ_id', field),), oerp_model='product.template')
+        records = [Record(category_id=id) for id in (1, 2, 3)]
+        resolver = IdResolver()
+        #look up the content type
+        field.get_references(records[0], plan.oerp_model)
+
+        with id_cache.isolated():
+            with self.assertNumQueries(1):
+                resolver.prefetch(plan, records)
+            with self.assertNumQueries(0):
+                values = [field.get_content(record, plan.oerp_model, resolver) \
+                    for record in records]
+
+        self.assertEqual(values, [11, 12, False])
+
+
+
+class SyncSchedulerTest(TestCase):
+
+    def test_models_are_staged_by_their_references(self):
+        scheduler = SyncScheduler(compile_mapping({
+            'Country': {'res.country': {'name': StdField('name')}},
+            'AddressBook': {'res.partner': {
+                'country_id': ForeignIdField('country_id', 'Country'),
+            }},
+            'Contact': {'res.partner': {
+                'child_ids': ManyForeignIdField('addressbook_set', 'AddressBook'),
+            }},
+            'Category': {'product.category': {
+                'parent_id': ForeignIdField('parent_id', 'Category'),
+            }},
+        }))
+
+        self.assertEqual(scheduler.levels, {'country': 0, 'category': 0,
+            'addressbook': 1, 'contact': 2})
+        self.assertEqual(scheduler.self_references, set(['category']))
+        self.assertEqual(scheduler.get_model_stages(), [
+            ('delete', ['contact']), ('delete', ['addressbook']),
+            ('delete', ['category', 'country']),
+            ('save', ['category', 'country']), ('save', ['addressbook']),
+            ('save', ['contact'])])
+
+    def test_circular_references(self):
+        scheduler = SyncScheduler(compile_mapping({
+            'Country': {'res.country': {
+                'partner_id': ForeignIdField('partner_id', 'AddressBook'),
+            }},
+            'AddressBook': {'res.partner': {
+                'country_id': ForeignIdField('country_id', 'Country'),
+            }},
+        }))
+
+        self.assertEqual(scheduler.levels, None)
+        self.assertEqual(scheduler.get_model_stages(), None)
@@ -0,0 +1,32 @@
+from oesync import payload
+import unittest
+
+
+
+class Mapper(object):
+    payload_hash = ''
+    payload_digests = ''
+
+
+
+class PayloadTest(unittest.TestCase):
+
+    def test_only_changed_fields_are_sent(self):
+        mapper = Mapper()
+        data = {'name': 'a', 'list_price': '1.5'}
+
+        self.assertEqual(payload.changed_data(mapper, data), data)
+        payload.remember(mapper, data)
+        self.assertEqual(payload.changed_data(mapper, dict(data)), {})
+        self.assertEqual(payload.changed_data(mapper, dict(data, name='b')),
+                         {'name': 'b'})
+        #a field that is no longer mapped
+        self.assertEqual(payload.changed_data(mapper, {'name': 'a'}), {})
+
+    def test_many2many_order_does_not_matter(self):
+        self.assertEqual(
+            payload.fingerprint({'categ_ids': [(6, 0, [3, 1])], 'tag/id': ['b', 'a']}),
+            payload.fingerprint({'categ_ids': [(6, 0, [1, 3])], 'tag/id': ['a', 'b']}))
+        self.assertNotEqual(
+            payload.fingerprint({'categ_ids': [(6, 0, [1, 3])]}),
+            payload.fingerprint({'categ_ids': [(6, 0, [1, 4])]}))
@@ -0,0 +1,94 @@
+from django.contrib.contenttypes.models import ContentType
+from oesync.tests.sync import FakeOpenErpTestCase
+from oesync.models import ObjMapper, PullWatermark
+from oesync.listeners import syncnow
+from oesync.pull import PullSync
+from product.models import Product, Category
+
+
+
+class PullSyncTest(FakeOpenErpTestCase):
+
+    def setUp(self):
+        super(PullSyncTest, self).setUp()
+        self.fixtures = self.create_fixtures(categories=1, products=5)
+        self.assertTrue(syncnow())
+        self.oerp_ids = [ObjMapper.objects.get(
+            content_type=ContentType.objects.get_for_model(Product),
+            object_id=product.id, oerp_model='product.product').oerp_id \
+            for product in self.fixtures.products]
+        products = self.fake.data['product.product']
+        for index, oerp_id in enumerate(self.oerp_ids):
+            products[oerp_id]['qty_available'] = float(index)
+        moves = self.fake.data.setdefault('stock.move', {})
+        #two moves are done per second
+        for index, oerp_id in enumerate(self.oerp_ids):
+            moves[1000 + index] = {'product_id': [oerp_id, 'test'], 'state': 'done',
+                'write_date': '2026-01-01 00:00:0%s' % (index // 2)}
+        #not done yet, and never written
+        moves[1010] = {'product_id': [self.oerp_ids[0], 'test'], 'state': 'draft',
+            'write_date': '2026-01-01 00:00:00'}
+        moves[1011] = {'product_id': [self.oerp_ids[1], 'test'], 'state': 'done',
+            'write_date': False}
+
+    def get_stock(self):
+        return [int(Product.objects.get(id=product.id).items_in_stock) \
+            for product in self.fixtures.products]
+
+    def test_pages_move_the_watermark(self):
+        stats = PullSync(page_size=2).run(['product.product'])
+
+        self.assertEqual(stats.as_dict()['pages'], 3)
+        self.assertEqual(self.get_stock(), [0, 1, 2, 3, 4])
+        watermark = PullWatermark.objects.get(oerp_model='product.product')
+        self.assertEqual((watermark.write_date, watermark.last_id),
+                         ('2026-01-01 00:00:02', 1004))
+
+        #nothing happened since
+        stats = PullSync(page_size=2).run(['product.product'])
+        self.assertEqual(stats.as_dict()['fetched'], 0)
+
+        #moves done in the same second as the watermark are told apart by id
+        self.fake.data['product.product'][self.oerp_ids[0]]['qty_available'] = 7.
+        self.fake.data['stock.move'][1005] = {'product_id': [self.oerp_ids[0], 'test'],
+            'state': 'done', 'write_date': '2026-01-01 00:00:02'}
+        stats = PullSync(page_size=2).run(['product.product'])
+        self.assertEqual(stats.as_dict()['fetched'], 1)
+        self.assertEqual(self.get_stock(), [7, 1, 2, 3, 4])
+
+    def test_record_mapped_by_several_models(self):
+        category = self.fixtures.categories[0]
+        ObjMapper.objects.create(content_type=ContentType.objects.get_for_model(Category),
+            object_id=category.id, oerp_model='product.product',
+            oerp_id=self.oerp_ids[0])
+        self.fake.data['product.product'][self.oerp_ids[0]]['name_template'] = 'pulled'
+        sync = PullSync(page_size=10)
+        sync.mapping = dict(sync.mapping,
+            Category={'product.product': {'name_template': 'name'}})
+
+        stats = sync.run(['product.product'])
+
+        self.assertEqual(self.get_stock(), [0, 1, 2, 3, 4])
+        self.assertEqual(Category.objects.get(id=category.id).name, 'pulled')
+        self.assertEqual(stats.as_dict()['unmapped'], 0)
+
+    def test_pulled_changes_are_not_pushed_back(self):
+        PullSync(page_size=10).run(['product.product'])
+        self.fake.calls.clear()
+        sync = PullSync(page_size=10)
+        sync.reset(['product.product'])
+
+        stats = sync.run(['product.product']).as_dict()
+
+        self.assertEqual(self.get_stock(), [0, 1, 2, 3, 4])
+        self.assertEqual((stats['applied'], stats['unchanged']), (0, 5))
+        self.assertFalse(ObjMapper.objects.filter(is_dirty=True).exists())
+        self.assertEqual([method for model, method in self.fake.calls \
+            if method not in ('search', 'read')], [])
+
+    def test_reset(self):
+        sync = PullSync(page_size=2)
+        sync.run(['product.product'])
+        sync.reset(['product.product'])
+        self.assertFalse(PullWatermark.objects.filter(
+            oerp_model='product.product').exists())
@@ -0,0 +1,248 @@
+from oesync.tests.server import FakeServerTestCase
+from django.conf import settings
+from oesync.oerprpc import Oerp, OerpSyncFailed, OerpBatchFailed, pool, \
+    resolve_existence
+from oesync.metrics import Metric, metrics
+from oesync import loader
+import socket
+import threading
+
+
+
+class FakeOpenErpTest(FakeServerTestCase):
+
+    def test_search_evaluates_domains(self):
+        oerp = Oerp('product.product')
+        ids = [oerp.model.create({'name': name, 'active': name != 'c'}) \
+            for name in 'abc']
+
+        self.assertEqual(oerp.model.search([('id', 'in', ids[1:])]), ids[1:])
+        self.assertEqual(oerp.model.search(['|', ('name', '=', 'a'),
+            '!', ('active', '=', True)]), [ids[0], ids[2]])
+        self.assertEqual(oerp.model.search([('name', '>', 'a')], 0, 1), [ids[1]])
+
+    def test_load_binds_external_ids(self):
+        oerp = Oerp('product.product')
+        first = oerp.load(['id', 'name'], [['oesync.a', 'a'], ['oesync.b', 'b']])
+        second = oerp.load(['id', 'name'], [['oesync.a', 'changed']])
+
+        self.assertEqual(second['ids'], first['ids'][:1])
+        self.assertEqual(self.get_names('product.product'), ['b', 'changed'])
+
+    def test_injected_failures(self):
+        self.fake.fail_methods.add(('product.product', 'create'))
+        oerp = Oerp('product.product')
+
+        self.assertRaises(OerpSyncFailed, oerp.create, {'name': 'a'})
+        self.assertEqual(self.fake.calls[('product.product', 'create')], 1)
+        self.assertEqual(self.fake.data.get('product.product', {}), {})
+
+
+
+class ConnectionPoolTest(FakeServerTestCase):
+
+    def test_oerp_objects_share_the_connection(self):
+        logins = pool.stats.get('logins')
+        first, second = Oerp('product.product'), Oerp('product.product')
+        first.model.search([])
+        second.model.search([])
+
+        self.assertTrue(first.conn is second.conn)
+        self.assertTrue(first.model is second.model)
+        self.assertEqual(pool.stats.get('logins'), logins + 1)
+        connector = first.conn.connector
+        self.assertTrue(connector._get_proxy('object')[0] is \
+            connector._get_proxy('object')[0])
+
+    def test_threads_use_their_own_proxies(self):
+        connector = Oerp('product.product').conn.connector
+        proxies = []
+        thread = threading.Thread(
+            target=lambda: proxies.append(connector._get_proxy('object')[0]))
+        thread.start()
+        thread.join()
+
+        self.assertFalse(proxies[0] is connector._get_proxy('object')[0])
+
+    def test_forked_process_connects_again(self):
+        conn = pool.get_connection()
+        #as seen from a child process
+        pool._pid = -1
+
+        self.assertFalse(pool.get_connection() is conn)
+        self.assertTrue(pool.get_connection() is pool.get_connection())
+
+
+
+class ResolveExistenceTest(FakeServerTestCase):
+
+    def test_one_search_per_model(self):
+        products = Oerp('product.product').model
+        existing, deleted = [products.create({'name': name}) for name in 'ab']
+        products.unlink([deleted])
+        category = Oerp('product.category').model.create({'name': 'c'})
+
+        self.assertEqual(resolve_existence([
+            ('product.product', existing), ('product.product', deleted),
+            ('product.category', category), ('product.category', None)]), {
+            ('product.product', existing): True,
+            ('product.product', deleted): False,
+            ('product.category', category): True})
+        self.assertEqual(self.fake.calls[('product.product', 'search')], 1)
+        self.assertEqual(self.fake.calls[('product.product', 'exists')], 0)
+
+    def test_unchecked_pairs_are_left_out(self):
+        self.fake.fail_methods.add(('product.product', 'search'))
+        id = Oerp('product.category').model.create({'name': 'c'})
+
+        self.assertEqual(resolve_existence([('product.product', 1),
+            ('product.category', id)]), {('product.category', id): True})
+
+
+
+class BatchTest(FakeServerTestCase):
+
+    def test_create_many(self):
+        oerp = Oerp('product.product')
+        self.fake.bad_names.add('c')
+
+        ids = oerp.create_many([{'name': 'a'}, {'name': 'b'}])
+        try:
+            oerp.create_many([{'name': 'd'}, {'name': 'c'}, {'name': 'e'}])
+        except OerpBatchFailed as e:
+            done = e.done
+        else:
+            self.fail('OerpBatchFailed not raised')
+
+        self.assertEqual(self.get_names('product.product'), ['a', 'b', 'd'])
+        self.assertEqual(len(ids), 2)
+        self.assertEqual(len(done), 1)
+        self.assertEqual(self.fake.data['product.product'][done[0]]['name'], 'd')
+
+    def test_bulk_create_is_one_call(self):
+        settings.OPENERP_SETTINGS['BULK_CREATE'] = True
+        oerp = Oerp('product.product')
+        self.fake.bad_names.add('c')
+
+        ids = oerp.create_many([{'name': 'a'}, {'name': 'b'}])
+        try:
+            oerp.create_many([{'name': 'd'}, {'name': 'c'}])
+        except OerpBatchFailed as e:
+            self.assertEqual(e.done, [])
+        else:
+            self.fail('OerpBatchFailed not raised')
+
+        self.assertEqual(sorted(ids), sorted(self.fake.data['product.product']))
+        self.assertEqual(self.fake.calls[('oesync.sync', 'create_many')], 2)
+        self.assertEqual(self.fake.calls[('product.product', 'create')], 0)
+
+    def test_delete_many(self):
+        oerp = Oerp('product.product')
+        ids = oerp.create_many([{'name': name} for name in 'abc'])
+
+        oerp.delete_many(ids[:2])
+        self.fake.bad_ids.add(ids[2])
+
+        self.assertEqual(self.get_names('product.product'), ['c'])
+        self.assertEqual(self.fake.calls[('product.product', 'unlink')], 1)
+        self.assertRaises(OerpSyncFailed, oerp.delete_many, ids[2:])
+
+    def test_write_many_groups_identical_data(self):
+        oerp = Oerp('product.product')
+        ids = oerp.create_many([{'name': name} for name in 'abcd'])
+        self.fake.bad_ids.add(ids[3])
+
+        try:
+            oerp.write_many([(ids[0], {'name': 'x'}), (ids[1], {'name': 'y'}),
+                (ids[2], {'name': 'x'}), (ids[3], {'name': 'z'})])
+        except OerpBatchFailed as e:
+            self.assertEqual(e.done, [ids[0], ids[2], ids[1]])
+        else:
+            self.fail('OerpBatchFailed not raised')
+
+        self.assertEqual(self.get_names('product.product'), ['d', 'x', 'x', 'y'])
+        self.assertEqual(self.fake.calls[('product.product', 'write')], 3)
+
+
+
+class LoaderTest(FakeServerTestCase):
+
+    def test_rows(self):
+        types = {'name': 'char', 'active': 'boolean', 'list_price': 'float',
+                 'categ_id': 'many2one', 'tag_ids': 'many2many'}
+        self.fake.rpc_fields_get = lambda model, fields=None, context=None: \
+            dict((field, {'type': type}) for field, type in types.items())
+        loader._field_types.pop('product.template', None)
+
+        columns, rows = loader.to_rows(Oerp('product.template'), 'id', [
+            ('x.a', {'name': 'a', 'active': True, 'list_price': 2.3,
+                     'categ_id': 4, 'tag_ids': [(6, 0, [1, 2])]}),
+            ('x.b', {'name': False, 'active': False})])
+        loader._field_types.pop('product.template', None)
+
+        self.assertEqual(columns, ['id', 'active', 'categ_id/.id', 'list_price',
+                                   'name', 'tag_ids/.id'])
+        self.assertEqual(rows, [['x.a', '1', '4', '2.3', 'a', '1,2'],
+                                ['x.b', '0', '', '', '', '']])
+
+    def test_rejected_rows_are_dropped(self):
+        oerp = Oerp('product.category')
+        self.fake.bad_names.add('bad')
+
+        ids = loader.load(oerp, 'id', [('x.a', {'name': 'a'}),
+            ('x.bad', {'name': 'bad'}), ('x.c', {'name': 'c'})])
+
+        self.assertEqual(ids[1], None)
+        self.assertEqual(sorted(self.fake.data['product.category']),
+                         sorted([ids[0], ids[2]]))
+        self.assertEqual(self.fake.calls[('product.category', 'load')], 2)
+        self.assertEqual(loader.load(oerp, '.id', [(ids[0], {'name': 'b'})]), ids[:1])
+        self.assertEqual(self.get_names('product.category'), ['b', 'c'])
+
+
+
+class MetricsTest(FakeServerTestCase):
+
+    def setUp(self):
+        super(MetricsTest, self).setUp()
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+        super(MetricsTest, self).tearDown()
+
+    def test_calls_are_recorded_by_model_and_method(self):
+        oerp = Oerp('product.product')
+        oerp.create({'name': 'a'})
+        self.fake.fail_methods.add(('product.product', 'create'))
+        self.assertRaises(OerpSyncFailed, oerp.create, {'name': 'b'})
+
+        create = metrics.get('product.product', 'create')
+        self.assertEqual((create.count, create.errors), (2, 1))
+        self.assertTrue(create.sent > 0 and create.received > 0)
+        self.assertEqual(metrics.get('common', 'login').count, 1)
+        self.assertIn('product.product', metrics.report())
+
+    def test_percentile(self):
+        metric = Metric()
+        for seconds in (0.001, 0.002, 0.02, 20):
+            metric.observe(seconds)
+
+        self.assertEqual(metric.percentile(0.5), 5)
+        self.assertEqual(metric.percentile(0.75), 25)
+        self.assertEqual(metric.percentile(1), None)
+
+    def test_statsd(self):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(('127.0.0.1', 0))
+        receiver.settimeout(5)
+        settings.OPENERP_SETTINGS['METRICS_STATSD'] = '127.0.0.1:%s' % \
+            receiver.getsockname()[1]
+        try:
+            metrics.record('product.product', 'create', 0.0125, True, 10, 20)
+            lines = receiver.recv(4096).decode('ascii').split('\n')
+        finally:
+            receiver.close()
+
+        self.assertEqual(lines[0], 'oesync.product_product.create.time:12.500|ms')
+        self.assertIn('oesync.product_product.create.errors:1|c', lines)
@@ -0,0 +1,103 @@
+from django.conf import settings
+from oesync.oerprpc import pool
+from oesync.bench.server import FakeOpenErp, start_server
+import unittest
+import xmlrpclib
+import os
+
+if not settings.configured and not os.environ.get('DJANGO_SETTINGS_MODULE'):
+    #run without a Django project, see oesync/tests/__init__.py
+    settings.configure(OPENERP_SETTINGS={})
+
+
+
+class PickyOpenErp(FakeOpenErp):
+    '''
+    FakeOpenErp refusing to create records named like bad_names (a bulk
+    creation or load() fails as a whole) and to write or unlink bad_ids.
+    Creations are logged as (model, id, values).
+    '''
+    def reset(self):
+        FakeOpenErp.reset(self)
+        self.bad_names = set()
+        self.bad_ids = set()
+        self.created = []
+
+    def rpc_create(self, model, values, context=None):
+        if values.get('name') in self.bad_names:
+            raise xmlrpclib.Fault(1, 'Bad name %s' % values['name'])
+        id = FakeOpenErp.rpc_create(self, model, values, context)
+        self.created.append((model, id, values))
+        return id
+
+    def rpc_create_many(self, model, target, records, context=None):
+        for values in records:
+            if values.get('name') in self.bad_names:
+                raise xmlrpclib.Fault(1, 'Bad name %s' % values['name'])
+        ids = FakeOpenErp.rpc_create_many(self, model, target, records, context)
+        self.created.extend(zip([target] * len(ids), ids, records))
+        return ids
+
+    def rpc_load(self, model, fields, rows, context=None):
+        if 'name' in fields:
+            index = list(fields).index('name')
+            bad = [number for number, row in enumerate(rows) \
+                if row[index] in self.bad_names]
+            if bad:
+                return {'ids': False, 'messages': [{'type': 'error',
+                    'record': number, 'message': 'Bad name %s' % rows[number][index]} \
+                    for number in bad]}
+        return FakeOpenErp.rpc_load(self, model, fields, rows, context)
+
+    def rpc_write(self, model, ids, values, context=None):
+        self._check(ids)
+        return FakeOpenErp.rpc_write(self, model, ids, values, context)
+
+    def rpc_unlink(self, model, ids, context=None):
+        self._check(ids)
+        return FakeOpenErp.rpc_unlink(self, model, ids, context)
+
+    def _check(self, ids):
+        if not isinstance(ids, (list, tuple)):
+            ids = [ids]
+        bad = self.bad_ids.intersection(ids)
+        if bad:
+            raise xmlrpclib.Fault(1, 'Bad ids %s' % sorted(bad))
+
+
+
+class FakeServerTestCase(unittest.TestCase):
+    '''
+    Talks to a PickyOpenErp served in this process, in manual mode and
+    without external ids or load()
+    '''
+    def setUp(self):
+        self.fake = PickyOpenErp()
+        self.server = start_server(self.fake)
+        self.original_settings = dict(settings.OPENERP_SETTINGS)
+        host, port = self.server.server_address
+        settings.OPENERP_SETTINGS.update({
+            'HOST': host,
+            'PORT': port,
+            'PROTOCOL': 'xmlrpc',
+            'DB': 'test',
+            'USER': 'admin',
+            'PASSWORD': 'admin',
+            'MODE': 'manual',
+            'EXTERNAL_IDS': False,
+            'LOAD_MODELS': (),
+            'RETRY_DELAY': 60,
+            'RETRY_MAX_ATTEMPTS': 3,
+        })
+        pool.reset()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        settings.OPENERP_SETTINGS.clear()
+        settings.OPENERP_SETTINGS.update(self.original_settings)
+        pool.reset()
+
+    def get_names(self, oerp_model):
+        return sorted(values.get('name') \
+            for values in self.fake.data.get(oerp_model, {}).values())
@@ -0,0 +1,706 @@
+from django.test import TestCase
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+from oesync.tests.server import FakeServerTestCase
+from oesync.models import ObjMapper, DeletedObjMapper, SyncRun
+from oesync.listeners import syncnow, scheduler, _chunk_group, \
+    _stream_mappers, _windows
+from oesync.shards import ShardedSync, _run_shard
+from oesync.backfill import Backfill
+from oesync.cache import LocalBackend, id_cache
+from oesync.stats import Stats
+from oesync.signals import post_save_all
+from oesync.middleware import SaveCoalescerMiddleware
+from oesync.coalesce import SaveCoalescer
+from oesync.bench.fixtures import Fixtures
+from oesync import retry, history, profiling, leases
+from product.models import Product, Category
+from l10n.models import Country
+from datetime import timedelta
+import tempfile
+import shutil
+import os
+
+
+
+class FakeOpenErpTestCase(FakeServerTestCase, TestCase):
+    '''
+    Syncs satchmo objects with a PickyOpenErp served in this process
+    '''
+
+    def create_fixtures(self, categories=3, products=3):
+        return Fixtures(categories=categories, products=products,
+                        addresses=0, orders=0, prefix='test').create()
+
+    def get_mapper(self, obj):
+        return ObjMapper.objects.get(
+            content_type=ContentType.objects.get_for_model(obj),
+            object_id=obj.id,
+            parent=None)
+
+
+
+class WriteBatchTest(FakeOpenErpTestCase):
+
+    def test_create_falls_back_to_single_objects(self):
+        fixtures = self.create_fixtures()
+        bad = fixtures.products[1]
+        self.fake.bad_names.add(bad.name)
+
+        self.assertFalse(syncnow())
+
+        self.assertEqual(self.get_names('product.template'), sorted(
+            product.name for product in fixtures.products if product != bad))
+        mapper = self.get_mapper(bad)
+        self.assertTrue(mapper.is_dirty)
+        self.assertEqual(mapper.oerp_id, None)
+        self.assertEqual(mapper.attempts, 1)
+        self.assertTrue('Bad name' in mapper.last_error)
+        for product in fixtures.products:
+            if product != bad:
+                self.assertFalse(self.get_mapper(product).is_dirty)
+
+    def test_bulk_create(self):
+        settings.OPENERP_SETTINGS['BULK_CREATE'] = True
+        fixtures = self.create_fixtures(categories=1, products=3)
+        bad = fixtures.products[1]
+        self.fake.bad_names.add(bad.name)
+
+        self.assertFalse(syncnow())
+
+        self.assertEqual(self.get_names('product.template'), sorted(
+            product.name for product in fixtures.products if product != bad))
+        self.assertTrue(self.get_mapper(bad).is_dirty)
+        #the batch failed as a whole, the good records were created singly
+        self.assertEqual(self.fake.calls[('oesync.sync', 'create_many')], 3)
+        self.assertEqual(self.fake.calls[('product.template', 'create')], 3)
+        self.assertEqual(self.fake.calls[('product.product', 'create')], 0)
+
+    def test_child_mappers_are_created_once(self):
+        fixtures = self.create_fixtures(categories=1, products=3)
+        self.assertTrue(syncnow())
+        ObjMapper.objects.filter(parent=None).update(is_dirty=True)
+        self.assertTrue(syncnow())
+
+        for product in fixtures.products:
+            parent = self.get_mapper(product)
+            child = ObjMapper.objects.get(parent=parent)
+            self.assertEqual((child.oerp_model, child.object_id, child.is_root),
+                             ('product.product', product.id, None))
+            self.assertTrue(child.oerp_id)
+            self.assertFalse(child.is_dirty)
+
+    def test_existence_is_checked_in_bulk(self):
+        self.create_fixtures(categories=1, products=3)
+        self.assertTrue(syncnow())
+        ObjMapper.objects.filter(parent=None).update(is_dirty=True)
+        self.fake.calls.clear()
+
+        self.assertTrue(syncnow())
+
+        for model in ('product.category', 'product.template', 'product.product'):
+            self.assertEqual(self.fake.calls[(model, 'exists')], 0)
+            self.assertEqual(self.fake.calls[(model, 'search')], 1)
+
+    def test_unchanged_objects_are_not_written(self):
+        fixtures = self.create_fixtures(categories=1, products=3)
+        self.assertTrue(syncnow())
+        changed = fixtures.products[0]
+        Product.objects.filter(id=changed.id).update(name='changed')
+        ObjMapper.objects.update(is_dirty=True)
+        self.fake.calls.clear()
+
+        self.assertTrue(syncnow())
+
+        #name and name_template of the changed product only
+        self.assertEqual(self.fake.calls[('product.template', 'write')], 1)
+        self.assertEqual(self.fake.calls[('product.product', 'write')], 1)
+        self.assertEqual(self.fake.calls[('product.category', 'write')], 0)
+        self.assertIn('changed', self.get_names('product.template'))
+        self.assertFalse(ObjMapper.objects.filter(is_dirty=True).exists())
+
+    def test_update_falls_back_to_single_objects(self):
+        fixtures = self.create_fixtures()
+        self.assertTrue(syncnow())
+        bad = fixtures.products[1]
+        self.fake.bad_ids.add(self.get_mapper(bad).oerp_id)
+        for product in fixtures.products:
+            Product.objects.filter(id=product.id).update(name=product.name + '-new')
+        ObjMapper.objects.filter(parent=None).update(is_dirty=True)
+
+        self.assertFalse(syncnow())
+
+        self.assertEqual(self.get_names('product.template'), sorted(
+            product.name + (product != bad and '-new' or '') \
+            for product in fixtures.products))
+        mapper = self.get_mapper(bad)
+        self.assertTrue(mapper.is_dirty)
+        self.assertEqual(mapper.attempts, 1)
+        self.assertTrue('Update failed' in mapper.last_error)
+
+
+
+class ExternalIdTest(FakeOpenErpTestCase):
+
+    def test_references_are_resolved_by_external_id(self):
+        settings.OPENERP_SETTINGS['EXTERNAL_IDS'] = True
+        fixtures = self.create_fixtures(categories=1, products=2)
+
+        self.assertTrue(syncnow())
+
+        self.assertEqual(self.fake.calls[('product.template', 'create')], 0)
+        self.assertTrue(self.fake.calls[('oesync.sync', 'upsert')])
+        category_id = self.get_mapper(fixtures.categories[0]).oerp_id
+        for product in fixtures.products:
+            mapper = self.get_mapper(product)
+            self.assertEqual(self.fake.xmlids['satchmo.product_%s_product_template' % \
+                product.id], ('product.template', mapper.oerp_id))
+            self.assertEqual(self.fake.data['product.template'][mapper.oerp_id]['categ_id'],
+                             category_id)
+
+    def test_objects_synced_before_are_not_duplicated(self):
+        self.create_fixtures(categories=1, products=2)
+        self.assertTrue(syncnow())
+        names = self.get_names('product.template')
+        settings.OPENERP_SETTINGS['EXTERNAL_IDS'] = True
+        ObjMapper.objects.update(is_dirty=True, payload_hash=None)
+
+        self.assertTrue(syncnow())
+
+        self.assertEqual(self.get_names('product.template'), names)
+        self.assertEqual(len(self.fake.xmlids), ObjMapper.objects.count())
+
+
+
+class LoadTest(FakeOpenErpTestCase):
+
+    def test_categories_are_loaded(self):
+        settings.OPENERP_SETTINGS['LOAD_MODELS'] = ('product.category',)
+        categories = self.create_fixtures(categories=3, products=0).categories
+        bad = categories[2]
+        self.fake.bad_names.add(bad.name)
+
+        self.assertFalse(syncnow())
+
+        self.assertEqual(self.fake.calls[('product.category', 'create')], 0)
+        self.assertEqual(self.get_names('product.category'),
+            sorted(category.name for category in categories[:2]))
+        mapper = self.get_mapper(bad)
+        self.assertTrue(mapper.is_dirty)
+        self.assertEqual(mapper.last_error, 'Rejected by load()')
+        for category in categories[:2]:
+            mapper = self.get_mapper(category)
+            self.assertEqual(self.fake.xmlids['satchmo.category_%s_product_category' % \
+                category.id], ('product.category', mapper.oerp_id))
+
+
+
+class DeleteBatchTest(FakeOpenErpTestCase):
+
+    def test_one_unlink_per_model(self):
+        fixtures = self.create_fixtures(categories=1)
+        self.assertTrue(syncnow())
+        for product in fixtures.products:
+            product.delete()
+
+        self.assertTrue(syncnow())
+
+        self.assertEqual(self.fake.data['product.template'], {})
+        self.assertEqual(self.fake.calls[('product.template', 'unlink')], 1)
+        #deleted with their templates
+        self.assertEqual(self.fake.calls[('product.product', 'unlink')], 0)
+        self.assertEqual(DeletedObjMapper.objects.filter(
+            oerp_model='product.product', is_dirty=False).count(), 3)
+
+    def test_unlink_falls_back_to_single_objects(self):
+        fixtures = self.create_fixtures(categories=1)
+        self.assertTrue(syncnow())
+        bad = fixtures.products[1]
+        bad_id = self.get_mapper(bad).oerp_id
+        self.fake.bad_ids.add(bad_id)
+        for product in fixtures.products:
+            product.delete()
+        self.assertFalse(ObjMapper.objects.filter(
+            content_type=ContentType.objects.get_for_model(Product)).exists())
+
+        self.assertFalse(syncnow())
+
+        self.assertEqual(self.fake.data['product.template'].keys(), [bad_id])
+        mapper = DeletedObjMapper.objects.get(parent=None, is_dirty=True)
+        self.assertEqual(mapper.oerp_id, bad_id)
+        self.assertEqual(mapper.attempts, 1)
+        self.assertTrue('could not be deleted' in mapper.last_error)
+        self.assertEqual(DeletedObjMapper.objects.filter(
+            parent=None, is_dirty=False).count(), 2)
+
+
+
+class QueuedModeTest(FakeOpenErpTestCase):
+
+    def test_changes_wait_for_the_worker(self):
+        products = self.create_fixtures(categories=1, products=2).products
+        self.assertTrue(syncnow())
+        settings.OPENERP_SETTINGS['MODE'] = 'queued'
+        self.fake.calls.clear()
+
+        changed, deleted = products
+        changed.name = 'changed'
+        changed.save()
+        post_save_all.send(sender=Product, instance=changed, created=False)
+        deleted.delete()
+
+        self.assertEqual(sum(self.fake.calls.values()), 0)
+        self.assertTrue(self.get_mapper(changed).is_dirty)
+        self.assertTrue(DeletedObjMapper.objects.get(parent=None).is_dirty)
+
+        #what oesync_worker runs
+        self.assertTrue(syncnow())
+
+        self.assertEqual(self.get_names('product.template'), ['changed'])
+        self.assertFalse(self.get_mapper(changed).is_dirty)
+        self.assertFalse(DeletedObjMapper.objects.get(parent=None).is_dirty)
+
+
+
+class OrderFinalizeTest(FakeOpenErpTestCase):
+
+    def test_order_is_finalized_with_one_call(self):
+        Country.objects.create(iso2_code='CH', iso3_code='CHE', name='SWITZERLAND',
+                               printable_name='Switzerland', continent='EU')
+        order = Fixtures(categories=1, products=2, addresses=1, orders=1,
+                         prefix='test').create().orders[0]
+        settings.OPENERP_SETTINGS.update({
+            'FINALIZE_ENDPOINT': True,
+            'ACCOUNT_ID': 1,
+            'JOURNAL_ID': 1,
+            'COMPANY_ID': 1,
+            'CURRENCY_ID': 1,
+        })
+
+        #creates and then validates the paid order
+        self.assertTrue(syncnow())
+
+        self.assertEqual(self.fake.calls[('sale.order', 'oesync_finalize')], 1)
+        self.assertEqual(self.fake.calls[('sale.order', 'action_button_confirm')], 0)
+        mapper = ObjMapper.objects.get_for_object(order, 'sale.order')
+        self.assertFalse(mapper.is_dirty)
+        self.assertEqual(self.fake.data['sale.order'][mapper.oerp_id]['state'], 'manual')
+        payment = ObjMapper.objects.get(oerp_model='account.voucher')
+        self.assertEqual(self.fake.data['account.voucher'][payment.oerp_id]['amount'],
+                         float(order.total))
+
+
+
+class RetryTest(FakeOpenErpTestCase):
+
+    def setUp(self):
+        super(RetryTest, self).setUp()
+        content_type = ContentType.objects.get_for_model(Product)
+        self.mappers = [ObjMapper.objects.create(content_type=content_type,
+            object_id=id, oerp_model='product.template') for id in range(1, 4)]
+
+    def test_eligible(self):
+        now = timezone.now()
+        due, waiting, dead = self.mappers
+        ObjMapper.objects.filter(id=due.id).update(
+            attempts=1, next_attempt=now - timedelta(seconds=1))
+        ObjMapper.objects.filter(id=waiting.id).update(
+            attempts=1, next_attempt=now + timedelta(seconds=1))
+        ObjMapper.objects.filter(id=dead.id).update(
+            attempts=3, next_attempt=None)
+        never = ObjMapper.objects.create(content_type=due.content_type,
+            object_id=4, oerp_model='product.template')
+
+        self.assertEqual(
+            sorted(retry.eligible(ObjMapper.objects.all(), now).values_list('id', flat=True)),
+            [due.id, never.id])
+
+    def test_record_failures(self):
+        first, second, third = self.mappers
+        ObjMapper.objects.filter(id=second.id).update(attempts=2, is_dirty=False)
+
+        before = timezone.now()
+        retry.record_failures(ObjMapper, {first.id: 'boom', second.id: 'boom'})
+
+        first, second, third = [ObjMapper.objects.get(id=mapper.id) \
+            for mapper in self.mappers]
+        self.assertEqual((first.attempts, first.last_error), (1, 'boom'))
+        self.assertTrue(first.is_dirty)
+        self.assertTrue(before + timedelta(seconds=60) <= first.next_attempt)
+        self.assertTrue(first.next_attempt < before + timedelta(seconds=120))
+        #the third failure reaches RETRY_MAX_ATTEMPTS
+        self.assertEqual((second.attempts, second.next_attempt), (3, None))
+        self.assertTrue(second.is_dirty)
+        self.assertEqual((third.attempts, third.last_error), (0, ''))
+
+
+
+class SyncnowOrderTest(FakeOpenErpTestCase):
+
+    def test_referred_objects_are_created_first(self):
+        fixtures = self.create_fixtures(categories=6, products=4)
+
+        self.assertTrue(syncnow())
+
+        models = [model for model, id, values in self.fake.created]
+        self.assertEqual(models, sorted(models, key=[
+            'product.category', 'product.template', 'product.product'].index))
+        created = set()
+        for model, id, values in self.fake.created:
+            for field in ('parent_id', 'categ_id', 'product_tmpl_id'):
+                if values.get(field):
+                    self.assertTrue(values[field] in created,
+                        '%s %s refers to %s' % (model, field, values[field]))
+            created.add(id)
+
+    def test_objects_of_a_model_are_created_in_order(self):
+        fixtures = self.create_fixtures(categories=1, products=4)
+
+        self.assertTrue(syncnow())
+
+        self.assertEqual(
+            [values['name'] for model, id, values in self.fake.created \
+                if model == 'product.template'],
+            [product.name for product in fixtures.products])
+
+    def get_mappers(self, objects, actions):
+        mappers = [self.get_mapper(obj) for obj in objects]
+        for mapper, action in zip(mappers, actions):
+            mapper.sync_action = action
+        return mappers
+
+    def test_creations_are_staged_before_updates(self):
+        fixtures = self.create_fixtures(categories=1, products=2)
+        updated, created = self.get_mappers(fixtures.products, ('update', 'create'))
+
+        self.assertEqual(scheduler.get_stages([updated, created]),
+                         [[[created]], [[updated]]])
+
+    def test_self_referencing_objects_are_synced_in_order(self):
+        fixtures = self.create_fixtures(categories=4, products=0)
+        mappers = self.get_mappers(fixtures.categories,
+                                   ('update', 'update', 'create', 'create'))
+
+        self.assertEqual(scheduler.get_stages(mappers), [[mappers]])
+        self.assertEqual(_chunk_group(mappers, 50),
+            ([mappers[:2], mappers[2:3], mappers[3:]], False))
+
+
+
+class LeaseTest(FakeOpenErpTestCase):
+
+    def setUp(self):
+        super(LeaseTest, self).setUp()
+        self.products = self.create_fixtures(categories=1, products=2).products
+        self.assertTrue(syncnow())
+        self.leased, self.free = [self.get_mapper(product) for product in self.products]
+        ObjMapper.objects.filter(id__in=[self.leased.id, self.free.id]).update(
+            is_dirty=True)
+        ObjMapper.objects.filter(id=self.leased.id).update(lease_owner='shard',
+            lease_expires=timezone.now() + timedelta(seconds=60))
+
+    def test_syncnow_skips_leased_mappers(self):
+        self.assertTrue(syncnow())
+
+        self.assertTrue(ObjMapper.objects.get(id=self.leased.id).is_dirty)
+        self.assertFalse(ObjMapper.objects.get(id=self.free.id).is_dirty)
+
+    def test_live_save_leaves_leased_mapper_dirty(self):
+        settings.OPENERP_SETTINGS['MODE'] = 'live'
+        product = self.products[0]
+        product.name = 'changed'
+        product.save()
+        post_save_all.send(sender=Product, instance=product, created=False)
+
+        self.assertNotIn('changed', self.get_names('product.template'))
+        self.assertTrue(ObjMapper.objects.get(id=self.leased.id).is_dirty)
+
+    def test_shards_take_creations_by_creation_date(self):
+        product = self.create_fixtures(categories=1, products=1).products[0]
+        mapper = self.get_mapper(product)
+        cutoff = timezone.now()
+        #created before the run, modified since
+        ObjMapper.objects.filter(id=mapper.id).update(
+            date_modified=cutoff + timedelta(seconds=60))
+
+        pid, counts, recorded = _run_shard(('save', [mapper.content_type_id],
+            [], cutoff, 60, 50))
+
+        self.assertEqual(counts['claimed'], 2)
+        self.assertFalse(ObjMapper.objects.get(id=mapper.id).is_dirty)
+        self.assertEqual(leases.unleased(ObjMapper.objects.filter(
+            id__in=[mapper.id, self.free.id])).count(), 2)
+
+
+
+class ShardTest(TestCase):
+
+    def test_claims_are_disjoint(self):
+        content_type = ContentType.objects.get_for_model(Product)
+        mappers = [ObjMapper.objects.create(content_type=content_type,
+            object_id=id, oerp_model='product.template') for id in range(1, 6)]
+        ObjMapper.objects.filter(id=mappers[0].id).update(lease_owner='old',
+            lease_expires=timezone.now() - timedelta(seconds=1))
+
+        first = leases.claim(ObjMapper.objects.all(), 'first', 3, 60)
+        second = leases.claim(ObjMapper.objects.all(), 'second', 3, 60)
+
+        #the expired lease is taken over
+        self.assertEqual([mapper.id for mapper in first],
+                         [mapper.id for mapper in mappers[:3]])
+        self.assertEqual([mapper.id for mapper in second],
+                         [mapper.id for mapper in mappers[3:]])
+        self.assertEqual(leases.claim(ObjMapper.objects.all(), 'third', 3, 60), [])
+        self.assertTrue(leases.is_leased(first[0]))
+
+    def test_self_referencing_models_go_to_one_worker(self):
+        stages = ShardedSync(2).get_stages()
+        category = ContentType.objects.get_for_model(Category).id
+        product = ContentType.objects.get_for_model(Product).id
+
+        saves = [(shared, exclusive) for kind, shared, exclusive in stages \
+            if kind == 'save']
+        self.assertIn(category, sum([exclusive for shared, exclusive in saves], []))
+        self.assertIn(product, sum([shared for shared, exclusive in saves], []))
+        for kind, shared, exclusive in stages:
+            if kind == 'delete':
+                self.assertEqual(exclusive, [])
+
+
+
+class Interrupted(Exception):
+    pass
+
+
+
+class BackfillTest(FakeOpenErpTestCase):
+
+    def test_interrupted_backfill_resumes(self):
+        products = self.create_fixtures(categories=1, products=3).products
+        ObjMapper.objects.all().delete()
+        def interrupt(backfill, model, checkpoint):
+            if model is Product:
+                raise Interrupted()
+
+        self.assertRaises(Interrupted,
+            Backfill(chunk_size=2, progress=interrupt).run)
+        self.assertEqual(len(self.fake.data['product.template']), 2)
+        backfill = Backfill(chunk_size=2)
+        self.assertTrue(backfill.run())
+
+        self.assertEqual(self.get_names('product.template'),
+                         sorted(product.name for product in products))
+        self.assertEqual(backfill.stats.get('objects'), 1)
+        self.assertFalse(ObjMapper.objects.filter(is_dirty=True).exists())
+        self.assertEqual(backfill.remaining(Product, backfill.get_checkpoint(Product)), 0)
+
+    def test_orders_only_if_named(self):
+        names = [model.__name__ for model in Backfill().models]
+
+        self.assertIn('Product', names)
+        self.assertNotIn('Order', names)
+        self.assertEqual([model.__name__ for model in Backfill(['order']).models],
+                         ['Order'])
+
+
+
+class HistoryTest(FakeOpenErpTestCase):
+
+    def setUp(self):
+        super(HistoryTest, self).setUp()
+        self.fixtures = self.create_fixtures(categories=1, products=2)
+        self.assertTrue(syncnow())
+        settings.OPENERP_SETTINGS['MODE'] = 'live'
+
+    def test_live_save_is_not_recorded(self):
+        product = self.fixtures.products[0]
+        product.name = 'changed'
+        product.save()
+        post_save_all.send(sender=Product, instance=product, created=False)
+
+        self.assertIn('changed', self.get_names('product.template'))
+        self.assertFalse(SyncRun.objects.filter(trigger='live').exists())
+
+    def test_backfill_is_recorded(self):
+        settings.OPENERP_SETTINGS['MODE'] = 'manual'
+        ObjMapper.objects.all().delete()
+
+        self.assertTrue(Backfill(chunk_size=10).run())
+        run = SyncRun.objects.get(trigger='backfill')
+        self.assertTrue(run.result)
+        self.assertEqual(
+            sorted((batch.action, batch.object_count) for batch in run.batches.all()),
+            [('create', 1), ('create', 2)])
+
+    def test_profiled_run_within_a_recording(self):
+        settings.OPENERP_SETTINGS['MODE'] = 'manual'
+        ObjMapper.objects.filter(parent=None).update(is_dirty=True)
+        profile_dir = tempfile.mkdtemp()
+        try:
+            with history.recording('worker'):
+                res, run = profiling.profile(syncnow, trigger='profile',
+                                             profile_dir=profile_dir)
+            self.assertTrue(res)
+            self.assertEqual(SyncRun.objects.get(id=run.id).trigger, 'profile')
+            self.assertTrue(run.profile)
+            self.assertTrue(os.path.exists(run.profile_file))
+        finally:
+            shutil.rmtree(profile_dir)
+        #the outer run did not sync anything itself
+        self.assertFalse(SyncRun.objects.filter(trigger='worker').exists())
+
+
+
+class SaveCoalescerMiddlewareTest(FakeOpenErpTestCase):
+
+    def test_saves_are_synced_once_with_the_response(self):
+        product = self.create_fixtures(categories=1, products=1).products[0]
+        self.assertTrue(syncnow())
+        settings.OPENERP_SETTINGS['MODE'] = 'live'
+        middleware = SaveCoalescerMiddleware()
+
+        middleware.process_request(None)
+        for name in ('first', 'second', 'last'):
+            product.name = name
+            product.save()
+            post_save_all.send(sender=Product, instance=product, created=False)
+        self.assertEqual(self.get_names('product.template'), ['test-product-0'])
+        self.assertEqual(middleware.process_response(None, 'response'), 'response')
+
+        self.assertEqual(self.get_names('product.template'), ['last'])
+        self.assertEqual(self.fake.calls[('product.template', 'write')], 1)
+
+
+
+class SaveCoalescerTest(TestCase):
+
+    def test_nested_blocks_sync_each_object_once(self):
+        synced = []
+        coalescer = SaveCoalescer(synced.append)
+
+        with coalescer.collect():
+            self.assertTrue(coalescer.active())
+            coalescer.add('first', 1)
+            with coalescer.collect():
+                self.assertTrue(coalescer.add('second', 2))
+                self.assertFalse(coalescer.add('first', 3))
+            self.assertEqual(synced, [])
+
+        self.assertEqual(synced, [[1, 2]])
+        self.assertFalse(coalescer.active())
+
+    def test_disabled(self):
+        settings.OPENERP_SETTINGS['COALESCE'] = False
+        try:
+            with SaveCoalescer(None).collect() as coalescer:
+                self.assertFalse(coalescer.active())
+        finally:
+            del settings.OPENERP_SETTINGS['COALESCE']
+
+
+
+class StreamMappersTest(TestCase):
+
+    def test_pages_keep_the_timestamp_order(self):
+        content_type = ContentType.objects.get_for_model(Product)
+        mappers = [ObjMapper.objects.create(content_type=content_type,
+            object_id=id, oerp_model='product.template') for id in range(1, 7)]
+        now = timezone.now()
+        for seconds, group in ((2, mappers[3:5]), (1, mappers[:3]), (-1, mappers[5:])):
+            ObjMapper.objects.filter(id__in=[mapper.id for mapper in group]).update(
+                date_modified=now - timedelta(seconds=seconds))
+
+        streamed = list(_stream_mappers(ObjMapper.objects.all(), 'date_modified',
+                                        'update', now, 2))
+
+        #the mapper modified after the cutoff is left out
+        self.assertEqual([id for timestamp, rank, id, mapper in streamed],
+                         [mapper.id for mapper in mappers[3:5] + mappers[:3]])
+        self.assertEqual(set(mapper.sync_action for timestamp, rank, id, mapper \
+            in streamed), set(['update']))
+
+    def test_windows(self):
+        self.assertEqual(list(_windows(iter(range(5)), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(_windows([], 2)), [])
+
+
+
+class ObjMapperTest(TestCase):
+
+    def test_only_root_mappers_are_marked(self):
+        content_type = ContentType.objects.get_for_model(Product)
+        root = ObjMapper.objects.create(content_type=content_type,
+            object_id=1, oerp_model='product.template')
+        child = ObjMapper.objects.create(content_type=content_type,
+            object_id=1, oerp_model='product.product', parent=root)
+
+        self.assertEqual(ObjMapper.objects.get(id=root.id).is_root, True)
+        self.assertEqual(ObjMapper.objects.get(id=child.id).is_root, None)
+
+    def test_root_flag_follows_the_parent(self):
+        content_type = ContentType.objects.get_for_model(Product)
+        product = Product(id=1)
+        root = ObjMapper.objects.create(content_type=content_type,
+            object_id=product.id, oerp_model='product.template')
+        mapper = ObjMapper.objects.create(content_type=content_type,
+            object_id=product.id, oerp_model='product.product')
+
+        mapper.parent = root
+        mapper.save()
+
+        self.assertEqual(ObjMapper.objects.get(id=mapper.id).is_root, None)
+        self.assertEqual(ObjMapper.objects.get_for_object(
+            product, 'product.template').id, root.id)
+        self.assertEqual(ObjMapper.objects.get_for_object(
+            product, 'product.product', parent=root).id, mapper.id)
+
+
+
+class IdCacheTest(TestCase):
+
+    def test_local_backend_drops_old_entries(self):
+        stats = Stats('evictions')
+        backend = LocalBackend(2, stats)
+        backend.set_many({'a': 1, 'b': 2})
+        backend.get_many(['a'])
+        backend.set_many({'c': 3})
+
+        self.assertEqual(backend.get_many(['a', 'b', 'c']), {'a': 1, 'c': 3})
+        self.assertEqual(stats.get('evictions'), 1)
+        expired = LocalBackend(2, stats, timeout=-1)
+        expired.set_many({'a': 1})
+        self.assertEqual(expired.get_many(['a']), {})
+
+    def test_saved_and_deleted_mappers_drop_entries(self):
+        content_type = ContentType.objects.get_for_model(Product)
+        mapper = ObjMapper.objects.create(content_type=content_type,
+            object_id=1, oerp_model='product.template', oerp_id=5)
+        key = (content_type.id, 1, 'product.template')
+
+        with id_cache.isolated():
+            #unsynced objects are never cached
+            id_cache.set(key, None)
+            self.assertEqual(id_cache.get_many([key]), {})
+            id_cache.set(key, 5)
+            mapper.save()
+            self.assertEqual(id_cache.get_many([key]), {key: 5})
+            mapper.oerp_id = 6
+            mapper.save()
+            self.assertEqual(id_cache.get_many([key]), {})
+            id_cache.set(key, 6)
+            mapper.delete()
+            self.assertEqual(id_cache.get_many([key]), {})
+
+    def test_bulk_updates_drop_entries(self):
+        content_type = ContentType.objects.get_for_model(Product)
+        mapper = ObjMapper.objects.create(content_type=content_type,
+            object_id=1, oerp_model='product.template', oerp_id=5)
+        key = (content_type.id, 1, 'product.template')
+
+        with id_cache.isolated():
+            id_cache.set(key, 5)
+            ObjMapper.objects.filter(id=mapper.id).update(is_dirty=True)
+            self.assertEqual(id_cache.get_many([key]), {key: 5})
+            ObjMapper.objects.filter(id=mapper.id).update(oerp_id=6)
+            self.assertEqual(id_cache.get_many([key]), {})
@@ -0,0 +1,40 @@
+#########################################################################
+#This program is free software: you can redistribute it and/or modify   #
+#it under the terms of the GNU General Public License as published by   #
+#the Free Software Foundation, either version 3 of the License, or      #
+#(at your option) any later version.                                    #
+#                                                                       #
+#This program is distributed in the hope that it will be useful,        #
+#but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+#GNU General Public License for more details.                           #
+#                                                                       #
+#You should have received a copy of the GNU General Public License      #
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#########################################################################
+
+{
+    "name" : "Satchmo OESync Server",
+    "version" : "0.2",
+    "author" : "Jeame Media",
+    "website" : "http://www.jeame.com",
+    "category" : "Sales Management",
+    "depends" : ['sale', 'account_voucher'],
+    "description": """
+    Server side methods for the Satchmo OESync connector.
+
+    Adds sale.order.oesync_finalize, which confirms an order, validates its
+    invoice and registers the payments of the order in a single call (and a
+    single transaction).
+
+    Adds oesync.sync.upsert, which creates or updates batches of records
+    identified by external ids and resolves the external ids of related
+    records on the server.
+    """,
+    "init_xml": [],
+    "update_xml": [],
+    "installable": True,
+    "active": False,
+}
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
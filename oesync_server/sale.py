@@ -0,0 +1,94 @@
+#########################################################################
+#This program is free software: you can redistribute it and/or modify   #
+#it under the terms of the GNU General Public License as published by   #
+#the Free Software Foundation, either version 3 of the License, or      #
+#(at your option) any later version.                                    #
+#                                                                       #
+#This program is distributed in the hope that it will be useful,        #
+#but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+#GNU General Public License for more details.                           #
+#                                                                       #
+#You should have received a copy of the GNU General Public License      #
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#########################################################################
+from osv import osv
+from tools.translate import _
+
+class sale_order(osv.osv):
+    _inherit = "sale.order"
+
+    def oesync_finalize(self, cr, uid, ids, payments, context=None):
+        '''
+        Confirm an order, validate the resulting invoice and register the
+        given payments. Runs in a single transaction, i.e. nothing is
+        changed if one of the steps fails.
+
+        payments: list of dicts with the keys partner_id, account_id,
+        journal_id, period_id, amount, currency_id and company_id
+
+        Returns a dict with the invoice_id and the voucher_ids (in the
+        order of the payments).
+        '''
+        if context is None:
+            context = {}
+        if len(ids) != 1:
+            raise osv.except_osv(_('Error'), _('Only one order can be finalized at a time.'))
+
+        #confirm the order
+        self.action_button_confirm(cr, uid, ids, context=context)
+
+        #the last invoice has just been created
+        invoice_ids = self.read(cr, uid, ids[0], ['invoice_ids'], context=context)['invoice_ids']
+        if not invoice_ids:
+            raise osv.except_osv(_('Error'), _('No invoice was created for order %s.') % ids[0])
+        invoice_id = invoice_ids[-1]
+
+        #validate the invoice
+        ctx = dict(context, active_ids=[invoice_id])
+        self.pool.get('account.invoice.confirm').invoice_confirm(cr, uid, [], context=ctx)
+
+        voucher_ids = []
+        for payment in payments:
+            voucher_ids.append(self._oesync_add_payment(cr, uid, payment, context=context))
+
+        return {'invoice_id': invoice_id, 'voucher_ids': voucher_ids}
+
+    def _oesync_add_payment(self, cr, uid, payment, context=None):
+        ''' Create and validate a customer payment, return the voucher id '''
+        voucher_obj = self.pool.get('account.voucher')
+        res = voucher_obj.onchange_partner_id(cr, uid, [], payment['partner_id'],
+                    payment['journal_id'], 0.0, payment['currency_id'],
+                    ttype='receipt', date=False, context=context)
+        amount = payment['amount']
+        lines = res['value']['line_cr_ids']
+        if not lines:
+            lines = [{'type': 'cr', 'account_id': payment['account_id'], 'amount': amount}]
+        else:
+            # Assign the payment to the invoice with a matching amount,
+            # or to the oldest one if no amount matches
+            match_id = None
+            for i, line in enumerate(lines):
+                #remove readonly values
+                line.pop('date_original', None)
+                line.pop('date_due', None)
+                if line['amount_unreconciled'] == amount and match_id is None:
+                    match_id = i
+            if match_id is None: match_id = 0
+            lines[match_id]['amount'] = amount
+
+        vals = {
+            'account_id': payment['account_id'],
+            'amount': amount,
+            'company_id': payment['company_id'],
+            'journal_id': payment['journal_id'],
+            'partner_id': payment['partner_id'],
+            'period_id': payment['period_id'],
+            'type': 'receipt',
+            'line_cr_ids': [(0, 0, line) for line in lines],
+        }
+        voucher_id = voucher_obj.create(cr, uid, vals, context=context)
+        voucher_obj.button_proforma_voucher(cr, uid, [voucher_id], context=context)
+        return voucher_id
+
+sale_order()
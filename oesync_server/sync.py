@@ -0,0 +1,139 @@
+#########################################################################
+#This program is free software: you can redistribute it and/or modify   #
+#it under the terms of the GNU General Public License as published by   #
+#the Free Software Foundation, either version 3 of the License, or      #
+#(at your option) any later version.                                    #
+#                                                                       #
+#This program is distributed in the hope that it will be useful,        #
+#but WITHOUT ANY WARRANTY; without even the implied warranty of         #
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the          #
+#GNU General Public License for more details.                           #
+#                                                                       #
+#You should have received a copy of the GNU General Public License      #
+#along with this program.  If not, see <http://www.gnu.org/licenses/>.  #
+#########################################################################
+from osv import osv
+
+class oesync_sync(osv.AbstractModel):
+    _name = "oesync.sync"
+    _description = "Satchmo OESync"
+
+    def upsert(self, cr, uid, model, records, known_ids=None, context=None):
+        '''
+        Create or update records of a model, identified by external ids
+        (e.g. 'satchmo.product_42_product_template').
+
+        records: list of (external id, id, values) tuples. id is the
+        database id of the record if it was synced before (False
+        otherwise); records synced without external ids are bound to theirs
+        here instead of being created again. Values of fields ending with
+        '/id' are external ids of the objects the field refers to (a list
+        for many2many fields); they are resolved here.
+
+        known_ids: {external id: (model, id)} of referenced records that
+        may not be bound to their external ids yet. They are bound if they
+        still exist. Other unknown references are left empty.
+
+        A record with an id that does not exist anymore is not created,
+        since its values may only hold the changed fields; False is
+        returned for it, so that it can be sent again in full without id.
+
+        Returns the ids of the records, in the order given.
+        '''
+        model_obj = self.pool.get(model)
+        known_ids = known_ids or {}
+
+        xmlids = set()
+        for record in records:
+            xmlids.add(record[0])
+            for field, value in record[-1].items():
+                if field.endswith('/id') and value:
+                    xmlids.update(isinstance(value, list) and value or [value])
+        resolved = self._oesync_resolve(cr, uid, xmlids, context=context)
+        for xmlid in xmlids:
+            if xmlid not in resolved and xmlid in known_ids:
+                ref_model, ref_id = known_ids[xmlid]
+                if self.pool.get(ref_model).exists(cr, uid, ref_id):
+                    resolved[xmlid] = self._oesync_bind(cr, uid, xmlid,
+                        ref_model, ref_id, None, context=context)
+
+        ids = []
+        for record in records:
+            if len(record) == 2:
+                #sent by oesync versions without ids
+                xmlid, res_id, values = record[0], False, record[1]
+            else:
+                xmlid, res_id, values = record
+            vals = {}
+            for field, value in values.items():
+                if not field.endswith('/id'):
+                    vals[field] = value
+                elif isinstance(value, list):
+                    vals[field[:-3]] = [(6, 0, [resolved[x][2] for x in value if x in resolved])]
+                else:
+                    vals[field[:-3]] = value in resolved and resolved[value][2] or False
+
+            current = resolved.get(xmlid)
+            if current and current[1] == model and model_obj.exists(cr, uid, current[2]):
+                model_obj.write(cr, uid, [current[2]], vals, context=context)
+                res_id = current[2]
+            elif res_id and model_obj.exists(cr, uid, res_id):
+                #synced before without external id
+                model_obj.write(cr, uid, [res_id], vals, context=context)
+                resolved[xmlid] = self._oesync_bind(cr, uid, xmlid, model,
+                    res_id, current, context=context)
+            elif res_id:
+                #deleted in the meantime, vals may be incomplete
+                res_id = False
+            else:
+                res_id = model_obj.create(cr, uid, vals, context=context)
+                #later records of the batch may refer to this one
+                resolved[xmlid] = self._oesync_bind(cr, uid, xmlid, model,
+                    res_id, current, context=context)
+            ids.append(res_id)
+        return ids
+
+    def create_many(self, cr, uid, model, records, context=None):
+        '''
+        Create records of a model from a list of values, in one transaction.
+        Returns their ids, in the order given.
+        '''
+        model_obj = self.pool.get(model)
+        return [model_obj.create(cr, uid, values, context=context) \
+            for values in records]
+
+    def _oesync_bind(self, cr, uid, xmlid, model, res_id, current, context=None):
+        '''
+        Point an external id to a record, current being its resolved
+        (ir.model.data id, model, res_id) if it exists already. Returns the
+        new resolved tuple.
+        '''
+        imd_obj = self.pool.get('ir.model.data')
+        if current:
+            imd_obj.write(cr, uid, [current[0]], {'model': model, 'res_id': res_id}, context=context)
+            return (current[0], model, res_id)
+        module, name = xmlid.split('.', 1)
+        imd_id = imd_obj.create(cr, uid, {
+            'module': module,
+            'name': name,
+            'model': model,
+            'res_id': res_id,
+            'noupdate': True,
+        }, context=context)
+        return (imd_id, model, res_id)
+
+    def _oesync_resolve(self, cr, uid, xmlids, context=None):
+        ''' Return {external id: (ir.model.data id, model, res_id)} '''
+        imd_obj = self.pool.get('ir.model.data')
+        by_module = {}
+        for xmlid in xmlids:
+            module, name = xmlid.split('.', 1)
+            by_module.setdefault(module, []).append(name)
+        resolved = {}
+        for module, names in by_module.items():
+            imd_ids = imd_obj.search(cr, uid, [('module', '=', module), ('name', 'in', names)], context=context)
+            for data in imd_obj.read(cr, uid, imd_ids, ['name', 'model', 'res_id'], context=context):
+                resolved['%s.%s' % (module, data['name'])] = (data['id'], data['model'], data['res_id'])
+        return resolved
+
+oesync_sync()